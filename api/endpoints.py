@@ -3,24 +3,81 @@ import json
 import os
 from datetime import datetime
 
-import pandas as pd
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
 
-from config.settings import MODEL_PATH, RESULTS_DIR
-from predictor.aqua_predictor import AquaSentinelPredictor
-from utils.artifacts import ensure_artifacts, load_points
+from config.settings import (
+    FEATURE_STORE_BACKFILL,
+    FEATURE_STORE_ENABLED,
+    FEATURE_STORE_PATH,
+    GRID_LOOKUP,
+    GRID_MAX_RESPONSE_CELLS,
+    MICROBATCH_ENABLED,
+    MODEL_MMAP,
+    MODEL_PATH,
+    RESULTS_DIR,
+)
+from predictor.aqua_predictor import shared_predictor
+from predictor.micro_batcher import get_micro_batcher
+from utils.artifacts import ArtifactsNotReady, require_artifacts
+from utils.batch_scoring import BATCH_FORMATS, request_chunks, stream_scores
+from utils.feature_store import drivers_frame, shared_feature_store
+from utils.instrumentation import render_metrics
+from utils.jobs import get_job_store, job_status
+from utils.points_store import get_points_store
+from utils.prediction_cache import get_prediction_cache
+from utils.risk_cube import BANDS, feature_store_version, get_risk_cube
+from utils.storage import export_csv as export_points_csv, read_table
+from visualization.tiles import valid_tile
 
 api = Blueprint("api", __name__)
 
-_PREDICTOR = None
+
+def get_predictor():
+    # The process-wide predictor, shared by the API and the web pages.
+    # Raises ArtifactsNotReady until the model has been built.
+    require_artifacts()
+    return shared_predictor(
+        MODEL_PATH,
+        feature_store=get_feature_store(),
+        mmap_mode="r" if MODEL_MMAP else None,
+    )
+
+
+def get_scoring_predictor():
+    # For single-point requests. Under a threaded server, concurrent requests
+    # are micro-batched into one model call; a sync worker serves one request
+    # at a time, so there it would only add the batching window.
+    predictor = get_predictor()
+    if MICROBATCH_ENABLED and request.environ.get("wsgi.multithread"):
+        return get_micro_batcher().wrap(predictor)
+    return predictor
+
+
+def lookup_grid(predictor, lat, lon, date):
+    # The precomputed risk grid's answer when the point and date fall inside
+    # it and it was built with the current model and observed drivers; None
+    # otherwise.
+    if GRID_LOOKUP == "off":
+        return None
+    cube = get_risk_cube()
+    if cube is None or cube.model_version != predictor.version:
+        return None
+    if cube.feature_store_version != feature_store_version(predictor.feature_store):
+        return None
+    return cube.lookup(lat, lon, date, GRID_LOOKUP)
 
 
-def _get_predictor():
-    global _PREDICTOR
-    ensure_artifacts()
-    if _PREDICTOR is None:
-        _PREDICTOR = AquaSentinelPredictor(MODEL_PATH)
-    return _PREDICTOR
+def get_feature_store():
+    if not FEATURE_STORE_ENABLED:
+        return None
+    return shared_feature_store(FEATURE_STORE_PATH, backfill=FEATURE_STORE_BACKFILL)
+
+
+@api.errorhandler(ArtifactsNotReady)
+def artifacts_not_ready(exc):
+    response = jsonify({"error": str(exc)})
+    response.headers["Retry-After"] = "10"
+    return response, 503
 
 
 @api.route("/health", methods=["GET"])
@@ -37,10 +94,18 @@ def score():
     if lat is None or lon is None:
         return jsonify({"error": "lat and lon are required"}), 400
 
-    predictor = _get_predictor()
-    score_val, lower, upper = predictor.predict_with_interval(
-        float(lat), float(lon), date
-    )
+    try:
+        predictor = get_scoring_predictor()
+        source = "grid"
+        value = lookup_grid(predictor, float(lat), float(lon), date)
+        if value is None:
+            source = "model"
+            value = get_prediction_cache().predict_with_interval(
+                predictor, float(lat), float(lon), date
+            )
+    except ValueError:
+        return jsonify({"error": "lat and lon must be numbers and date YYYY-MM-DD"}), 400
+    score_val, lower, upper = value
     return jsonify({
         "lat": lat,
         "lon": lon,
@@ -48,57 +113,228 @@ def score():
         "score": score_val,
         "interval_lower": lower,
         "interval_upper": upper,
+        "source": source,
+    })
+
+
+@api.route("/drivers", methods=["POST"])
+def ingest_drivers():
+    # Observed drivers for the online feature store; later scores in those
+    # cells use them in their window features instead of backfilled values.
+    feature_store = get_feature_store()
+    if feature_store is None:
+        return jsonify({"error": "the feature store is disabled"}), 404
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get("records")
+    try:
+        frame = drivers_frame(payload)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    stored = feature_store.ingest(frame)
+    return jsonify({
+        "received": len(frame),
+        "stored": stored,
+        "cells": len(feature_store),
+        "version": feature_store.version,
     })
 
 
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    # Prometheus text format; histograms are per process, so scrape each
+    # worker (or run one) when comparing runs.
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@api.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(get_prediction_cache().stats())
+
+
+def _batch_format():
+    # CSV by default, NDJSON with ?format=ndjson or an NDJSON Accept header.
+    fmt = request.args.get("format")
+    if fmt is None:
+        fmt = "ndjson" if "ndjson" in request.headers.get("Accept", "") else "csv"
+    return fmt
+
+
 @api.route("/score/batch", methods=["POST"])
 def score_batch():
-    predictor = _get_predictor()
+    # Streams scores back chunk by chunk.
+    fmt = _batch_format()
+    if fmt not in BATCH_FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(BATCH_FORMATS)}"}), 400
 
-    if "file" in request.files:
-        file = request.files["file"]
-        df = pd.read_csv(file)
-    else:
-        payload = request.get_json(silent=True) or []
-        df = pd.DataFrame(payload)
+    chunks = request_chunks(
+        request.content_type or "",
+        request.files,
+        request.stream,
+        lambda: request.get_json(silent=True),
+    )
+    try:
+        body = stream_scores(get_predictor(), chunks, fmt)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
 
-    if df.empty or not {"lat", "lon"}.issubset(df.columns):
-        return jsonify({"error": "Provide lat/lon columns or JSON list."}), 400
+    headers = {}
+    if fmt == "csv":
+        headers["Content-Disposition"] = "attachment; filename=batch_scores.csv"
+    return Response(stream_with_context(body), mimetype=BATCH_FORMATS[fmt], headers=headers)
 
-    if "date" not in df.columns:
-        df["date"] = datetime.utcnow().strftime("%Y-%m-%d")
 
-    results = df.apply(
-        lambda row: predictor.predict_with_interval(row["lat"], row["lon"], row["date"]),
-        axis=1,
-    )
-    df["score"], df["interval_lower"], df["interval_upper"] = zip(*results)
+def _job_body(job):
+    body = job_status(job)
+    body["status_url"] = f"/api/jobs/{job['id']}"
+    body["result_url"] = f"/api/jobs/{job['id']}/result"
+    return body
+
+
+@api.route("/jobs/score", methods=["POST"])
+def submit_score_job():
+    # Same input as /score/batch; the job is queued for the job workers and
+    # its id returned right away.
+    try:
+        job = get_job_store().submit(
+            request.content_type or "",
+            request.files,
+            request.stream,
+            lambda: request.get_json(silent=True),
+            output_format=_batch_format(),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    body = _job_body(job)
+    return jsonify(body), 202, {"Location": body["status_url"]}
+
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def job(job_id):
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(_job_body(job))
 
-    output = io.StringIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
 
+@api.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    store = get_job_store()
+    job = store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    if job["status"] != "done":
+        return jsonify(_job_body(job)), 409
+    fmt = job["output_format"]
     return send_file(
-        io.BytesIO(output.getvalue().encode("utf-8")),
-        mimetype="text/csv",
+        store.output_path(job),
+        mimetype=BATCH_FORMATS[fmt],
         as_attachment=True,
-        download_name="batch_scores.csv",
+        download_name=f"batch_scores_{job_id}.{fmt}",
     )
 
 
+def _parse_bbox(value):
+    # lat_min,lat_max,lon_min,lon_max
+    parts = [float(part) for part in value.split(",")]
+    if len(parts) != 4 or parts[0] > parts[1] or parts[2] > parts[3]:
+        raise ValueError("bbox")
+    return tuple(parts)
+
+
+def _spatial_query(args):
+    # bbox=lat_min,lat_max,lon_min,lon_max, or lat/lon with radius_km and/or k.
+    spatial = {}
+    if args.get("bbox"):
+        spatial["bbox"] = _parse_bbox(args["bbox"])
+    lat = args.get("lat", type=float)
+    lon = args.get("lon", type=float)
+    radius_km = args.get("radius_km", type=float)
+    k = args.get("k", type=int)
+    if radius_km is not None or k is not None:
+        if lat is None or lon is None or (k is not None and k <= 0) or (radius_km is not None and radius_km <= 0):
+            raise ValueError("center")
+        spatial["center"] = (lat, lon)
+        spatial["radius_km"] = radius_km
+        spatial["k"] = k
+    return spatial
+
+
 @api.route("/points", methods=["GET"])
 def points():
     limit = request.args.get("limit", type=int)
     start_date = request.args.get("start")
     end_date = request.args.get("end")
-    df = load_points(limit=limit, start_date=start_date, end_date=end_date)
-    return jsonify(df.to_dict(orient="records"))
+    try:
+        spatial = _spatial_query(request.args)
+    except ValueError:
+        return jsonify({
+            "error": "bbox must be lat_min,lat_max,lon_min,lon_max; radius_km and k need lat and lon"
+        }), 400
+    try:
+        body = get_points_store().iter_json(start_date, end_date, limit, **spatial)
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    return Response(stream_with_context(body), mimetype="application/json")
+
+
+@api.route("/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def tiles(z, x, y):
+    if not valid_tile(z, x, y):
+        return jsonify({"error": "tile out of range"}), 400
+    try:
+        body = get_points_store().tile_json(
+            z, x, y, request.args.get("start"), request.args.get("end")
+        )
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    return Response(body, mimetype="application/json")
+
+
+@api.route("/grid", methods=["GET"])
+def grid():
+    # Slices of the precomputed risk grid: ?date= or ?start=&end=, optional
+    # bbox, bands (comma separated) and stride to subsample cells.
+    cube = get_risk_cube()
+    if cube is None:
+        return jsonify({"error": "risk grid not built; run python -m utils.risk_cube"}), 404
+    date = request.args.get("date")
+    bands = request.args.get("bands", "score").split(",")
+    stride = request.args.get("stride", 1, type=int)
+    if not set(bands).issubset(BANDS) or stride < 1:
+        return jsonify({"error": f"bands must be among {BANDS} and stride at least 1"}), 400
+    try:
+        bbox = _parse_bbox(request.args["bbox"]) if request.args.get("bbox") else None
+        days, rows, cols = cube.select(
+            request.args.get("start", date), request.args.get("end", date), bbox, stride
+        )
+    except ValueError:
+        return jsonify({
+            "error": f"dates must be YYYY-MM-DD within {cube.start} + {cube.days} days; "
+            "bbox must be lat_min,lat_max,lon_min,lon_max"
+        }), 400
+    cells = len(days) * len(rows) * len(cols) * len(bands)
+    if cells > GRID_MAX_RESPONSE_CELLS:
+        return jsonify({
+            "error": f"{cells} values requested, limit {GRID_MAX_RESPONSE_CELLS}; "
+            "narrow the dates or bbox, or raise stride"
+        }), 400
+    if len(rows) == 0 or len(cols) == 0:
+        return jsonify({"error": "bbox does not overlap the grid"}), 400
+    return Response(cube.slice_json(days, rows, cols, bands), mimetype="application/json")
 
 
 @api.route("/export/csv", methods=["GET"])
 def export_csv():
-    points_path = ensure_artifacts()
-    return send_file(points_path, mimetype="text/csv", as_attachment=True)
+    points_path = require_artifacts()
+    output = export_points_csv(points_path, io.BytesIO())
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype="text/csv",
+        as_attachment=True,
+        download_name="risk_scored_points.csv",
+    )
 
 
 @api.route("/export/pdf", methods=["GET"])
@@ -108,8 +344,8 @@ def export_pdf():
     matplotlib.use("Agg")
     import matplotlib.pyplot as plt
 
-    points_path = ensure_artifacts()
-    df = pd.read_csv(points_path)
+    points_path = require_artifacts()
+    df = read_table(points_path, columns=["risk_score"])
     report_path = os.path.join(RESULTS_DIR, "model_report.json")
     try:
         with open(report_path, "r", encoding="utf-8") as handle:
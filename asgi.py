@@ -0,0 +1,332 @@
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+
+from config.settings import (
+    ASGI_EXECUTOR_WORKERS,
+    ASGI_WSGI_WORKERS,
+    MICROBATCH_MAX_SIZE,
+    MICROBATCH_WINDOW_MS,
+)
+from api.endpoints import get_predictor, lookup_grid
+from predictor.micro_batcher import predict_items
+from utils.artifacts import ArtifactsNotReady
+from utils.batch_scoring import SPOOL_MAX_BYTES
+from utils.instrumentation import observe_request
+from utils.jobs import start_job_workers
+from utils.prediction_cache import get_prediction_cache
+from webapp import create_app
+
+
+_STREAM_QUEUE_SIZE = 8
+
+
+class AsyncMicroBatcher:
+    # Single-point scores requested within ``window`` seconds of each other
+    # (or until ``max_size`` are waiting) go to the model as one
+    # predict_batch call in the executor; each caller awaits its own row.
+    def __init__(self, executor, window=MICROBATCH_WINDOW_MS / 1000.0, max_size=MICROBATCH_MAX_SIZE):
+        self.executor = executor
+        self.window = window
+        self.max_size = max_size
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.requests = 0
+
+    async def score(self, predictor, lat, lon, date):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((predictor, lat, lon, date, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        groups = {}
+        for item in pending:
+            groups.setdefault(id(item[0]), []).append(item)
+        loop = asyncio.get_running_loop()
+        for items in groups.values():
+            self.batches += 1
+            self.requests += len(items)
+            task = loop.run_in_executor(self.executor, _predict_items, items)
+            task.add_done_callback(lambda done, items=items: _resolve(items, done))
+
+
+def _predict_items(items):
+    # Falls back to scoring row by row when the batch call fails, so a bad
+    # row only fails its own request.
+    return predict_items(items[0][0], [item[1:4] for item in items])
+
+
+def _resolve(items, done):
+    futures = [item[4] for item in items]
+    results = done.exception() or done.result()
+    for pos, future in enumerate(futures):
+        if future.done():
+            continue
+        result = results if isinstance(results, Exception) else results[pos]
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
+def _lookup(lat, lon, date):
+    predictor = get_predictor()
+    return predictor, lookup_grid(predictor, lat, lon, date)
+
+
+class _ReceiveStream(io.RawIOBase):
+    # wsgi.input for the Flask routes: read on the WSGI thread, it pulls the
+    # next ASGI body message from the event loop only when the app asks for
+    # more, so a streamed upload is scored as it arrives and at most one
+    # message is held in memory. Reads return what has arrived rather than
+    # waiting to fill the buffer.
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._message = memoryview(b"")
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        while not self._message and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                raise OSError("client disconnected before the request body was complete")
+            self._message = memoryview(message.get("body", b""))
+            self._more = message.get("more_body", False)
+        return self._message
+
+    def peek(self, size=0):
+        # Lets readline() find the newline without reading byte by byte.
+        return self._fill().tobytes()
+
+    def readinto(self, buffer):
+        message = self._fill()
+        size = min(len(buffer), len(message))
+        buffer[:size] = message[:size]
+        self._message = message[size:]
+        return size
+
+
+async def _read_body(receive):
+    # The whole body, for the routes served on the event loop.
+    body = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    more = True
+    while more:
+        message = await receive()
+        body.write(message.get("body", b""))
+        more = message.get("more_body", False)
+    body.seek(0)
+    return body
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # The body ends where the client's does (Content-Length or the last
+        # chunk), so Flask may read a chunked upload without a length.
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _json_response(status, payload):
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8") + b"\n"
+    return status, [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())], body
+
+
+class AsgiApp:
+    # ASGI entry point. POST /api/score and /api/health are served on the
+    # event loop, with inference micro-batched in a bounded thread pool;
+    # every other route runs through the Flask app in a pool of its own, so
+    # long streamed responses cannot starve scoring.
+    def __init__(self, wsgi_app, workers=ASGI_EXECUTOR_WORKERS, wsgi_workers=ASGI_WSGI_WORKERS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asgi")
+        self.wsgi_executor = ThreadPoolExecutor(
+            max_workers=wsgi_workers, thread_name_prefix="asgi-wsgi"
+        )
+        self.batcher = AsyncMicroBatcher(self.executor)
+        self.routes = {
+            ("POST", "/api/score"): self._score,
+            ("GET", "/api/health"): self._health,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        route = self.routes.get((scope["method"], scope["path"]))
+        if route is None:
+            await self._call_wsgi(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status, headers, payload = await route(await _read_body(receive))
+        observe_request(scope["method"], scope["path"], status, time.perf_counter() - started)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # A no-op in UvicornWorker processes forked from a gunicorn
+                # master that already started the pool (when_ready).
+                start_job_workers()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _health(self, body):
+        return _json_response(200, {"status": "ok"})
+
+    async def _score(self, body):
+        # Same contract as the Flask /api/score, including the prediction cache.
+        try:
+            payload = json.loads(body.read() or b"{}")
+        except ValueError:
+            payload = {}
+        if not isinstance(payload, dict):
+            payload = {}
+        lat = payload.get("lat")
+        lon = payload.get("lon")
+        date = payload.get("date", datetime.utcnow().strftime("%Y-%m-%d"))
+        if lat is None or lon is None:
+            return _json_response(400, {"error": "lat and lon are required"})
+
+        cache = get_prediction_cache()
+        loop = asyncio.get_running_loop()
+        try:
+            # Loading or reloading the predictor and the grid touches disk:
+            # off the event loop.
+            predictor, value = await loop.run_in_executor(
+                self.executor, _lookup, float(lat), float(lon), date
+            )
+            source = "grid"
+            if value is None:
+                source = "model"
+                key = cache.key(predictor, float(lat), float(lon), date)
+                value = cache.get(key)
+                if value is None:
+                    value = await self.batcher.score(predictor, float(lat), float(lon), date)
+                    cache.put(key, value)
+        except (TypeError, ValueError):
+            return _json_response(400, {"error": "lat and lon must be numbers and date YYYY-MM-DD"})
+        except ArtifactsNotReady as exc:
+            status, headers, payload = _json_response(503, {"error": str(exc)})
+            return status, headers + [(b"retry-after", b"10")], payload
+        score_val, lower, upper = value
+        return _json_response(200, {
+            "lat": lat,
+            "lon": lon,
+            "date": date,
+            "score": score_val,
+            "interval_lower": lower,
+            "interval_upper": upper,
+            "source": source,
+        })
+
+    async def _call_wsgi(self, scope, receive, send):
+        # The Flask app runs, and its body is iterated, on one pool thread
+        # (streamed responses keep their request context there); it reads the
+        # request body as it arrives, and response chunks come back through a
+        # bounded queue.
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=_STREAM_QUEUE_SIZE)
+        body = _ReceiveStream(receive, loop)
+        environ = _environ(scope, body)
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        def run():
+            def start_response(status, headers, exc_info=None):
+                put(("start", int(status.split(" ", 1)[0]), headers))
+
+            try:
+                iterable = self.wsgi_app(environ, start_response)
+                try:
+                    for chunk in iterable:
+                        if chunk:
+                            put(("body", chunk))
+                finally:
+                    if hasattr(iterable, "close"):
+                        iterable.close()
+            finally:
+                put(None)
+                body.close()
+
+        task = loop.run_in_executor(self.wsgi_executor, run)
+        disconnected = False
+        while True:
+            message = await queue.get()
+            if message is None:
+                break
+            if disconnected:
+                continue
+            try:
+                if message[0] == "start":
+                    headers = [
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in message[2]
+                    ]
+                    await send({"type": "http.response.start", "status": message[1], "headers": headers})
+                else:
+                    await send({"type": "http.response.body", "body": message[1], "more_body": True})
+            except OSError:
+                # Client went away; keep draining so the worker thread exits.
+                disconnected = True
+        await task
+        if not disconnected:
+            await send({"type": "http.response.body", "body": b""})
+
+
+app = AsgiApp(create_app())
@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+# Project modules are imported inside the benchmarks: RESULTS_DIR has to
+# point at the scratch directory before config.settings is first imported,
+# so runs never touch (or depend on) the real model, points or feature store.
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_THRESHOLD = 0.15
+SINGLE_CALLS_MAX = 2_000
+
+
+def _dataset(size):
+    from data.synthetic_data import generate_synthetic_dataset
+
+    return generate_synthetic_dataset(
+        n_samples=size, n_locations=max(60, size // 50), columnar=True
+    )
+
+
+def _training_xy(size):
+    from utils.feature_engineer import build_feature_frame
+
+    features, feature_cols = build_feature_frame(_dataset(size))
+    return features[feature_cols], features["risk_score"]
+
+
+def _predictor():
+    from config.settings import MODEL_PATH
+    from predictor.aqua_predictor import AquaSentinelPredictor
+    from utils.artifacts import ensure_artifacts
+
+    ensure_artifacts()
+    return AquaSentinelPredictor(MODEL_PATH)
+
+
+def _client():
+    from utils.artifacts import ensure_artifacts
+    from webapp import create_app
+
+    ensure_artifacts()
+    return create_app().test_client()
+
+
+def _query_points(size):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(-10.0, 10.0, size)
+    lons = rng.uniform(20.0, 50.0, size)
+    days = np.datetime64("2023-01-01") + rng.integers(0, 365, size)
+    return lats, lons, np.datetime_as_string(days, unit="D")
+
+
+# Each benchmark is (setup(size) -> state, run(state, repeat_index), largest
+# size it is run at). Only ``run`` is timed.
+
+def _setup_generate(size):
+    return size
+
+
+def _run_generate(size, _):
+    _dataset(size)
+
+
+def _setup_features(size):
+    return _dataset(size)
+
+
+def _run_features(df, _):
+    from utils.feature_engineer import build_feature_frame
+
+    build_feature_frame(df)
+
+
+def _setup_cross_validate(size):
+    from models.model_train import _candidate_models
+
+    X, y = _training_xy(size)
+    return _candidate_models(), X, y
+
+
+def _run_cross_validate(state, _):
+    from models.model_train import _cross_validate
+
+    models, X, y = state
+    _cross_validate(models, X, y, folds=3)
+
+
+def _setup_train(size):
+    from config.settings import RESULTS_DIR
+
+    return _dataset(size), os.path.join(RESULTS_DIR, "bench_model.joblib")
+
+
+def _run_train(state, _):
+    from models.model_train import train_model
+
+    df, path = state
+    train_model(df, path)
+
+
+def _setup_predict_single(size):
+    calls = min(size, SINGLE_CALLS_MAX)
+    return _predictor(), _query_points(calls)
+
+
+def _run_predict_single(state, _):
+    predictor, (lats, lons, dates) = state
+    for lat, lon, date in zip(lats.tolist(), lons.tolist(), dates.tolist()):
+        predictor.predict_with_interval(lat, lon, date)
+
+
+def _setup_predict_batch(size):
+    return _predictor(), _query_points(size)
+
+
+def _run_predict_batch(state, _):
+    predictor, (lats, lons, dates) = state
+    predictor.predict_batch(lats, lons, dates)
+
+
+def _setup_api_points(size):
+    import numpy as np
+    import pandas as pd
+
+    from utils.storage import artifact_path, write_table
+
+    client = _client()
+    lats, lons, dates = _query_points(size)
+    scores = np.random.default_rng(1).uniform(0.0, 100.0, size)
+    write_table(
+        pd.DataFrame({
+            "lat": lats,
+            "lon": lons,
+            "date": pd.to_datetime(dates),
+            "risk_score": scores,
+            "interval_lower": scores - 10.0,
+            "interval_upper": scores + 10.0,
+        }),
+        artifact_path("risk_scored_points"),
+    )
+    client.get("/api/points?limit=1")
+    return client, size
+
+
+def _run_api_points(state, repeat_index):
+    # A different limit per repeat so the response cache never answers.
+    client, size = state
+    response = client.get(f"/api/points?limit={size - repeat_index}")
+    assert response.status_code == 200
+    b"".join(response.response)
+
+
+def _setup_api_score_batch(size):
+    import pandas as pd
+
+    lats, lons, dates = _query_points(size)
+    body = pd.DataFrame({"lat": lats, "lon": lons, "date": dates}).to_csv(index=False)
+    return _client(), body.encode("utf-8")
+
+
+def _run_api_score_batch(state, _):
+    client, body = state
+    response = client.post("/api/score/batch", data=body, content_type="text/csv")
+    assert response.status_code == 200
+    b"".join(response.response)
+
+
+def _setup_risk_map(size):
+    import numpy as np
+    import pandas as pd
+
+    lats, lons, _ = _query_points(size)
+    frame = pd.DataFrame({
+        "lat": lats,
+        "lon": lons,
+        "risk_score": np.random.default_rng(2).uniform(0.0, 100.0, size),
+    })
+    from config.settings import RESULTS_DIR
+
+    return frame, os.path.join(RESULTS_DIR, "bench_risk_map.html")
+
+
+def _run_risk_map(state, _):
+    from visualization.risk_mapper import generate_risk_map
+
+    frame, path = state
+    generate_risk_map(frame, path)
+
+
+BENCHMARKS = {
+    "generate_synthetic_dataset": (_setup_generate, _run_generate, None),
+    "build_feature_frame": (_setup_features, _run_features, None),
+    "cross_validate": (_setup_cross_validate, _run_cross_validate, 100_000),
+    "train_model": (_setup_train, _run_train, 100_000),
+    "predict_single": (_setup_predict_single, _run_predict_single, None),
+    "predict_batch": (_setup_predict_batch, _run_predict_batch, None),
+    "api_points": (_setup_api_points, _run_api_points, None),
+    "api_score_batch": (_setup_api_score_batch, _run_api_score_batch, None),
+    "generate_risk_map": (_setup_risk_map, _run_risk_map, None),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(names, sizes, repeat, output, verbose=True):
+    import numpy as np
+    import pandas as pd
+
+    results = []
+    for name in names:
+        setup, body, max_size = BENCHMARKS[name]
+        for size in sizes:
+            entry = {"name": name, "size": size}
+            if max_size is not None and size > max_size:
+                entry["skipped"] = f"runs up to {max_size} rows"
+                results.append(entry)
+                continue
+            state = setup(size)
+            times = []
+            for repeat_index in range(repeat):
+                start = time.perf_counter()
+                body(state, repeat_index)
+                times.append(time.perf_counter() - start)
+            rows = min(size, SINGLE_CALLS_MAX) if name == "predict_single" else size
+            entry.update({
+                "rows": rows,
+                "times": [round(value, 6) for value in times],
+                "seconds_min": round(min(times), 6),
+                "seconds_median": round(statistics.median(times), 6),
+                "rows_per_second": round(rows / min(times), 1),
+            })
+            results.append(entry)
+            if verbose:
+                print(
+                    f"{name:<28} size={size:>9} min={entry['seconds_min']:10.4f}s "
+                    f"median={entry['seconds_median']:10.4f}s rows/s={entry['rows_per_second']:>12.1f}"
+                )
+
+    report = {
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    if verbose:
+        print(f"Saved benchmark results: {output}")
+    return report
+
+
+def compare(baseline, candidate, threshold=DEFAULT_THRESHOLD):
+    # Rows of (name, size, baseline s, candidate s, ratio, flag) on the best
+    # (minimum) time, which is the least sensitive to background noise.
+    def index(report):
+        return {
+            (entry["name"], entry["size"]): entry
+            for entry in report["results"]
+            if "seconds_min" in entry
+        }
+
+    base = index(baseline)
+    rows = []
+    for key, entry in index(candidate).items():
+        if key not in base:
+            continue
+        before = base[key]["seconds_min"]
+        after = entry["seconds_min"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1.0 + threshold:
+            flag = "REGRESSION"
+        elif ratio < 1.0 - threshold:
+            flag = "faster"
+        rows.append((key[0], key[1], before, after, ratio, flag))
+    return rows
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks for data, features, training and serving")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and save the timings as JSON.")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        help="Run only these benchmarks.",
+    )
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.add_argument(
+        "--scratch-dir",
+        help="RESULTS_DIR for the run (model, points, stores); a temporary directory by default.",
+    )
+
+    compare_parser = commands.add_parser(
+        "compare", help="Compare two result files; exits 1 when anything regressed."
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Relative slowdown that counts as a regression (0.15 = 15%%).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    if args.command == "compare":
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        with open(args.candidate, "r", encoding="utf-8") as handle:
+            candidate = json.load(handle)
+        rows = compare(baseline, candidate, args.threshold)
+        for name, size, before, after, ratio, flag in rows:
+            print(f"{name:<28} size={size:>9} {before:10.4f}s -> {after:10.4f}s x{ratio:6.2f} {flag}")
+        regressions = [row for row in rows if row[5] == "REGRESSION"]
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%} in {len(rows)} comparisons")
+        sys.exit(1 if regressions else 0)
+
+    scratch_dir = args.scratch_dir or tempfile.mkdtemp(prefix="bench_results_")
+    os.makedirs(scratch_dir, exist_ok=True)
+    os.environ["RESULTS_DIR"] = scratch_dir
+    os.environ.setdefault("JOB_WORKERS", "0")
+    if "config.settings" in sys.modules:
+        raise RuntimeError("config.settings was imported before RESULTS_DIR was set")
+    try:
+        run(args.only or list(BENCHMARKS), args.sizes, args.repeat, args.output)
+    finally:
+        if not args.scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 import os
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-RESULTS_DIR = os.path.join(BASE_DIR, "results")
+RESULTS_DIR = os.getenv("RESULTS_DIR", os.path.join(BASE_DIR, "results"))
 MODEL_PATH = os.path.join(RESULTS_DIR, "risk_model.joblib")
+FEATURE_STORE_PATH = os.path.join(RESULTS_DIR, "feature_store.npz")
 RANDOM_SEED = 42
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "parquet")
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", "1"))
+MODEL_SELECTION = os.getenv("MODEL_SELECTION", "full")
+MODEL_MMAP = os.getenv("MODEL_MMAP", "true").lower() == "true"
+# Build missing model/points in a background process when the web app
+# starts; otherwise run `python -m utils.artifacts` before serving.
+ARTIFACTS_AUTO_BUILD = os.getenv("ARTIFACTS_AUTO_BUILD", "true").lower() == "true"
+# Content-addressed stage outputs (utils/pipeline.py); the last
+# PIPELINE_KEEP builds of each stage are kept for reuse.
+PIPELINE_DIR = os.path.join(RESULTS_DIR, "pipeline")
+PIPELINE_KEEP = int(os.getenv("PIPELINE_KEEP", "3"))
 
 DEFAULT_BBOX = {
     "lat_min": -10.0,
@@ -22,5 +34,47 @@ POWER_USE_DATASET_BBOX = True
 POWER_GRID_SIZE = 4
 POWER_START_DATE = "2022-01-01"
 POWER_END_DATE = "2022-01-31"
+POWER_CACHE_DIR = os.path.join(RESULTS_DIR, "power_tiles")
+POWER_MAX_WORKERS = 8
+POWER_RETRIES = 3
+USE_NASA_POWER = os.getenv("USE_NASA_POWER", "false").lower() == "true"
 
 GEE_MOCK_ENABLED = True
+
+FEATURE_STORE_ENABLED = True
+FEATURE_STORE_BACKFILL = True
+# About 1.5 KB per 0.1 degree cell; the least recently used cells go first.
+FEATURE_STORE_MAX_CELLS = int(os.getenv("FEATURE_STORE_MAX_CELLS", "100000"))
+# How often each worker merges its store with the saved file.
+FEATURE_STORE_SYNC_SECONDS = float(os.getenv("FEATURE_STORE_SYNC_SECONDS", "60"))
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "900"))
+PREDICTION_CACHE_DECIMALS = 4
+
+BATCH_CHUNK_ROWS = 5000
+
+JOBS_DB_PATH = os.path.join(RESULTS_DIR, "jobs.sqlite")
+JOBS_DIR = os.path.join(RESULTS_DIR, "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_SECONDS = 1.0
+JOB_STALE_SECONDS = 60
+JOB_NICE = 10
+
+ASGI_EXECUTOR_WORKERS = int(os.getenv("ASGI_EXECUTOR_WORKERS", str(os.cpu_count() or 1)))
+# Threads running the Flask app for every other route; a streamed response
+# holds one for its whole duration.
+ASGI_WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "8"))
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "true").lower() == "true"
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "2"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "256"))
+
+GRID_CUBE_DIR = os.path.join(RESULTS_DIR, "risk_cube")
+GRID_RESOLUTION_DEG = float(os.getenv("GRID_RESOLUTION_DEG", "0.25"))
+GRID_START_DATE = os.getenv("GRID_START_DATE", "2024-01-01")
+GRID_DAYS = int(os.getenv("GRID_DAYS", "31"))
+# How /api/score reads the cube: "nearest", "bilinear", or "off".
+GRID_LOOKUP = os.getenv("GRID_LOOKUP", "nearest")
+GRID_MAX_RESPONSE_CELLS = 250000
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
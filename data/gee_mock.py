@@ -2,6 +2,8 @@ import hashlib
 import math
 from datetime import datetime
 
+import numpy as np
+
 
 DEFAULT_MOCK_BBOX = {
     "lat_min": -10.0,
@@ -40,3 +42,40 @@ def mock_flood_extent(lat, lon, date, bbox=None):
     base = 0.2 + 0.5 * (1 - lat_norm) + 0.2 * lon_norm
     value = base + 0.3 * seasonal
     return max(0.0, min(1.0, value))
+
+
+def _batch_inputs(lats, lons, dates, bbox):
+    if bbox is None:
+        bbox = DEFAULT_MOCK_BBOX
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    days = np.asarray(dates, dtype="datetime64[D]")
+    yday = (days - days.astype("datetime64[Y]")).astype(int) + 1
+    lat_norm = (lats - bbox["lat_min"]) / (bbox["lat_max"] - bbox["lat_min"])
+    lon_norm = (lons - bbox["lon_min"]) / (bbox["lon_max"] - bbox["lon_min"])
+    return lats, lons, days, yday, lat_norm, lon_norm
+
+
+def mock_chlorophyll_batch(lats, lons, dates, bbox=None):
+    lats, lons, days, yday, lat_norm, lon_norm = _batch_inputs(lats, lons, dates, bbox)
+    seeds = np.fromiter(
+        (
+            _seed(lat, lon, date_str)
+            for lat, lon, date_str in zip(lats.tolist(), lons.tolist(), days.astype(str).tolist())
+        ),
+        dtype=np.int64,
+        count=len(lats),
+    )
+    season_table = np.array([math.sin(2 * math.pi * (day / 365.0)) for day in range(367)])
+    base = 0.4 + 0.6 * lat_norm + 0.2 * lon_norm
+    noise = ((seeds % 1000) / 1000.0 - 0.5) * 0.15
+    value = base + 0.3 * season_table[yday] + noise
+    return np.clip(value, 0.05, 2.5)
+
+
+def mock_flood_extent_batch(lats, lons, dates, bbox=None):
+    lats, lons, days, yday, lat_norm, lon_norm = _batch_inputs(lats, lons, dates, bbox)
+    season_table = np.array([math.cos(2 * math.pi * (day / 365.0)) for day in range(367)])
+    base = 0.2 + 0.5 * (1 - lat_norm) + 0.2 * lon_norm
+    value = base + 0.3 * season_table[yday]
+    return np.clip(value, 0.0, 1.0)
@@ -1,16 +1,37 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.error import HTTPError, URLError
 from urllib.parse import urlencode
 
 import numpy as np
 import pandas as pd
 
+from utils.instrumentation import timed
+from utils.storage import read_table, storage_format, write_table
 
-POWER_BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
 
+POWER_BASE_URL = os.getenv(
+    "POWER_BASE_URL", "https://power.larc.nasa.gov/api/temporal/daily/point"
+)
+DEFAULT_PARAMETERS = ["T2M", "PRECTOT"]
+_COLUMN_NAMES = {"t2m": "air_temp", "prectot": "precip"}
+_RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def build_power_url(lat, lon, start_date, end_date, parameters=None):
+
+def _power_date(value):
+    if isinstance(value, str) and len(value) == 8 and value.isdigit():
+        return value
+    return pd.Timestamp(value).strftime("%Y%m%d")
+
+
+def build_power_url(lat, lon, start_date, end_date, parameters=None, base_url=None):
     if parameters is None:
-        parameters = ["T2M", "PRECTOT"]
+        parameters = DEFAULT_PARAMETERS
+    if base_url is None:
+        base_url = POWER_BASE_URL
 
     if isinstance(start_date, datetime):
         start_date = start_date.strftime("%Y%m%d")
@@ -20,26 +41,33 @@ def build_power_url(lat, lon, start_date, end_date, parameters=None):
     query = {
         "latitude": f"{lat:.4f}",
         "longitude": f"{lon:.4f}",
-        "start": start_date,
-        "end": end_date,
+        "start": _power_date(start_date),
+        "end": _power_date(end_date),
         "community": "AG",
         "parameters": ",".join(parameters),
         "format": "JSON",
     }
-    return f"{POWER_BASE_URL}?{urlencode(query)}"
+    return f"{base_url}?{urlencode(query)}"
 
 
-def fetch_power_data(lat, lon, start_date, end_date, allow_network=False):
-    if not allow_network:
-        raise RuntimeError("Network access disabled. Pass allow_network=True to fetch.")
-
-    import json
+@timed("nasa_power.request")
+def _request_json(url, retries=3, backoff=0.5, timeout=30):
     from urllib.request import urlopen
 
-    url = build_power_url(lat, lon, start_date, end_date)
-    with urlopen(url) as response:
-        payload = json.loads(response.read().decode("utf-8"))
+    for attempt in range(retries + 1):
+        try:
+            with urlopen(url, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except HTTPError as exc:
+            if exc.code not in _RETRY_STATUS or attempt == retries:
+                raise
+        except (URLError, TimeoutError, ConnectionError):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * (2 ** attempt))
+
 
+def _parse_power_payload(payload):
     records = payload["properties"]["parameter"]
     dates = list(records[next(iter(records))].keys())
     data = {"date": dates}
@@ -48,10 +76,110 @@ def fetch_power_data(lat, lon, start_date, end_date, allow_network=False):
 
     frame = pd.DataFrame(data)
     frame["date"] = pd.to_datetime(frame["date"], format="%Y%m%d")
-    frame = frame.rename(columns={"t2m": "air_temp", "prectot": "precip"})
     return frame
 
 
+def fetch_power_data(
+    lat,
+    lon,
+    start_date,
+    end_date,
+    allow_network=False,
+    parameters=None,
+    base_url=None,
+    retries=3,
+    backoff=0.5,
+    timeout=30,
+):
+    if not allow_network:
+        raise RuntimeError("Network access disabled. Pass allow_network=True to fetch.")
+
+    url = build_power_url(lat, lon, start_date, end_date, parameters, base_url)
+    payload = _request_json(url, retries=retries, backoff=backoff, timeout=timeout)
+    return _parse_power_payload(payload).rename(columns=_COLUMN_NAMES)
+
+
+class PowerTileCache:
+    # One file per (lat, lon, parameter) holding every day fetched so far, so
+    # overlapping date ranges only download the days not yet on disk.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _tile_path(self, lat, lon, parameter):
+        name = f"{lat:.4f}_{lon:.4f}_{parameter.upper()}.{storage_format()}"
+        return os.path.join(self.cache_dir, name)
+
+    def read(self, lat, lon, parameter):
+        path = self._tile_path(lat, lon, parameter)
+        if not os.path.exists(path):
+            return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="date"))
+        return read_table(path).set_index("date")["value"]
+
+    def write(self, lat, lon, parameter, series):
+        merged = pd.concat([self.read(lat, lon, parameter), series])
+        merged = merged[~merged.index.duplicated(keep="last")]
+        frame = merged.rename("value").rename_axis("date").reset_index()
+        write_table(frame, self._tile_path(lat, lon, parameter))
+
+    def missing_ranges(self, lat, lon, parameters, start_date, end_date):
+        wanted = pd.date_range(start_date, end_date, freq="D")
+        missing = np.zeros(len(wanted), dtype=bool)
+        for parameter in parameters:
+            missing |= ~wanted.isin(self.read(lat, lon, parameter).index)
+
+        ranges = []
+        run_start = None
+        for day, is_missing in zip(wanted, missing):
+            if is_missing and run_start is None:
+                run_start = day
+            elif not is_missing and run_start is not None:
+                ranges.append((run_start, day - pd.Timedelta(days=1)))
+                run_start = None
+        if run_start is not None:
+            ranges.append((run_start, wanted[-1]))
+        return ranges
+
+    def load(self, lat, lon, parameters, start_date, end_date):
+        wanted = pd.date_range(start_date, end_date, freq="D", name="date")
+        frame = pd.DataFrame(index=wanted)
+        for parameter in parameters:
+            frame[_COLUMN_NAMES.get(parameter.lower(), parameter.lower())] = (
+                self.read(lat, lon, parameter).reindex(wanted)
+            )
+        return frame.reset_index()
+
+
+def fetch_power_point(
+    lat,
+    lon,
+    start_date,
+    end_date,
+    cache=None,
+    allow_network=False,
+    parameters=None,
+    **request_kwargs,
+):
+    if parameters is None:
+        parameters = DEFAULT_PARAMETERS
+    if cache is None:
+        return fetch_power_data(
+            lat, lon, start_date, end_date, allow_network, parameters, **request_kwargs
+        )
+
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    for range_start, range_end in cache.missing_ranges(lat, lon, parameters, start, end):
+        frame = fetch_power_data(
+            lat, lon, range_start, range_end, allow_network, parameters, **request_kwargs
+        ).set_index("date")
+        for parameter in parameters:
+            column = _COLUMN_NAMES.get(parameter.lower(), parameter.lower())
+            if column in frame:
+                cache.write(lat, lon, parameter, frame[column])
+    return cache.load(lat, lon, parameters, start, end)
+
+
 def load_or_fetch_power_data(
     lat,
     lon,
@@ -83,6 +211,7 @@ def _build_grid(bbox, grid_size):
     return [(float(lat), float(lon)) for lat in lat_vals for lon in lon_vals]
 
 
+@timed("nasa_power.fetch_grid")
 def fetch_power_grid(
     bbox,
     start_date,
@@ -90,32 +219,40 @@ def fetch_power_grid(
     grid_size=4,
     allow_network=False,
     verbose=True,
+    max_workers=8,
+    cache_dir=None,
+    parameters=None,
+    **request_kwargs,
 ):
-    rows = []
     grid_points = _build_grid(bbox, grid_size)
-    iterator = grid_points
-    if verbose:
-        try:
-            from tqdm import tqdm
-
-            iterator = tqdm(grid_points, desc="NASA POWER fetch")
-        except ImportError:
-            iterator = grid_points
+    cache = PowerTileCache(cache_dir) if cache_dir else None
 
-    total = len(grid_points)
-    for idx, (lat, lon) in enumerate(iterator, start=1):
-        if verbose and iterator is grid_points:
-            print(f"NASA POWER fetch {idx}/{total} at {lat:.2f}, {lon:.2f}")
-        frame = fetch_power_data(
-            lat=lat,
-            lon=lon,
-            start_date=start_date,
-            end_date=end_date,
+    def fetch(point):
+        lat, lon = point
+        frame = fetch_power_point(
+            lat,
+            lon,
+            start_date,
+            end_date,
+            cache=cache,
             allow_network=allow_network,
+            parameters=parameters,
+            **request_kwargs,
         )
         frame["lat"] = lat
         frame["lon"] = lon
-        rows.append(frame)
+        return frame
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        iterator = executor.map(fetch, grid_points)
+        if verbose:
+            try:
+                from tqdm import tqdm
+
+                iterator = tqdm(iterator, total=len(grid_points), desc="NASA POWER fetch")
+            except ImportError:
+                print(f"NASA POWER fetch of {len(grid_points)} points, {max_workers} workers")
+        rows = list(iterator)
 
     if not rows:
         return pd.DataFrame(columns=["date", "air_temp", "precip", "lat", "lon"])
@@ -124,6 +261,16 @@ def fetch_power_grid(
     return combined
 
 
+def _grid_cache_key(bbox, start_date, end_date, grid_size, parameters):
+    return {
+        "bbox": {key: float(bbox[key]) for key in sorted(bbox)},
+        "start_date": _power_date(start_date),
+        "end_date": _power_date(end_date),
+        "grid_size": int(grid_size),
+        "parameters": list(parameters or DEFAULT_PARAMETERS),
+    }
+
+
 def load_or_fetch_power_grid(
     bbox,
     start_date,
@@ -132,11 +279,20 @@ def load_or_fetch_power_grid(
     cache_path,
     allow_network=False,
     verbose=True,
+    cache_dir=None,
+    max_workers=8,
+    parameters=None,
+    **request_kwargs,
 ):
-    if cache_path and pd.io.common.file_exists(cache_path):
-        frame = pd.read_csv(cache_path, parse_dates=["date"])
-        frame["date"] = pd.to_datetime(frame["date"]).dt.date
-        return frame
+    key = _grid_cache_key(bbox, start_date, end_date, grid_size, parameters)
+    meta_path = f"{cache_path}.meta.json" if cache_path else None
+    if cache_path and pd.io.common.file_exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as handle:
+            cached_key = json.load(handle)
+        if cached_key == key:
+            frame = read_table(cache_path)
+            frame["date"] = frame["date"].dt.date
+            return frame
 
     frame = fetch_power_grid(
         bbox=bbox,
@@ -145,7 +301,14 @@ def load_or_fetch_power_grid(
         grid_size=grid_size,
         allow_network=allow_network,
         verbose=verbose,
+        max_workers=max_workers,
+        cache_dir=cache_dir,
+        parameters=parameters,
+        **request_kwargs,
     )
+    frame = frame.sort_values("date", kind="stable").reset_index(drop=True)
     if cache_path:
-        frame.to_csv(cache_path, index=False)
+        write_table(frame, cache_path)
+        with open(meta_path, "w", encoding="utf-8") as handle:
+            json.dump(key, handle, indent=2)
     return frame
@@ -4,8 +4,17 @@ import numpy as np
 import pandas as pd
 
 from config.settings import DEFAULT_BBOX, RANDOM_SEED
-from data.gee_mock import mock_chlorophyll, mock_flood_extent
-from utils.data_simulator import simulate_features
+from data.gee_mock import (
+    mock_chlorophyll,
+    mock_chlorophyll_batch,
+    mock_flood_extent,
+    mock_flood_extent_batch,
+)
+from utils.data_simulator import simulate_features, simulate_features_batch
+from utils.instrumentation import timed
+
+
+COLUMNAR_CHUNK_SIZE = 250_000
 
 
 def _random_date(rng, start_date, end_date):
@@ -60,6 +69,140 @@ def _apply_power_overlay(lat, lon, date_obj, features, power_lookup):
             features["sst"] = float(row["air_temp"])
 
 
+def _risk_score_batch(features, noise):
+    heatwave = (features["sst"] > 28).astype(float)
+    flood = features["flood_inundation"]
+    low_water_access = np.maximum(0, (75 - features["water_access_pct"]) / 30)
+    sanitation_risk = np.maximum(0, (70 - features["sanitation_score"]) / 40)
+    mobility = features["mobility_index"]
+    clinic = features["clinic_reports"]
+
+    raw = (
+        0.25 * heatwave
+        + 0.3 * flood
+        + 0.2 * low_water_access
+        + 0.15 * sanitation_risk
+        + 0.1 * mobility
+        + 0.1 * clinic
+    )
+    return np.clip((raw + noise) * 100, 0, 100)
+
+
+def _apply_power_overlay_batch(lats, lons, days, features, power_lookup):
+    if not power_lookup:
+        return
+
+    for date_key, frame in power_lookup.items():
+        mask = days == np.datetime64(date_key, "D")
+        if frame.empty or not mask.any():
+            continue
+
+        if "lat" in frame and "lon" in frame:
+            points = frame[["lat", "lon"]].to_numpy()
+            distances = np.sqrt(
+                (points[None, :, 0] - lats[mask, None]) ** 2
+                + (points[None, :, 1] - lons[mask, None]) ** 2
+            )
+            weights = 1.0 / (distances + 1e-3)
+            for source, target in (("precip", "precip"), ("air_temp", "sst")):
+                if source in frame:
+                    values = frame[source].to_numpy(dtype=float)
+                    features[target][mask] = (weights @ values) / weights.sum(axis=1)
+        else:
+            row = frame.iloc[0]
+            if "precip" in row:
+                features["precip"][mask] = float(row["precip"])
+            if "air_temp" in row:
+                features["sst"][mask] = float(row["air_temp"])
+
+
+def _power_lookup(power_df):
+    if power_df is None or power_df.empty:
+        return None
+    frame = power_df.copy()
+    frame["date"] = pd.to_datetime(frame["date"]).dt.date
+    return {date: group for date, group in frame.groupby("date")}
+
+
+def iter_synthetic_chunks(
+    n_samples=1000,
+    start_date="2021-01-01",
+    end_date="2023-12-31",
+    bbox=None,
+    seed=RANDOM_SEED,
+    power_df=None,
+    use_gee_mock=False,
+    gee_bbox=None,
+    n_locations=60,
+    samples_per_location=None,
+    chunk_size=COLUMNAR_CHUNK_SIZE,
+):
+    # Locations match the row-wise generator for the same seed. Dates and noise
+    # use independent streams, so rows do not depend on chunk_size.
+    if bbox is None:
+        bbox = DEFAULT_BBOX
+
+    locations = np.random.RandomState(seed).uniform(
+        [bbox["lat_min"], bbox["lon_min"]],
+        [bbox["lat_max"], bbox["lon_max"]],
+        size=(n_locations, 2),
+    )
+    if samples_per_location is not None:
+        total_samples = n_locations * samples_per_location
+    else:
+        total_samples = n_samples
+
+    start = np.datetime64(start_date, "D")
+    n_days = max(int((np.datetime64(end_date, "D") - start).astype(int)), 1)
+    power_lookup = _power_lookup(power_df)
+    location_seq, date_seq, noise_seq = np.random.SeedSequence(seed).spawn(3)
+    location_rng = np.random.default_rng(location_seq)
+    date_rng = np.random.default_rng(date_seq)
+    noise_rng = np.random.default_rng(noise_seq)
+
+    def key_features(keys):
+        loc_idx, offsets = np.divmod(keys, n_days)
+        lats = locations[loc_idx, 0]
+        lons = locations[loc_idx, 1]
+        days = start + offsets
+        features = simulate_features_batch(lats, lons, days)
+        if use_gee_mock:
+            features["chlor_a"] = mock_chlorophyll_batch(lats, lons, days, bbox=gee_bbox)
+            features["flood_inundation"] = mock_flood_extent_batch(
+                lats, lons, days, bbox=gee_bbox
+            )
+        _apply_power_overlay_batch(lats, lons, days, features, power_lookup)
+        return features
+
+    for chunk_start in range(0, total_samples, chunk_size):
+        size = min(chunk_size, total_samples - chunk_start)
+        loc_idx = location_rng.integers(0, n_locations, size=size)
+        offsets = date_rng.integers(0, n_days, size=size)
+        keys = loc_idx.astype(np.int64) * n_days + offsets
+
+        # Features are simulated once per distinct (location, day) in the
+        # chunk; nothing is kept across chunks, so memory is bounded by
+        # chunk_size whatever the total.
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        features = {
+            name: values[inverse]
+            for name, values in key_features(unique_keys).items()
+        }
+
+        risk_score = _risk_score_batch(features, noise_rng.normal(0, 0.05, size=size))
+        yield pd.DataFrame(
+            {
+                "lat": locations[loc_idx, 0],
+                "lon": locations[loc_idx, 1],
+                # Same "YYYY-MM-DD" strings as the row-wise generator.
+                "date": np.datetime_as_string(start + offsets, unit="D"),
+                **features,
+                "risk_score": risk_score,
+            }
+        )
+
+
+@timed("generate_synthetic_dataset")
 def generate_synthetic_dataset(
     n_samples=1000,
     start_date="2021-01-01",
@@ -71,18 +214,35 @@ def generate_synthetic_dataset(
     gee_bbox=None,
     n_locations=60,
     samples_per_location=None,
+    columnar=False,
+    chunk_size=COLUMNAR_CHUNK_SIZE,
 ):
+    if columnar:
+        chunks = iter_synthetic_chunks(
+            n_samples=n_samples,
+            start_date=start_date,
+            end_date=end_date,
+            bbox=bbox,
+            seed=seed,
+            power_df=power_df,
+            use_gee_mock=use_gee_mock,
+            gee_bbox=gee_bbox,
+            n_locations=n_locations,
+            samples_per_location=samples_per_location,
+            chunk_size=chunk_size,
+        )
+        frames = list(chunks)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
     if bbox is None:
         bbox = DEFAULT_BBOX
 
     rng = np.random.RandomState(seed)
     rows = []
 
-    power_lookup = None
-    if power_df is not None and not power_df.empty:
-        frame = power_df.copy()
-        frame["date"] = pd.to_datetime(frame["date"]).dt.date
-        power_lookup = {date: group for date, group in frame.groupby("date")}
+    power_lookup = _power_lookup(power_df)
 
     locations = [
         (
@@ -0,0 +1,34 @@
+import os
+
+
+# The app, including the shared predictor and its memory-mapped model
+# bundle, is built once in the master; forked workers inherit it instead
+# of each loading their own copy.
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# More than one thread switches to threaded workers, where concurrent
+# /api/score requests are micro-batched.
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+preload_app = True
+
+# "uvicorn.workers.UvicornWorker" serves asgi:app on an event loop instead.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+
+
+def when_ready(server):
+    # Batch scoring job workers (JOB_WORKERS), started once in the master
+    # before the web workers fork, so there is one pool however many web
+    # workers (forked workers see it and do not start their own).
+    from utils.jobs import start_job_workers
+
+    start_job_workers()
+
+
+def worker_exit(server, worker):
+    # atexit handlers registered while preloading only run in the master;
+    # each worker merges the feature store observations it took in here.
+    from api.endpoints import get_feature_store
+
+    feature_store = get_feature_store()
+    if feature_store is not None:
+        feature_store.save()
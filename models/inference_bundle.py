@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+BUNDLE_FORMAT = 2
+OUTPUTS = ["score", "lower", "upper"]
+PREDICT_CHUNK_ROWS = 4096
+_ARRAYS = [
+    "feature",
+    "threshold",
+    "left",
+    "right",
+    "missing_left",
+    "value",
+    "roots",
+    "tree_output",
+    "weights",
+    "base",
+]
+
+
+def bundle_path_for(model_path):
+    return f"{os.path.splitext(model_path)[0]}_bundle"
+
+
+class _Forest:
+    # Flat node arrays for many trees. Every node sends rows left when
+    # x <= threshold (or x is NaN and missing_left); leaves point at
+    # themselves so all rows can take the same number of steps.
+    def __init__(self):
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.missing_left = []
+        self.value = []
+        self.roots = []
+        self.tree_output = []
+        self.depth = 0
+        self.size = 0
+
+    def add_tree(self, output, feature, threshold, left, right, missing_left, value, depth):
+        offset = self.size
+        nodes = np.arange(len(feature))
+        leaf = left < 0
+        self.feature.append(np.where(leaf, 0, feature).astype(np.int32))
+        self.threshold.append(np.where(leaf, 0.0, threshold).astype(np.float64))
+        self.left.append((np.where(leaf, nodes, left) + offset).astype(np.int64))
+        self.right.append((np.where(leaf, nodes, right) + offset).astype(np.int64))
+        self.missing_left.append(np.asarray(missing_left, dtype=bool))
+        self.value.append(np.where(leaf, value, 0.0).astype(np.float64))
+        self.roots.append(offset)
+        self.tree_output.append(output)
+        self.depth = max(self.depth, int(depth))
+        self.size += len(feature)
+
+
+def _add_sklearn_tree(forest, output, estimator, scale):
+    tree = estimator.tree_
+    missing_left = getattr(tree, "missing_go_to_left", None)
+    if missing_left is None:
+        missing_left = np.zeros(tree.node_count, dtype=bool)
+    forest.add_tree(
+        output,
+        tree.feature,
+        tree.threshold,
+        tree.children_left,
+        tree.children_right,
+        missing_left,
+        tree.value[:, 0, 0] * scale,
+        tree.max_depth,
+    )
+
+
+def _xgboost_base_score(booster):
+    config = json.loads(booster.save_config())
+    value = config["learner"]["learner_model_param"]["base_score"]
+    return float(str(value).strip("[]").split(",")[0])
+
+
+def _add_xgboost_trees(forest, output, model, feature_cols, scale):
+    booster = model.get_booster()
+    frame = booster.trees_to_dataframe()
+    names = booster.feature_names or [f"f{i}" for i in range(len(feature_cols))]
+    index = {name: pos for pos, name in enumerate(names)}
+    for _, tree in frame.groupby("Tree", sort=True):
+        ids = {node_id: pos for pos, node_id in enumerate(tree["ID"])}
+        leaf = (tree["Feature"] == "Leaf").to_numpy()
+        split = tree["Split"].to_numpy(dtype=float)
+        # XGBoost goes left when float32(x) < split; as a <= test that is the
+        # previous float32 value.
+        threshold = np.nextafter(split.astype(np.float32), np.float32(-np.inf)).astype(float)
+        left = np.array([ids.get(v, -1) for v in tree["Yes"]])
+        right = np.array([ids.get(v, -1) for v in tree["No"]])
+        missing_left = (tree["Missing"] == tree["Yes"]).to_numpy() & ~leaf
+        feature = np.array([index.get(v, 0) for v in tree["Feature"]])
+        value = np.where(leaf, tree["Gain"].to_numpy(dtype=float), 0.0) * scale
+        left[leaf] = -1
+        forest.add_tree(
+            output, feature, threshold, left, right, missing_left, value, _tree_depth(left, right)
+        )
+    return _xgboost_base_score(booster) * scale
+
+
+def _tree_depth(left, right):
+    depth = np.zeros(len(left), dtype=int)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max()) if len(depth) else 0
+
+
+def _add_estimator(forest, weights, output, estimator, feature_cols, scale=1.0, shift=0.0):
+    # Returns the constant term of ``scale * estimator(x) + shift``. The
+    # estimator libraries are only needed to compile a bundle, so they are
+    # imported here rather than by everything that loads one.
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+
+    try:
+        from xgboost import XGBRegressor
+    except Exception:
+        XGBRegressor = None
+
+    if isinstance(estimator, RandomForestRegressor):
+        for tree in estimator.estimators_:
+            _add_sklearn_tree(forest, output, tree, scale / len(estimator.estimators_))
+        return shift
+    if isinstance(estimator, GradientBoostingRegressor):
+        if estimator.init_ == "zero":
+            init = 0.0
+        else:
+            init = float(np.ravel(estimator.init_.constant_)[0])
+        for tree in estimator.estimators_[:, 0]:
+            _add_sklearn_tree(forest, output, tree, scale * estimator.learning_rate)
+        return scale * init + shift
+    if XGBRegressor is not None and isinstance(estimator, XGBRegressor):
+        return _add_xgboost_trees(forest, output, estimator, feature_cols, scale) + shift
+    if hasattr(estimator, "coef_"):
+        weights[:, output] = np.ravel(estimator.coef_) * scale
+        return float(np.ravel(estimator.intercept_)[0]) * scale + shift
+    raise ValueError(f"Cannot compile {type(estimator).__name__} into an inference bundle.")
+
+
+def compile_bundle(payload):
+    feature_cols = list(payload["feature_cols"])
+    forest = _Forest()
+    weights = np.zeros((len(feature_cols), len(OUTPUTS)))
+    base = np.zeros(len(OUTPUTS))
+
+    # Calibration is linear in the model output, so it folds into leaf
+    # values, linear weights and the constant term.
+    scale, shift = 1.0, 0.0
+    calibrator = payload.get("calibrator")
+    if calibrator is not None:
+        scale = float(np.ravel(calibrator.coef_)[0])
+        shift = float(np.ravel(calibrator.intercept_)[0])
+    base[0] = _add_estimator(forest, weights, 0, payload["model"], feature_cols, scale, shift)
+
+    has_interval = payload.get("lower_model") is not None and payload.get("upper_model") is not None
+    if has_interval:
+        base[1] = _add_estimator(forest, weights, 1, payload["lower_model"], feature_cols)
+        base[2] = _add_estimator(forest, weights, 2, payload["upper_model"], feature_cols)
+
+    def stack(parts, dtype):
+        return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+    arrays = {
+        "feature": stack(forest.feature, np.int32),
+        "threshold": stack(forest.threshold, np.float64),
+        "left": stack(forest.left, np.int64),
+        "right": stack(forest.right, np.int64),
+        "missing_left": stack(forest.missing_left, bool),
+        "value": stack(forest.value, np.float64),
+        "roots": np.asarray(forest.roots, dtype=np.int64),
+        "tree_output": np.asarray(forest.tree_output, dtype=np.int64),
+        "weights": weights,
+        "base": base,
+    }
+    meta = {
+        "format": BUNDLE_FORMAT,
+        "feature_cols": feature_cols,
+        "outputs": OUTPUTS,
+        "depth": forest.depth,
+        "has_interval": has_interval,
+    }
+    return arrays, meta
+
+
+class InferenceBundle:
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.feature_cols = meta["feature_cols"]
+        self.has_interval = meta["has_interval"]
+        self.depth = meta["depth"]
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        # Only features with a linear weight enter the matrix product, so a
+        # NaN the trees route as missing does not leak in through a 0 weight.
+        self.linear_features = np.flatnonzero(np.any(self.weights != 0.0, axis=1))
+        self.membership = np.zeros((len(self.roots), len(OUTPUTS)))
+        self.membership[np.arange(len(self.roots)), self.tree_output] = 1.0
+
+    def _predict_chunk(self, X):
+        out = X[:, self.linear_features] @ self.weights[self.linear_features] + self.base
+        if len(self.roots) == 0:
+            return out
+        # Mirror the estimators: features are compared as float32 values.
+        X32 = X.astype(np.float32).astype(np.float64)
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            x = X32[rows, self.feature[nodes]]
+            go_left = (x <= self.threshold[nodes]) | (np.isnan(x) & self.missing_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return out + self.value[nodes] @ self.membership
+
+    def predict(self, X):
+        # (n, 3) array of calibrated score, lower and upper, clipped to 0-100.
+        X = np.asarray(X, dtype=np.float64)
+        out = np.empty((len(X), len(OUTPUTS)))
+        for start in range(0, len(X), PREDICT_CHUNK_ROWS):
+            stop = start + PREDICT_CHUNK_ROWS
+            out[start:stop] = self._predict_chunk(X[start:stop])
+        return np.clip(out, 0.0, 100.0)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _model_signature(model_path, model_sha256=None):
+    # Content, not size and mtime: a checkout, copy or restore of the same
+    # model keeps its bundle valid, and any other model invalidates it.
+    return {"model_sha256": model_sha256 or file_sha256(model_path)}
+
+
+def export_bundle(payload, model_path, bundle_path=None):
+    # Writes next to the model; returns None when the model type has no
+    # compiled form, and the predictor then falls back to the joblib payload.
+    bundle_path = bundle_path or bundle_path_for(model_path)
+    try:
+        arrays, meta = compile_bundle(payload)
+    except ValueError:
+        shutil.rmtree(bundle_path, ignore_errors=True)
+        return None
+    meta.update(_model_signature(model_path))
+
+    tmp_path = f"{bundle_path}.tmp.{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as handle:
+        json.dump(meta, handle, indent=2)
+    shutil.rmtree(bundle_path, ignore_errors=True)
+    os.replace(tmp_path, bundle_path)
+    return bundle_path
+
+
+def _read_meta(bundle_path):
+    meta_path = os.path.join(bundle_path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def _is_current(meta, model_path, model_sha256=None):
+    if meta is None or meta.get("format") != BUNDLE_FORMAT:
+        return False
+    if model_path is None:
+        return True
+    if not os.path.exists(model_path):
+        return False
+    signature = _model_signature(model_path, model_sha256)
+    return all(meta.get(key) == value for key, value in signature.items())
+
+
+def ensure_bundle(model_path, model_sha256=None):
+    # (Re)compiles the bundle when it is missing or was compiled from another
+    # model; None when the model has no compiled form.
+    bundle_path = bundle_path_for(model_path)
+    if not os.path.exists(model_path):
+        return None
+    model_sha256 = model_sha256 or file_sha256(model_path)
+    if _is_current(_read_meta(bundle_path), model_path, model_sha256):
+        return bundle_path
+    import joblib
+
+    return export_bundle(joblib.load(model_path), model_path, bundle_path)
+
+
+def load_bundle(bundle_path, model_path=None, mmap_mode=None, model_sha256=None):
+    # None when missing, of another format, or compiled from another model
+    # than ``model_path``. With mmap_mode="r" the arrays stay in the page
+    # cache, shared by every process that maps the same files.
+    meta = _read_meta(bundle_path)
+    if not _is_current(meta, model_path, model_sha256):
+        return None
+    arrays = {
+        name: np.load(os.path.join(bundle_path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in _ARRAYS
+    }
+    return InferenceBundle(arrays, meta)
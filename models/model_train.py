@@ -1,13 +1,23 @@
+import argparse
+import copy
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import joblib
 import numpy as np
+import pandas as pd
 from sklearn.base import clone
 from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score, mean_squared_error
 from sklearn.model_selection import KFold, train_test_split
 
+from config.settings import MODEL_PATH, MODEL_SELECTION, RESULTS_DIR, TRAIN_WORKERS
+from models.inference_bundle import bundle_path_for, export_bundle
 from utils.feature_engineer import build_feature_frame
+from utils.instrumentation import timed
 
 
 try:
@@ -40,37 +50,199 @@ def _candidate_models():
     return models
 
 
-def _cross_validate(models, X, y, folds=3):
+QUANTILE_ALPHAS = (0.1, 0.9)
+HALVING_ETA = 3
+HALVING_MIN_FINALISTS = 2
+HALVING_MIN_ROWS = 300
+HALVING_MIN_ESTIMATORS = 10
+UPDATE_MIN_ESTIMATORS = 10
+UPDATE_EVAL_FRACTION = 0.2
+DRIFT_THRESHOLD_SD = 0.5
+
+# Training frame for the current job batch. Set in the parent for sequential
+# runs and by the pool initializer in workers, so jobs only carry row indices.
+_JOB_DATA = {}
+
+
+def _init_job_data(X, y):
+    _JOB_DATA["X"] = X
+    _JOB_DATA["y"] = y
+
+
+def _run_job(job):
+    X, y = _JOB_DATA["X"], _JOB_DATA["y"]
+    train_idx = job["train_idx"]
+    start = time.perf_counter()
+    model = clone(job["model"]).fit(X.iloc[train_idx], y.iloc[train_idx])
+    result = {key: job[key] for key in ("kind", "name", "fold") if key in job}
+    if job.get("val_idx") is not None:
+        y_val = y.iloc[job["val_idx"]]
+        preds = model.predict(X.iloc[job["val_idx"]])
+        result["metrics"] = {
+            "mae": mean_absolute_error(y_val, preds),
+            "rmse": float(np.sqrt(mean_squared_error(y_val, preds))),
+            "r2": r2_score(y_val, preds),
+        }
+    else:
+        result["model"] = model
+    result["seconds"] = time.perf_counter() - start
+    result["pid"] = os.getpid()
+    return result
+
+
+def _run_jobs(jobs, X, y, workers=1):
+    # Each job is independent and seeded, and results come back in submission
+    # order, so the outcome does not depend on the worker count.
+    workers = max(1, min(workers or 1, len(jobs)))
+    if workers == 1:
+        _init_job_data(X, y)
+        try:
+            return [_run_job(job) for job in jobs]
+        finally:
+            _JOB_DATA.clear()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_job_data, initargs=(X, y)
+    ) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+def _cv_jobs(models, X, folds=3, rows=None):
+    # ``rows`` restricts the folds to a subsample of X (positional indices).
     cv = KFold(n_splits=folds, shuffle=True, random_state=42)
-    results = {}
-
-    for name, model in models.items():
-        fold_metrics = []
-        for train_idx, val_idx in cv.split(X):
-            X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
-            y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
-            fold_model = clone(model)
-            fold_model.fit(X_train, y_train)
-            preds = fold_model.predict(X_val)
-            fold_metrics.append(
-                {
-                    "mae": mean_absolute_error(y_val, preds),
-                    "rmse": float(np.sqrt(mean_squared_error(y_val, preds))),
-                    "r2": r2_score(y_val, preds),
-                }
-            )
-        results[name] = {
-            metric: float(np.mean([m[metric] for m in fold_metrics]))
-            for metric in fold_metrics[0]
+    if rows is None:
+        splits = list(cv.split(X))
+    else:
+        splits = [(rows[train], rows[val]) for train, val in cv.split(rows)]
+    return [
+        {
+            "kind": "cv",
+            "name": name,
+            "fold": fold,
+            "model": model,
+            "train_idx": train_idx,
+            "val_idx": val_idx,
+        }
+        for name, model in models.items()
+        for fold, (train_idx, val_idx) in enumerate(splits)
+    ]
+
+
+def _summarize_cv(job_results):
+    fold_metrics = {}
+    for result in job_results:
+        if result["kind"] == "cv":
+            fold_metrics.setdefault(result["name"], []).append(result["metrics"])
+    return {
+        name: {
+            metric: float(np.mean([m[metric] for m in metrics]))
+            for metric in metrics[0]
         }
+        for name, metrics in fold_metrics.items()
+    }
+
+
+def _cross_validate(models, X, y, folds=3, workers=1):
+    return _summarize_cv(_run_jobs(_cv_jobs(models, X, folds), X, y, workers))
 
-    return results
+
+def _job_timings(job_results):
+    return [
+        {
+            key: result[key]
+            for key in ("kind", "name", "rung", "fold", "seconds", "pid")
+            if key in result
+        }
+        for result in job_results
+    ]
 
 
 def _select_best(cv_results):
     return min(cv_results.items(), key=lambda item: item[1]["mae"])[0]
 
 
+def _job_work(job):
+    # Compute proxy for one fit: training rows x estimators.
+    return len(job["train_idx"]) * (job["model"].get_params().get("n_estimators") or 1)
+
+
+def _scaled_model(model, fraction):
+    n_estimators = model.get_params().get("n_estimators")
+    if not n_estimators or fraction >= 1.0:
+        return model
+    return clone(model).set_params(
+        n_estimators=max(HALVING_MIN_ESTIMATORS, int(round(n_estimators * fraction)))
+    )
+
+
+def _halving_sizes(n_candidates, eta, min_finalists):
+    sizes = [n_candidates]
+    while sizes[-1] > min_finalists:
+        sizes.append(max(min_finalists, int(np.ceil(sizes[-1] / eta))))
+    return sizes
+
+
+def _successive_halving(models, X, y, workers=1, extra_jobs=(), folds=3, eta=HALVING_ETA):
+    # Rung r cross-validates the survivors on a 1/eta**k share of the rows and
+    # of each model's estimators, keeping the best 1/eta by MAE. The last rung
+    # runs full cross-validation on the finalists only, with the same folds
+    # as the exhaustive mode.
+    sizes = _halving_sizes(len(models), eta, HALVING_MIN_FINALISTS)
+    order = np.random.RandomState(42).permutation(len(X))
+    survivors = list(models)
+    rungs = []
+    job_results = []
+    spent = {}
+    cv_results = {}
+    for rung in range(len(sizes)):
+        fraction = float(eta) ** (rung - len(sizes) + 1)
+        n_rows = len(X)
+        if fraction < 1.0:
+            n_rows = min(len(X), max(HALVING_MIN_ROWS, int(len(X) * fraction)))
+        rows = np.sort(order[:n_rows]) if n_rows < len(X) else None
+        rung_models = {name: _scaled_model(models[name], fraction) for name in survivors}
+        jobs = _cv_jobs(rung_models, X, folds, rows=rows)
+        results = _run_jobs(jobs + (list(extra_jobs) if rung == 0 else []), X, y, workers)
+        job_results.extend(dict(result, rung=rung) for result in results)
+
+        for job, result in zip(jobs, results):
+            work, seconds = spent.get(job["name"], (0, 0.0))
+            spent[job["name"]] = (work + _job_work(job), seconds + result["seconds"])
+
+        cv_results = _summarize_cv(results)
+        ranked = sorted(survivors, key=lambda name: cv_results[name]["mae"])
+        survivors = ranked[:sizes[rung + 1]] if rung + 1 < len(sizes) else ranked
+        rungs.append({
+            "rung": rung,
+            "rows": n_rows,
+            "estimator_fraction": fraction,
+            "mae": {name: cv_results[name]["mae"] for name in ranked},
+            "kept": survivors,
+        })
+
+    full_work = {name: 0 for name in models}
+    for job in _cv_jobs(models, X, folds):
+        full_work[job["name"]] += _job_work(job)
+    used_work = sum(work for work, _ in spent.values())
+    total_full_work = sum(full_work.values())
+    # Eliminated models never ran at full size; scale their measured time by
+    # the work they skipped.
+    estimated_full_seconds = sum(
+        seconds * full_work[name] / work for name, (work, seconds) in spent.items() if work
+    )
+    selection = {
+        "mode": "halving",
+        "eta": eta,
+        "rungs": rungs,
+        "finalists": list(cv_results),
+        "work_units": used_work,
+        "full_work_units": total_full_work,
+        "compute_saved": 1.0 - used_work / total_full_work if total_full_work else 0.0,
+        "cv_seconds": sum(seconds for _, seconds in spent.values()),
+        "estimated_full_cv_seconds": estimated_full_seconds,
+    }
+    return cv_results, job_results, selection
+
+
 def _fit_calibration(y_true, preds):
     calibrator = LinearRegression()
     calibrator.fit(preds.reshape(-1, 1), y_true)
@@ -81,34 +253,254 @@ def _apply_calibration(calibrator, preds):
     return calibrator.predict(preds.reshape(-1, 1))
 
 
-def _fit_quantile_models(X, y):
-    lower = GradientBoostingRegressor(
-        loss="quantile", alpha=0.1, random_state=42
-    ).fit(X, y)
-    upper = GradientBoostingRegressor(
-        loss="quantile", alpha=0.9, random_state=42
-    ).fit(X, y)
-    return lower, upper
+def _quantile_model(alpha):
+    return GradientBoostingRegressor(loss="quantile", alpha=alpha, random_state=42)
 
 
-def train_model(df, model_path, report_path=None):
+def _quantile_jobs(train_idx):
+    return [
+        {
+            "kind": "quantile",
+            "name": f"quantile_{alpha:g}",
+            "model": _quantile_model(alpha),
+            "train_idx": train_idx,
+        }
+        for alpha in QUANTILE_ALPHAS
+    ]
+
+
+def _save_model(payload, model_path):
+    # The bundle is compiled from the new file before it replaces the model,
+    # so a predictor that reloads on the replace finds its bundle in place.
+    tmp_path = f"{model_path}.tmp.{os.getpid()}"
+    joblib.dump(payload, tmp_path)
+    export_bundle(payload, tmp_path, bundle_path_for(model_path))
+    os.replace(tmp_path, model_path)
+
+
+def _feature_stats(X):
+    return {"mean": X.mean().to_dict(), "std": X.std().to_dict()}
+
+
+def _merge_feature_stats(stats, X, n_history):
+    # Pooled mean and std of the training rows plus ``X``, so later drift
+    # reports compare against everything the model has been fitted on.
+    if not stats:
+        return _feature_stats(X)
+    if n_history < 2 or len(X) < 2:
+        return stats
+    n_new = len(X)
+    total = n_history + n_new
+    merged = {"mean": {}, "std": {}}
+    for col in X.columns:
+        old_mean, old_std = stats["mean"][col], stats["std"][col]
+        new_mean, new_std = float(X[col].mean()), float(X[col].std())
+        delta = new_mean - old_mean
+        mean = old_mean + delta * n_new / total
+        var = (
+            (n_history - 1) * old_std ** 2
+            + (n_new - 1) * new_std ** 2
+            + delta ** 2 * n_history * n_new / total
+        ) / (total - 1)
+        merged["mean"][col] = mean
+        merged["std"][col] = float(np.sqrt(var))
+    return merged
+
+
+def _design(X):
+    return np.column_stack([np.asarray(X, dtype=float), np.ones(len(X))])
+
+
+def _linear_stats(X, y):
+    # Normal-equation sums, so a linear model can absorb new rows exactly
+    # without revisiting the old ones.
+    A = _design(X)
+    return {"xtx": A.T @ A, "xty": A.T @ np.asarray(y, dtype=float)}
+
+
+def _added_estimators(model, n_new, n_history):
+    share = n_new / max(n_history, 1)
+    return max(UPDATE_MIN_ESTIMATORS, int(np.ceil(model.n_estimators * share)))
+
+
+def _continue_training(model, X, y, n_history, linear_stats=None):
+    # Returns (model, method). Tree ensembles grow extra trees/stages fitted
+    # on the new rows only; linear models fold the rows into their normal
+    # equations.
+    if isinstance(model, (RandomForestRegressor, GradientBoostingRegressor)):
+        extra = _added_estimators(model, len(X), n_history)
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + extra)
+        model.fit(X, y)
+        model.set_params(warm_start=False)
+        return model, f"warm_start (+{extra})"
+    if _HAS_XGBOOST and isinstance(model, XGBRegressor):
+        extra = _added_estimators(model, len(X), n_history)
+        updated = clone(model).set_params(n_estimators=extra)
+        updated.fit(X, y, xgb_model=model.get_booster())
+        return updated, f"xgb_model (+{extra})"
+    if isinstance(model, LinearRegression) and linear_stats is not None:
+        new_stats = _linear_stats(X, y)
+        linear_stats["xtx"] = linear_stats["xtx"] + new_stats["xtx"]
+        linear_stats["xty"] = linear_stats["xty"] + new_stats["xty"]
+        beta = np.linalg.lstsq(linear_stats["xtx"], linear_stats["xty"], rcond=None)[0]
+        model.coef_ = beta[:-1]
+        model.intercept_ = float(beta[-1])
+        return model, "normal_equations"
+    if hasattr(model, "partial_fit"):
+        model.partial_fit(X, y)
+        return model, "partial_fit"
+    raise ValueError(f"{type(model).__name__} cannot be updated incrementally; retrain it.")
+
+
+def _drift_report(payload, old_payload, X_new, X_eval, y_eval):
+    reference = payload.get("feature_stats")
+    features = {}
+    if reference:
+        for col in X_new.columns:
+            std = reference["std"].get(col) or 0.0
+            shift = X_new[col].mean() - reference["mean"][col]
+            features[col] = {
+                "mean_shift_sd": float(shift / std) if std else 0.0,
+                "std_ratio": float(X_new[col].std() / std) if std else None,
+            }
+
+    report = {
+        "features": features,
+        "flagged_features": [
+            col for col, stats in features.items()
+            if abs(stats["mean_shift_sd"]) > DRIFT_THRESHOLD_SD
+        ],
+    }
+    if len(X_eval):
+        old_preds = _apply_calibration(old_payload["calibrator"], old_payload["model"].predict(X_eval))
+        new_preds = _apply_calibration(payload["calibrator"], payload["model"].predict(X_eval))
+        report.update({
+            "eval_rows": len(X_eval),
+            "old_mae": float(mean_absolute_error(y_eval, old_preds)),
+            "new_mae": float(mean_absolute_error(y_eval, new_preds)),
+            "mean_prediction_shift": float(np.mean(np.abs(new_preds - old_preds))),
+        })
+    return report
+
+
+@timed("update_model")
+def update_model(df, model_path, report_path=None, since=None):
+    # Continue training the saved model on rows dated after ``since`` (by
+    # default the payload's trained_through). ``df`` holds history plus the
+    # new days, so rolling-window features see their full context.
+    started = time.perf_counter()
+    payload = joblib.load(model_path)
+    since = since or payload.get("trained_through")
+    if since is None:
+        raise ValueError("Model payload has no trained_through date; pass since=.")
+
     engineered, feature_cols = build_feature_frame(df)
+    if feature_cols != payload["feature_cols"]:
+        raise ValueError("Feature columns changed since the model was trained; retrain it.")
+    new = engineered[engineered["date"] > pd.Timestamp(since)]
+    if new.empty:
+        return {"updated": False, "since": str(since), "new_rows": 0}
+
+    X_new, y_new = new[feature_cols], new["risk_score"]
+    if len(new) >= 10:
+        X_fit, X_eval, y_fit, y_eval = train_test_split(
+            X_new, y_new, test_size=UPDATE_EVAL_FRACTION, random_state=42
+        )
+    else:
+        X_fit, X_eval, y_fit, y_eval = X_new, X_new.iloc[:0], y_new, y_new.iloc[:0]
+
+    old_payload = copy.deepcopy(payload)
+    # The model (and linear_stats) saw n_fit_rows; the quantile models and
+    # feature_stats the whole training split. Older payloads only have the
+    # latter.
+    n_history = payload.get("n_train_rows", 0)
+    n_fit_history = payload.get("n_fit_rows", n_history)
+    methods = {}
+    payload["model"], methods["model"] = _continue_training(
+        payload["model"], X_fit, y_fit, n_fit_history, payload.get("linear_stats")
+    )
+    for key in ("lower_model", "upper_model"):
+        if payload.get(key) is not None:
+            payload[key], methods[key] = _continue_training(payload[key], X_fit, y_fit, n_history)
+
+    through = new["date"].max().strftime("%Y-%m-%d")
+    update = {
+        "updated": True,
+        "since": str(since),
+        "trained_through": through,
+        "new_rows": len(new),
+        "fit_rows": len(X_fit),
+        "history_rows": n_history,
+        "history_fit_rows": n_fit_history,
+        "methods": methods,
+        "drift": _drift_report(payload, old_payload, X_new, X_eval, y_eval),
+    }
+    payload["trained_through"] = through
+    payload["feature_stats"] = _merge_feature_stats(payload.get("feature_stats"), X_fit, n_history)
+    payload["n_train_rows"] = n_history + len(X_fit)
+    payload["n_fit_rows"] = n_fit_history + len(X_fit)
+    payload.setdefault("updates", []).append(
+        {key: update[key] for key in ("since", "trained_through", "new_rows", "methods")}
+    )
+    # A new model file: serving predictors reload on it, which also clears
+    # the prediction cache (keyed on the model hash) and bypasses a risk
+    # grid built with the old model.
+    _save_model(payload, model_path)
+    update["seconds"] = time.perf_counter() - started
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as handle:
+            json.dump(update, handle, indent=2)
+    return update
+
+
+@timed("train_model")
+def train_model(df, model_path, report_path=None, workers=None, selection=None, features=None):
+    # ``features`` is a precomputed build_feature_frame(df) result; ``df``
+    # is then not needed.
+    if workers is None:
+        workers = TRAIN_WORKERS
+    if selection is None:
+        selection = MODEL_SELECTION
+    if selection not in ("full", "halving"):
+        raise ValueError(f"Unknown model selection mode: {selection}")
+    started = time.perf_counter()
+    engineered, feature_cols = features if features is not None else build_feature_frame(df)
     X = engineered[feature_cols]
     y = engineered["risk_score"]
 
+    train_full_idx, test_idx = train_test_split(
+        np.arange(len(X)), test_size=0.2, random_state=42
+    )
+    X_train_full, X_test = X.iloc[train_full_idx], X.iloc[test_idx]
+    y_train_full, y_test = y.iloc[train_full_idx], y.iloc[test_idx]
+
+    # CV folds and the quantile fits do not depend on each other, so they
+    # share one batch of jobs.
     models = _candidate_models()
-    cv_results = _cross_validate(models, X, y)
+    if selection == "halving":
+        cv_results, job_results, selection_report = _successive_halving(
+            models, X, y, workers, extra_jobs=_quantile_jobs(train_full_idx)
+        )
+    else:
+        job_results = _run_jobs(
+            _cv_jobs(models, X) + _quantile_jobs(train_full_idx), X, y, workers
+        )
+        cv_results = _summarize_cv(job_results)
+        selection_report = {"mode": "full"}
     best_name = _select_best(cv_results)
-
-    X_train_full, X_test, y_train_full, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
+    lower_model, upper_model = (
+        result["model"] for result in job_results if result["kind"] == "quantile"
     )
+
     X_train, X_calib, y_train, y_calib = train_test_split(
         X_train_full, y_train_full, test_size=0.2, random_state=42
     )
 
     model = models[best_name]
+    final_start = time.perf_counter()
     model.fit(X_train, y_train)
+    final_seconds = time.perf_counter() - final_start
 
     calib_preds = model.predict(X_calib)
     calibrator = _fit_calibration(y_calib, calib_preds)
@@ -122,9 +514,9 @@ def train_model(df, model_path, report_path=None):
         "mae": float(mean_absolute_error(y_test, calibrated_preds)),
         "rmse": float(np.sqrt(mean_squared_error(y_test, calibrated_preds))),
         "cv_results": cv_results,
+        "selection": selection_report,
     }
 
-    lower_model, upper_model = _fit_quantile_models(X_train_full, y_train_full)
     lower_preds = lower_model.predict(X_test)
     upper_preds = upper_model.predict(X_test)
     interval_coverage = float(
@@ -147,13 +539,32 @@ def train_model(df, model_path, report_path=None):
         "lower_model": lower_model,
         "upper_model": upper_model,
         "feature_cols": feature_cols,
+        "trained_through": engineered["date"].max().strftime("%Y-%m-%d"),
+        # Rows of the training split (quantile models, feature_stats), and
+        # the part of it the selected model and linear_stats were fit on
+        # (the rest calibrates).
+        "n_train_rows": len(X_train_full),
+        "n_fit_rows": len(X_train),
+        "feature_stats": _feature_stats(X_train_full),
+        "linear_stats": _linear_stats(X_train, y_train) if isinstance(model, LinearRegression) else None,
+        "updates": [],
     }
-    joblib.dump(payload, model_path)
+    _save_model(payload, model_path)
 
     if report_path:
         report = {
             "metrics": metrics,
             "top_features": None,
+            "training": {
+                "workers": max(1, min(workers or 1, len(job_results))),
+                "train_rows": len(X_train_full),
+                "fit_rows": len(X_train),
+                "calibration_rows": len(X_calib),
+                "test_rows": len(X_test),
+                "wall_seconds": time.perf_counter() - started,
+                "jobs": _job_timings(job_results)
+                + [{"kind": "final", "name": best_name, "seconds": final_seconds}],
+            },
         }
         if feature_importance:
             ranked = sorted(feature_importance.items(), key=lambda item: item[1], reverse=True)
@@ -171,3 +582,55 @@ def train_model(df, model_path, report_path=None):
     }
 
     return metrics, diagnostics
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Continue training the saved model on days after its trained_through date"
+    )
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--data", help="CSV or Parquet rows (history plus new days); default: synthetic")
+    parser.add_argument("--since", help="Update on rows after this date (default: trained_through)")
+    parser.add_argument("--days", type=int, default=30, help="New synthetic days to generate")
+    parser.add_argument("--n-samples", type=int, default=600, help="Synthetic rows to generate")
+    parser.add_argument("--report", default=os.path.join(RESULTS_DIR, "model_update_report.json"))
+    parser.add_argument(
+        "--no-rescore", action="store_true", help="Leave the published scored points as they are"
+    )
+    return parser.parse_args()
+
+
+def _update_data(args):
+    if args.data:
+        from utils.storage import read_table
+
+        return read_table(args.data)
+    from data.synthetic_data import generate_synthetic_dataset
+    from utils.feature_engineer import MAX_WINDOW
+
+    since = pd.Timestamp(args.since or joblib.load(args.model)["trained_through"])
+    # Enough history before ``since`` for the rolling windows.
+    return generate_synthetic_dataset(
+        n_samples=args.n_samples,
+        start_date=(since - pd.Timedelta(days=2 * MAX_WINDOW)).strftime("%Y-%m-%d"),
+        end_date=(since + pd.Timedelta(days=args.days)).strftime("%Y-%m-%d"),
+    )
+
+
+if __name__ == "__main__":
+    from utils.pipeline import rescore_points
+
+    args = _parse_args()
+    result = update_model(_update_data(args), args.model, report_path=args.report, since=args.since)
+    if not result["updated"]:
+        print(f"No rows after {result['since']}; model unchanged")
+    else:
+        print(
+            f"Updated through {result['trained_through']} on {result['new_rows']} new rows "
+            f"({', '.join(f'{key}: {method}' for key, method in result['methods'].items())})"
+        )
+        flagged = result["drift"]["flagged_features"]
+        if flagged:
+            print(f"Drifted features: {', '.join(flagged)}")
+        if args.model == MODEL_PATH and not args.no_rescore:
+            print(f"Rescored points: {rescore_points(args.model)}")
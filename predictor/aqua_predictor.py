@@ -1,71 +1,151 @@
-from datetime import datetime
+import logging
+import os
+import threading
 
-import joblib
+import numpy as np
 import pandas as pd
 
-from utils.data_simulator import simulate_features
+from models.inference_bundle import bundle_path_for, ensure_bundle, file_sha256, load_bundle
+from utils.data_simulator import simulate_features_batch
 from utils.feature_engineer import build_feature_frame
+from utils.instrumentation import span, timed
+
+
+def _to_dates(dates, size):
+    if isinstance(dates, str) or not hasattr(dates, "__len__"):
+        dates = [dates] * size
+    return pd.to_datetime(pd.Series(list(dates)), format="%Y-%m-%d")
+
+
+logger = logging.getLogger(__name__)
+
+
+def model_version(model_path):
+    return file_sha256(model_path)[:16]
 
 
 class AquaSentinelPredictor:
-    def __init__(self, model_path):
-        payload = joblib.load(model_path)
+    def __init__(self, model_path, feature_store=None, use_bundle=True, mmap_mode=None):
+        self.feature_store = feature_store
+        model_sha256 = file_sha256(model_path)
+        self.version = model_sha256[:16]
+        # A current compiled bundle replaces the four estimators entirely. A
+        # missing or stale one (a model copied in without its bundle) is
+        # recompiled once here.
+        self.bundle = None
+        if use_bundle:
+            bundle_path = bundle_path_for(model_path)
+            self.bundle = load_bundle(bundle_path, model_path, mmap_mode, model_sha256)
+            if self.bundle is None and ensure_bundle(model_path, model_sha256) is not None:
+                self.bundle = load_bundle(bundle_path, model_path, mmap_mode, model_sha256)
+            if self.bundle is None:
+                logger.warning(
+                    "No compiled inference bundle for %s; scoring with the joblib estimators",
+                    model_path,
+                )
+        if self.bundle is not None:
+            self.model = None
+            self.feature_cols = self.bundle.feature_cols
+            self.calibrator = None
+            self.lower_model = None
+            self.upper_model = None
+            return
+
+        import joblib
+
+        payload = joblib.load(model_path, mmap_mode=mmap_mode)
         self.model = payload["model"]
         self.feature_cols = payload["feature_cols"]
         self.calibrator = payload.get("calibrator")
         self.lower_model = payload.get("lower_model")
         self.upper_model = payload.get("upper_model")
 
-    def predict_risk(self, lat, lon, date):
-        if isinstance(date, str):
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-        else:
-            date_obj = date
-
-        features = simulate_features(lat, lon, date_obj)
-        record = {
-            "lat": lat,
-            "lon": lon,
-            "date": date_obj.strftime("%Y-%m-%d"),
-            **features,
-        }
-        df = pd.DataFrame([record])
-        engineered, _ = build_feature_frame(df)
-        X = engineered[self.feature_cols]
-        score = float(self.model.predict(X)[0])
-        if self.calibrator is not None:
-            score = float(self.calibrator.predict([[score]])[0])
-        return max(0.0, min(100.0, score))
+    def _feature_matrix(self, lats, lons, dates):
+        lats = np.asarray(lats, dtype=float).ravel()
+        lons = np.asarray(lons, dtype=float).ravel()
+        date_values = _to_dates(dates, len(lats))
+        features = simulate_features_batch(lats, lons, date_values)
+        df = pd.DataFrame(
+            {"lat": lats, "lon": lons, "date": date_values.dt.normalize(), **features}
+        )
+        engineered, _ = build_feature_frame(df, windowed=False)
+        if self.feature_store is not None:
+            for col, values in self.feature_store.window_features(df).items():
+                engineered[col] = values
+        return engineered[self.feature_cols]
 
-    def predict_with_interval(self, lat, lon, date):
-        if isinstance(date, str):
-            date_obj = datetime.strptime(date, "%Y-%m-%d")
-        else:
-            date_obj = date
-
-        features = simulate_features(lat, lon, date_obj)
-        record = {
-            "lat": lat,
-            "lon": lon,
-            "date": date_obj.strftime("%Y-%m-%d"),
-            **features,
-        }
-        df = pd.DataFrame([record])
-        engineered, _ = build_feature_frame(df)
-        X = engineered[self.feature_cols]
-
-        score = float(self.model.predict(X)[0])
+    def _has_interval(self):
+        if self.bundle is not None:
+            return self.bundle.has_interval
+        return self.lower_model is not None and self.upper_model is not None
+
+    def _score(self, X):
+        if self.bundle is not None:
+            return self.bundle.predict(X.to_numpy(dtype=float))[:, 0]
+        scores = np.asarray(self.model.predict(X), dtype=float)
         if self.calibrator is not None:
-            score = float(self.calibrator.predict([[score]])[0])
+            scores = self.calibrator.predict(scores.reshape(-1, 1))
+        return np.clip(scores, 0.0, 100.0)
+
+    @timed("predict_batch")
+    def predict_batch(self, lats, lons, dates):
+        if len(np.atleast_1d(lats)) == 0:
+            empty = np.empty(0, dtype=float)
+            if self._has_interval():
+                return empty, empty, empty
+            return empty, None, None
+
+        with span("predict.features"):
+            X = self._feature_matrix(lats, lons, dates)
+        with span("predict.model"):
+            if self.bundle is not None:
+                out = self.bundle.predict(X.to_numpy(dtype=float))
+                if self._has_interval():
+                    return out[:, 0], out[:, 1], out[:, 2]
+                return out[:, 0], None, None
+
+            scores = self._score(X)
+
+            lower = None
+            upper = None
+            if self._has_interval():
+                lower = np.clip(self.lower_model.predict(X), 0.0, 100.0)
+                upper = np.clip(self.upper_model.predict(X), 0.0, 100.0)
+
+        return scores, lower, upper
 
-        lower = None
-        upper = None
-        if self.lower_model is not None and self.upper_model is not None:
-            lower = float(self.lower_model.predict(X)[0])
-            upper = float(self.upper_model.predict(X)[0])
+    def predict_risk(self, lat, lon, date):
+        X = self._feature_matrix([lat], [lon], [date])
+        return float(self._score(X)[0])
 
+    def predict_with_interval(self, lat, lon, date):
+        scores, lower, upper = self.predict_batch([lat], [lon], [date])
         return (
-            max(0.0, min(100.0, score)),
-            max(0.0, min(100.0, lower)) if lower is not None else None,
-            max(0.0, min(100.0, upper)) if upper is not None else None,
+            float(scores[0]),
+            float(lower[0]) if lower is not None else None,
+            float(upper[0]) if upper is not None else None,
         )
+
+
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_predictor(model_path, feature_store=None, mmap_mode=None):
+    # One predictor per (model file, feature store) per process, rebuilt when
+    # the file is replaced. Built before a pre-forking server forks, it is
+    # inherited by every worker.
+    stat = os.stat(model_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (model_path, id(feature_store), mmap_mode)
+    entry = _SHARED.get(key)
+    if entry is None or entry[0] != signature:
+        with _SHARED_LOCK:
+            entry = _SHARED.get(key)
+            if entry is None or entry[0] != signature:
+                predictor = AquaSentinelPredictor(
+                    model_path, feature_store=feature_store, mmap_mode=mmap_mode
+                )
+                entry = (signature, predictor)
+                _SHARED[key] = entry
+    return entry[1]
@@ -0,0 +1,121 @@
+import threading
+
+from config.settings import MICROBATCH_MAX_SIZE, MICROBATCH_WINDOW_MS
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+
+
+def predict_items(predictor, items):
+    # One result tuple (or the exception) per item. If the batch call fails,
+    # rows are retried one by one so a bad row only fails its own caller.
+    lats, lons, dates = (list(values) for values in zip(*items))
+    try:
+        scores, lower, upper = predictor.predict_batch(lats, lons, dates)
+    except Exception:
+        results = []
+        for item in items:
+            try:
+                results.append(predictor.predict_with_interval(*item))
+            except Exception as exc:
+                results.append(exc)
+        return results
+    return [
+        (
+            float(scores[pos]),
+            float(lower[pos]) if lower is not None else None,
+            float(upper[pos]) if upper is not None else None,
+        )
+        for pos in range(len(items))
+    ]
+
+
+class MicroBatcher:
+    # Coalesces concurrent single-point predictions into one predict_batch
+    # call. The first caller of a batch leads it: it waits up to ``window``
+    # seconds (less if ``max_size`` callers join), scores every row and
+    # wakes the others. No background thread, so it is safe across fork.
+    def __init__(self, window=MICROBATCH_WINDOW_MS / 1000.0, max_size=MICROBATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self._open = {}
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def predict_with_interval(self, predictor, lat, lon, date):
+        key = id(predictor)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            pos = len(batch.items)
+            batch.items.append((lat, lon, date))
+            if len(batch.items) >= self.max_size:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+                self.batches += 1
+                self.requests += len(batch.items)
+            try:
+                batch.results = predict_items(predictor, batch.items)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        result = batch.results[pos] if batch.results is not None else RuntimeError("batch failed")
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def wrap(self, predictor):
+        return BatchedPredictor(predictor, self)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "window_ms": self.window * 1000.0,
+                "max_size": self.max_size,
+            }
+
+
+class BatchedPredictor:
+    # A predictor whose predict_with_interval goes through a MicroBatcher;
+    # everything else is the wrapped predictor's.
+    def __init__(self, predictor, batcher):
+        self.predictor = predictor
+        self.batcher = batcher
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+    def predict_with_interval(self, lat, lon, date):
+        return self.batcher.predict_with_interval(self.predictor, lat, lon, date)
+
+
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def get_micro_batcher():
+    global _BATCHER
+    with _BATCHER_LOCK:
+        if _BATCHER is None:
+            _BATCHER = MicroBatcher()
+        return _BATCHER
@@ -1,23 +1,14 @@
 import argparse
+import cProfile
+import json
 import os
 
 from config.settings import (
     MODEL_PATH,
     RESULTS_DIR,
-    DEFAULT_BBOX,
-    POWER_BBOX,
-    POWER_END_DATE,
-    POWER_GRID_SIZE,
-    POWER_START_DATE,
-    POWER_USE_DATASET_BBOX,
-    GEE_MOCK_ENABLED,
+    TRAIN_WORKERS,
 )
-from data.nasa_power import load_or_fetch_power_grid
-from data.synthetic_data import generate_synthetic_dataset
-from models.model_train import train_model
-from predictor.aqua_predictor import AquaSentinelPredictor
-from visualization.model_diagnostics import save_diagnostic_plots
-from visualization.risk_mapper import generate_risk_map
+from utils.instrumentation import stage_summary
 
 
 def _parse_bbox(value):
@@ -45,8 +36,7 @@ def _parse_args():
     parser.add_argument(
         "--power-grid-size",
         type=int,
-        default=POWER_GRID_SIZE,
-        help="Number of grid points per axis for NASA POWER.",
+        help="Number of grid points per axis for NASA POWER (default: POWER_GRID_SIZE).",
     )
     parser.add_argument(
         "--power-bbox",
@@ -58,70 +48,93 @@ def _parse_args():
         action="store_true",
         help="Override chlorophyll/flood with mock GEE raster values.",
     )
+    parser.add_argument(
+        "--n-samples",
+        type=int,
+        default=1200,
+        help="Number of synthetic training rows to generate.",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Generate the synthetic dataset with the vectorized columnar engine.",
+    )
+    parser.add_argument(
+        "--train-workers",
+        type=int,
+        default=TRAIN_WORKERS,
+        help="Worker processes for cross-validation and quantile fits.",
+    )
+    parser.add_argument(
+        "--selection",
+        choices=["full", "halving"],
+        help="Cross-validate every candidate, or use successive halving (default: MODEL_SELECTION).",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Write a cProfile dump of the run to PATH (snakeviz, or flameprof for a flame graph) "
+        "and per-stage timings to PATH.stages.json.",
+    )
     return parser.parse_args()
 
 
 def main():
-    os.makedirs(RESULTS_DIR, exist_ok=True)
-
-    dataset_bbox = DEFAULT_BBOX
     args = _parse_args()
-    env_use_nasa = os.getenv("USE_NASA_POWER", "false").lower() == "true"
-    use_nasa = args.use_nasa_power or env_use_nasa
-    use_gee_mock = args.use_gee_mock or GEE_MOCK_ENABLED
-    power_df = None
-    if use_nasa:
-        try:
-            cache_path = os.path.join(RESULTS_DIR, "nasa_power_cache.csv")
-            power_bbox = args.power_bbox
-            if power_bbox is None:
-                power_bbox = dataset_bbox if POWER_USE_DATASET_BBOX else POWER_BBOX
-            power_df = load_or_fetch_power_grid(
-                bbox=power_bbox,
-                start_date=POWER_START_DATE,
-                end_date=POWER_END_DATE,
-                grid_size=args.power_grid_size,
-                cache_path=cache_path,
-                allow_network=True,
-                verbose=True,
-            )
-            power_path = os.path.join(RESULTS_DIR, "nasa_power_sample.csv")
-            power_df.to_csv(power_path, index=False)
-            print(f"Saved NASA POWER sample: {power_path}")
-        except Exception as exc:
-            print(f"NASA POWER fetch failed, continuing with synthetic data: {exc}")
+    if not args.profile:
+        _run(args)
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        _run(args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        stages = stage_summary()
+        with open(f"{args.profile}.stages.json", "w", encoding="utf-8") as handle:
+            json.dump(stages, handle, indent=2)
+        print(f"Saved profile: {args.profile}")
+        print("Stage timings (count, total s, mean s):")
+        for stage, row in stages.items():
+            print(f"  {stage:<32} {row['count']:>8} {row['total_seconds']:>10.3f} {row['mean_seconds']:>10.4f}")
+
+
+def _run(args):
+    # Each stage (data, features, model, points, map, diagnostics) is reused
+    # from results/pipeline/ when its inputs, settings and code are unchanged.
+    from utils.pipeline import run_pipeline
+    from utils.storage import artifact_path, export_csv
+
+    options = {
+        "n_samples": args.n_samples,
+        "columnar": args.columnar,
+        "use_nasa_power": args.use_nasa_power,
+        "power_grid_size": args.power_grid_size,
+        "power_bbox": args.power_bbox,
+        "use_gee_mock": args.use_gee_mock,
+        "selection": args.selection,
+        "points": "sample",
+        "reports": True,
+    }
+    run_pipeline(options, workers=args.train_workers, verbose=True)
 
-    data = generate_synthetic_dataset(
-        n_samples=1200,
-        bbox=dataset_bbox,
-        power_df=power_df,
-        use_gee_mock=use_gee_mock,
-        gee_bbox=dataset_bbox,
-    )
     report_path = os.path.join(RESULTS_DIR, "model_report.json")
-    metrics, diagnostics = train_model(data, MODEL_PATH, report_path=report_path)
-
-    predictor = AquaSentinelPredictor(MODEL_PATH)
-    sample = data.sample(150, random_state=24).copy()
-    sample["risk_score"] = sample.apply(
-        lambda row: predictor.predict_risk(row["lat"], row["lon"], row["date"]),
-        axis=1,
-    )
-
+    with open(report_path, "r", encoding="utf-8") as handle:
+        metrics = json.load(handle)["metrics"]
+    points_path = artifact_path("risk_scored_points")
     csv_path = os.path.join(RESULTS_DIR, "risk_scored_points.csv")
-    sample.to_csv(csv_path, index=False)
-
-    map_path = os.path.join(RESULTS_DIR, "risk_map.html")
-    generate_risk_map(sample, map_path)
-
-    diagnostic_prefix = os.path.join(RESULTS_DIR, "model_diagnostics")
-    save_diagnostic_plots(diagnostics["y_test"], diagnostics["preds"], diagnostic_prefix)
+    if csv_path != points_path:
+        with open(csv_path, "wb") as handle:
+            export_csv(points_path, handle)
 
     print("Training metrics:")
     print(metrics)
+    print(f"Saved model: {MODEL_PATH}")
     print(f"Saved model report: {report_path}")
-    print(f"Saved scored points: {csv_path}")
-    print(f"Saved risk map: {map_path}")
+    print(f"Saved scored points: {points_path} (CSV export: {csv_path})")
+    print(f"Saved risk map: {os.path.join(RESULTS_DIR, 'risk_map.html')}")
 
 
 if __name__ == "__main__":
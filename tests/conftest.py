@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+# Settings are read at import time: keep artifacts, jobs and caches of the
+# test run out of the working results/ directory, and never start builds or
+# job workers behind the tests' back.
+os.environ["RESULTS_DIR"] = tempfile.mkdtemp(prefix="aqua-tests-")
+os.environ["JOB_WORKERS"] = "0"
+os.environ["ARTIFACTS_AUTO_BUILD"] = "false"
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def training_data():
+    from data.synthetic_data import generate_synthetic_dataset
+
+    return generate_synthetic_dataset(n_samples=600, n_locations=30, seed=7)
+
+
+@pytest.fixture(scope="session")
+def model_path(training_data, tmp_path_factory):
+    from models.model_train import train_model
+
+    path = str(tmp_path_factory.mktemp("model") / "risk_model.joblib")
+    train_model(training_data, path, workers=1, selection="halving")
+    return path
+
+
+@pytest.fixture
+def served_model(model_path):
+    # The test model installed where the web app serves it from, with a
+    # points table so require_artifacts() lets requests through.
+    import shutil
+
+    import pandas as pd
+
+    from config.settings import MODEL_PATH
+    from utils.storage import artifact_path, write_table
+
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    shutil.copy2(model_path, MODEL_PATH)
+    points = artifact_path("risk_scored_points")
+    if not os.path.exists(points):
+        write_table(pd.DataFrame({"lat": [0.0], "lon": [35.0], "date": ["2030-01-01"]}), points)
+    return MODEL_PATH
@@ -0,0 +1,128 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from asgi import AsyncMicroBatcher
+
+
+class _StrictPredictor:
+    # Fails any batch that contains an out-of-range latitude.
+    def __init__(self):
+        self.batch_calls = 0
+
+    def predict_batch(self, lats, lons, dates):
+        self.batch_calls += 1
+        lats = np.asarray(lats, dtype=float)
+        if (np.abs(lats) > 90).any():
+            raise ValueError("latitude out of range")
+        scores = lats + np.asarray(lons, dtype=float)
+        return scores, None, None
+
+    def predict_with_interval(self, lat, lon, date):
+        scores, _, _ = self.predict_batch([lat], [lon], [date])
+        return float(scores[0]), None, None
+
+
+def test_a_bad_row_fails_only_its_own_request():
+    predictor = _StrictPredictor()
+
+    async def score_all():
+        batcher = AsyncMicroBatcher(ThreadPoolExecutor(max_workers=1), window=0.05)
+        return await asyncio.gather(
+            batcher.score(predictor, 1.0, 2.0, "2023-01-01"),
+            batcher.score(predictor, 100.0, 2.0, "2023-01-01"),
+            batcher.score(predictor, 3.0, 4.0, "2023-01-01"),
+            return_exceptions=True,
+        ), batcher
+
+    results, batcher = asyncio.run(score_all())
+    assert batcher.batches == 1
+    assert results[0] == (3.0, None, None)
+    assert isinstance(results[1], ValueError)
+    assert results[2] == (7.0, None, None)
+
+
+def test_a_failing_batch_without_bad_rows_still_raises():
+    class _Broken(_StrictPredictor):
+        def predict_batch(self, lats, lons, dates):
+            raise RuntimeError("model unavailable")
+
+    async def score_one():
+        batcher = AsyncMicroBatcher(ThreadPoolExecutor(max_workers=1), window=0.01)
+        return await batcher.score(_Broken(), 1.0, 2.0, "2023-01-01")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(score_one())
+
+
+def test_score_misses_use_the_coordinate_sent(served_model):
+    import json
+
+    from api.endpoints import get_predictor
+    from asgi import app
+
+    query = {"lat": -1.2345678, "lon": 36.8765432, "date": "2023-03-01"}
+    messages = [{"type": "http.request", "body": json.dumps(query).encode(), "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/score", "headers": []}
+    asyncio.run(app(scope, receive, send))
+    body = json.loads(sent[1]["body"])
+    assert body["source"] == "model"
+    direct = get_predictor().predict_with_interval(query["lat"], query["lon"], query["date"])
+    assert body["score"] == direct[0]
+
+
+def test_streamed_batch_upload_is_scored_as_it_arrives(served_model):
+    import json
+
+    from asgi import app
+    from config.settings import BATCH_CHUNK_ROWS
+
+    def ndjson(rows):
+        return "".join(
+            json.dumps({"lat": 0.5, "lon": 32.5 + i * 1e-3, "date": "2023-03-01"}) + "\n"
+            for i in range(rows)
+        ).encode()
+
+    first_scores = asyncio.Event()
+    sent = []
+
+    async def receive_messages():
+        yield {"type": "http.request", "body": ndjson(BATCH_CHUNK_ROWS), "more_body": True}
+        # The rest of the upload only arrives once scores are coming back,
+        # which a server that reads the whole body first would never send.
+        await asyncio.wait_for(first_scores.wait(), timeout=30)
+        yield {"type": "http.request", "body": ndjson(10), "more_body": False}
+
+    messages = receive_messages()
+
+    async def receive():
+        return await messages.__anext__()
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and message["body"]:
+            first_scores.set()
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/score/batch",
+        "query_string": b"format=ndjson",
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    }
+    asyncio.run(app(scope, receive, send))
+    assert sent[0]["status"] == 200
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert len(rows) == BATCH_CHUNK_ROWS + 10
+    assert all(row["error"] is None for row in rows)
@@ -0,0 +1,57 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.batch_scoring import ROW_ERROR, iter_csv_chunks, iter_ndjson_chunks, stream_scores
+
+
+class _SumPredictor:
+    def predict_batch(self, lats, lons, dates):
+        scores = np.asarray(lats, dtype=float) + np.asarray(lons, dtype=float)
+        return scores, scores - 1, scores + 1
+
+
+def test_bad_rows_in_later_chunks_get_row_errors():
+    body = "lat,lon,date\n1,2,2023-01-01\n3,4,2023-01-02\nx,4,2023-01-02\n5,6,01/02/2023\n7,8,\n"
+    chunks = iter_csv_chunks(io.StringIO(body), chunk_rows=2)
+    out = pd.read_csv(io.StringIO("".join(stream_scores(_SumPredictor(), chunks))))
+
+    assert list(out["score"][:2]) == [3.0, 7.0]
+    assert out["score"][2:4].isna().all()
+    assert list(out["error"][2:4]) == [ROW_ERROR, ROW_ERROR]
+    # A missing date defaults to today.
+    assert out["score"][4] == 15.0
+    assert out["error"][:2].isna().all()
+
+
+def test_later_chunks_missing_columns_are_row_errors():
+    chunks = iter([pd.DataFrame({"lat": [1.0], "lon": [2.0]}), pd.DataFrame({"lat": [3.0]})])
+    lines = "".join(stream_scores(_SumPredictor(), chunks, "ndjson")).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records[0]["score"] == 3.0
+    assert records[1]["score"] is None
+    assert records[1]["error"] == ROW_ERROR
+
+
+def test_unreadable_ndjson_ends_with_an_error_record():
+    body = '{"lat": 1, "lon": 2}\n' * 3 + "{broken\n"
+    chunks = iter_ndjson_chunks(io.StringIO(body), chunk_rows=2)
+    lines = "".join(stream_scores(_SumPredictor(), chunks, "ndjson")).splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[-1])["error"].startswith("Batch stopped after 2 rows")
+
+
+def test_unreadable_csv_aborts_the_stream():
+    body = 'lat,lon\n1,2\n3,4\n"5,6\n'
+    body_chunks = stream_scores(_SumPredictor(), iter_csv_chunks(io.StringIO(body), chunk_rows=2))
+    assert next(body_chunks).startswith("lat,lon")
+    with pytest.raises(ValueError):
+        next(body_chunks)
+
+
+def test_missing_columns_in_the_first_chunk_raise():
+    with pytest.raises(ValueError):
+        stream_scores(_SumPredictor(), iter([pd.DataFrame({"lat": [1.0]})]))
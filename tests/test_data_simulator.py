@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import data_simulator
+from utils.data_simulator import simulate_features, simulate_features_batch
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(5)
+    lats = rng.uniform(-30, 30, 300)
+    lons = rng.uniform(-20, 50, 300)
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1500, 300), unit="D")
+    # Leap days and year ends exercise the day-of-year season table.
+    dates = list(dates.strftime("%Y-%m-%d")) + ["2020-02-29", "2020-12-31", "2023-12-31"]
+    lats = np.append(lats, [0.0, -12.34565, 45.0])
+    lons = np.append(lons, [0.0, 98.76545, -179.99])
+    return lats, lons, dates
+
+
+def _assert_matches_scalar(batch, lats, lons, dates):
+    for pos, (lat, lon, date) in enumerate(zip(lats, lons, dates)):
+        expected = simulate_features(float(lat), float(lon), date)
+        for name, value in expected.items():
+            # Bit for bit, not approximately.
+            assert batch[name][pos] == value, (name, lat, lon, date)
+
+
+def test_batch_equals_scalar_bit_for_bit(points):
+    lats, lons, dates = points
+    _assert_matches_scalar(simulate_features_batch(lats, lons, dates), lats, lons, dates)
+
+
+def test_chunking_does_not_change_results(points):
+    lats, lons, dates = points
+    whole = simulate_features_batch(lats, lons, dates)
+    chunked = simulate_features_batch(lats, lons, dates, chunk_size=7)
+    for name in whole:
+        assert np.array_equal(whole[name], chunked[name])
+
+
+def test_per_seed_fallback_equals_vectorized_generator(points, monkeypatch):
+    lats, lons, dates = points
+    monkeypatch.setattr(data_simulator, "_vectorized_rng_matches", lambda: False)
+    _assert_matches_scalar(
+        simulate_features_batch(lats[:40], lons[:40], dates[:40]), lats[:40], lons[:40], dates[:40]
+    )
+
+
+def test_single_date_is_broadcast():
+    batch = simulate_features_batch([1.0, 2.0], [3.0, 4.0], "2022-05-01")
+    assert batch["sst"][1] == simulate_features(2.0, 4.0, "2022-05-01")["sst"]
+    with pytest.raises(ValueError):
+        simulate_features_batch([1.0, 2.0], [3.0], "2022-05-01")
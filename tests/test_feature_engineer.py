@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.synthetic_data import generate_synthetic_dataset
+from utils.feature_engineer import build_feature_frame, update_feature_frame
+
+
+LEGACY_WINDOWS = {
+    "precip_7d_mean": ("precip", lambda s: s.rolling(7, min_periods=1).mean()),
+    "precip_14d_sum": ("precip", lambda s: s.rolling(14, min_periods=1).sum()),
+    "sst_7d_mean": ("sst", lambda s: s.rolling(7, min_periods=1).mean()),
+    "chlor_a_7d_mean": ("chlor_a", lambda s: s.rolling(7, min_periods=1).mean()),
+    "flood_3d_max": ("flood_inundation", lambda s: s.rolling(3, min_periods=1).max()),
+    "drought_30d_mean": ("drought_index", lambda s: s.rolling(30, min_periods=1).mean()),
+}
+
+
+def _legacy_windows(engineered):
+    # The per-group rolling transforms the vectorized engine replaced.
+    grouped = engineered.groupby(["lat_bin", "lon_bin"], sort=False)
+    out = {col: grouped[source].transform(roll) for col, (source, roll) in LEGACY_WINDOWS.items()}
+    for col in out:
+        out[col] = out[col].fillna(out[col].mean())
+    return out
+
+
+def _unique_days(df):
+    # One row per cell and day, so the sorted order (and every window) is
+    # fully determined.
+    keys = [df["lat"].round(1), df["lon"].round(1), pd.to_datetime(df["date"])]
+    return df[~pd.concat(keys, axis=1).duplicated()].reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    data = generate_synthetic_dataset(n_samples=1500, n_locations=25, seed=21)
+    return _unique_days(data)
+
+
+def test_vectorized_windows_equal_legacy_groupby(dataset):
+    data = dataset.copy()
+    # Gaps in the drivers: partial windows skip them, empty ones are filled.
+    data.loc[data.index[::17], "precip"] = np.nan
+    data.loc[data.index[::5], "flood_inundation"] = np.nan
+    engineered, _ = build_feature_frame(data)
+    legacy = _legacy_windows(engineered)
+    for col, values in legacy.items():
+        np.testing.assert_allclose(engineered[col], values, rtol=1e-12, atol=1e-12, err_msg=col)
+
+
+def test_update_equals_full_rebuild(dataset):
+    dates = pd.to_datetime(dataset["date"])
+    cutoff = dates.quantile(0.7)
+    old = dataset[dates <= cutoff]
+    new = dataset[dates > cutoff]
+    # A late-arriving day inside existing history is recomputed as well.
+    late = old.sample(20, random_state=3)
+    old = old.drop(index=late.index)
+    new = pd.concat([new, late])
+
+    engineered, feature_cols = build_feature_frame(old)
+    updated, updated_cols = update_feature_frame(engineered, new)
+    rebuilt, _ = build_feature_frame(pd.concat([old, new]))
+
+    assert updated_cols == feature_cols
+    assert len(updated) == len(rebuilt)
+    columns = ["lat_bin", "lon_bin", "date"] + feature_cols
+    pd.testing.assert_frame_equal(
+        updated[columns].reset_index(drop=True),
+        rebuilt[columns].reset_index(drop=True),
+        check_exact=False,
+        rtol=1e-12,
+    )
+
+
+def test_update_with_no_rows_is_a_no_op(dataset):
+    engineered, _ = build_feature_frame(dataset)
+    updated, _ = update_feature_frame(engineered, dataset.iloc[:0])
+    assert updated is engineered
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.feature_store import SOURCES, FeatureStore, drivers_frame
+
+
+def _frame(lats, lons, date, value=1.0):
+    frame = pd.DataFrame({"lat": lats, "lon": lons, "date": pd.Timestamp(date)})
+    for source in SOURCES:
+        frame[source] = value
+    return frame
+
+
+def test_least_recently_used_cells_are_evicted():
+    store = FeatureStore(backfill=True, max_cells=3)
+    for lat in (0.0, 1.0, 2.0):
+        store.window_features(_frame([lat], [0.0], "2023-01-10"))
+    store.window_features(_frame([0.0], [0.0], "2023-01-10"))
+    store.window_features(_frame([3.0], [0.0], "2023-01-10"))
+
+    assert len(store) == 3
+    assert store.evicted == 1
+    assert set(store._index) == {(0.0, 0.0), (2.0, 0.0), (3.0, 0.0)}
+
+
+def test_one_call_may_exceed_the_cap():
+    store = FeatureStore(backfill=True, max_cells=2)
+    store.window_features(_frame([0.0, 1.0, 2.0], [0.0] * 3, "2023-01-10"))
+    assert len(store) == 3
+    store.window_features(_frame([5.0], [0.0], "2023-01-10"))
+    assert len(store) == 3
+
+
+def test_observed_drivers_win_over_backfill():
+    store = FeatureStore(backfill=True)
+    query = _frame([0.0], [0.0], "2023-01-10")
+    backfilled = store.window_features(query)
+    version = store.version
+
+    store.ingest(_frame([0.02], [0.01], "2023-01-09", value=1000.0))
+    assert store.version > version
+    observed = store.window_features(query)
+    assert observed["precip_14d_sum"][0] != backfilled["precip_14d_sum"][0]
+
+    # A backfill of the same day does not overwrite the observation.
+    store._write(np.array([0]), np.array([store._days[0].max()]), np.zeros((1, len(SOURCES))))
+    assert store.window_features(query)["precip_14d_sum"][0] == observed["precip_14d_sum"][0]
+
+
+def test_save_merges_concurrent_writers(tmp_path):
+    path = str(tmp_path / "store.npz")
+    first = FeatureStore.open(path)
+    second = FeatureStore.open(path)
+    first.ingest(_frame([1.0], [1.0], "2023-01-09", value=5.0))
+    second.ingest(_frame([2.0], [2.0], "2023-01-09", value=7.0))
+    first.save()
+    second.save()
+
+    # second took in first's observations, and the file holds both.
+    assert (1.0, 1.0) in second._index
+    reopened = FeatureStore.open(path)
+    assert {(1.0, 1.0), (2.0, 2.0)} <= set(reopened._index)
+    assert reopened._observed.any()
+
+
+def test_drivers_frame_validates_records():
+    frame = drivers_frame([{"lat": 1, "lon": 2, "date": "2023-01-01", "precip": 3.5}])
+    assert list(frame.columns) == ["lat", "lon", "date", *SOURCES]
+    assert frame["precip"][0] == 3.5
+    assert np.isnan(frame["sst"][0])
+    with pytest.raises(ValueError):
+        drivers_frame([{"lat": 1, "lon": 2, "date": "01/02/2023", "precip": 1}])
+    with pytest.raises(ValueError):
+        drivers_frame([{"lat": 1, "lon": 2, "date": "2023-01-01"}])
+    with pytest.raises(ValueError):
+        drivers_frame({"lat": 1})
+
+
+def test_fingerprint_compares_observed_drivers_across_stores():
+    first = FeatureStore(backfill=True)
+    second = FeatureStore(backfill=True)
+    # Different backfilled cells and ingest order, same observations.
+    first.window_features(_frame([3.0], [3.0], "2023-01-10"))
+    first.ingest(_frame([1.0], [1.0], "2023-01-09", value=5.0))
+    first.ingest(_frame([2.0], [2.0], "2023-01-09", value=7.0))
+    second.ingest(_frame([2.0], [2.0], "2023-01-09", value=7.0))
+    second.ingest(_frame([1.0], [1.0], "2023-01-09", value=5.0))
+    assert first.fingerprint() == second.fingerprint()
+
+    second.ingest(_frame([1.0], [1.0], "2023-01-09", value=6.0))
+    assert first.fingerprint() != second.fingerprint()
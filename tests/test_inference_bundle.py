@@ -0,0 +1,126 @@
+import shutil
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from models.inference_bundle import (
+    BUNDLE_FORMAT,
+    bundle_path_for,
+    compile_bundle,
+    ensure_bundle,
+    load_bundle,
+)
+from models.model_train import (
+    _HAS_XGBOOST,
+    XGBRegressor,
+    _fit_calibration,
+    _quantile_model,
+    _save_model,
+)
+from predictor.aqua_predictor import AquaSentinelPredictor
+from utils.feature_engineer import build_feature_frame
+
+
+FAMILIES = {
+    "linear_regression": lambda: LinearRegression(),
+    "gradient_boosting": lambda: GradientBoostingRegressor(n_estimators=30, random_state=42),
+    "random_forest": lambda: RandomForestRegressor(n_estimators=15, max_depth=8, random_state=42),
+}
+if _HAS_XGBOOST:
+    FAMILIES["xgboost"] = lambda: XGBRegressor(n_estimators=30, max_depth=4, random_state=42)
+
+
+@pytest.fixture(scope="module")
+def features(training_data):
+    engineered, feature_cols = build_feature_frame(training_data)
+    return engineered[feature_cols], engineered["risk_score"]
+
+
+def _payload(family, X, y):
+    model = FAMILIES[family]().fit(X, y)
+    lower = _quantile_model(0.1).set_params(n_estimators=20).fit(X, y)
+    upper = _quantile_model(0.9).set_params(n_estimators=20).fit(X, y)
+    return {
+        "model": model,
+        "calibrator": _fit_calibration(y, model.predict(X)),
+        "lower_model": lower,
+        "upper_model": upper,
+        "feature_cols": list(X.columns),
+    }
+
+
+def _expected(payload, X):
+    scores = payload["calibrator"].predict(payload["model"].predict(X).reshape(-1, 1))
+    return np.clip(np.column_stack([
+        scores, payload["lower_model"].predict(X), payload["upper_model"].predict(X)
+    ]), 0.0, 100.0)
+
+
+@pytest.mark.parametrize("family", sorted(FAMILIES))
+def test_bundle_matches_the_estimators(features, family, tmp_path):
+    X, y = features
+    payload = _payload(family, X, y)
+    model_path = str(tmp_path / "model.joblib")
+    _save_model(payload, model_path)
+    bundle = load_bundle(bundle_path_for(model_path), model_path)
+    assert bundle is not None
+
+    # XGBoost itself sums its trees in float32.
+    rtol = 1e-6 if family == "xgboost" else 1e-9
+    expected = _expected(payload, X)
+    np.testing.assert_allclose(bundle.predict(X.to_numpy(dtype=float)), expected, rtol=rtol, atol=1e-9)
+
+    if family in ("random_forest", "xgboost"):
+        # Missing values take the same branch as in the estimator.
+        holes = X.copy()
+        holes.iloc[::3, 2] = np.nan
+        holes.iloc[::4, 5] = np.nan
+        scores = payload["calibrator"].predict(payload["model"].predict(holes).reshape(-1, 1))
+        np.testing.assert_allclose(
+            bundle.predict(holes.to_numpy(dtype=float))[:, 0],
+            np.clip(scores, 0.0, 100.0),
+            rtol=rtol,
+            atol=1e-9,
+        )
+
+
+def test_predictor_scores_alike_with_and_without_bundle(model_path):
+    bundled = AquaSentinelPredictor(model_path)
+    plain = AquaSentinelPredictor(model_path, use_bundle=False)
+    assert bundled.bundle is not None and plain.bundle is None
+    rng = np.random.default_rng(4)
+    lats, lons = rng.uniform(-10, 10, 200), rng.uniform(25, 45, 200)
+    for got, want in zip(
+        bundled.predict_batch(lats, lons, "2023-04-01"), plain.predict_batch(lats, lons, "2023-04-01")
+    ):
+        np.testing.assert_allclose(got, want, rtol=1e-9, atol=1e-9)
+
+
+def test_bundle_follows_model_content_not_mtime(model_path, tmp_path):
+    copy_path = str(tmp_path / "copy.joblib")
+    shutil.copy(model_path, copy_path)
+    shutil.copytree(bundle_path_for(model_path), bundle_path_for(copy_path))
+    # A copy with a new mtime keeps its bundle.
+    assert load_bundle(bundle_path_for(copy_path), copy_path) is not None
+
+    # Another model's bundle is stale, and ensure_bundle recompiles it.
+    payload = joblib.load(model_path)
+    payload["calibrator"].intercept_ += 1.0
+    joblib.dump(payload, copy_path)
+    assert load_bundle(bundle_path_for(copy_path), copy_path) is None
+    assert ensure_bundle(copy_path) == bundle_path_for(copy_path)
+    recompiled = load_bundle(bundle_path_for(copy_path), copy_path)
+    original = load_bundle(bundle_path_for(model_path), model_path)
+    assert recompiled.meta["format"] == BUNDLE_FORMAT
+    assert recompiled.base[0] == pytest.approx(original.base[0] + 1.0)
+
+
+def test_unsupported_models_have_no_bundle(features):
+    from sklearn.neighbors import KNeighborsRegressor
+
+    X, y = features
+    with pytest.raises(ValueError):
+        compile_bundle({"model": KNeighborsRegressor().fit(X, y), "feature_cols": list(X.columns)})
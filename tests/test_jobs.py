@@ -0,0 +1,115 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import signal
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.jobs import JobStore, run_job
+
+
+class _Predictor:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def predict_batch(self, lats, lons, dates):
+        time.sleep(self.delay)
+        scores = np.asarray(lats, dtype=float) * 10 + np.asarray(lons, dtype=float)
+        return scores, scores - 1, scores + 1
+
+
+def _csv_body(rows=120):
+    lines = ["lat,lon,date"] + [f"{i / 10:.1f},{i % 7},2023-01-{i % 28 + 1:02d}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _submit(store, fmt):
+    return store.submit("text/csv", {}, io.BytesIO(_csv_body()), lambda: None, output_format=fmt)
+
+
+def _work_slowly(db_path, jobs_dir):
+    store = JobStore(db_path, jobs_dir)
+    job = store.claim("doomed")
+    run_job(store, job, _Predictor(delay=0.2), "doomed", chunk_rows=10)
+
+
+def _read(path, fmt):
+    with open(path, "rb") as handle:
+        data = handle.read()
+    if fmt == "csv":
+        return pd.read_csv(io.BytesIO(data))
+    return pd.read_json(io.BytesIO(data), lines=True)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_killed_job_resumes_from_its_checkpoint(tmp_path, fmt):
+    db_path, jobs_dir = str(tmp_path / "jobs.sqlite"), str(tmp_path / "jobs")
+    store = JobStore(db_path, jobs_dir, stale_seconds=0)
+    job = _submit(store, fmt)
+
+    worker = multiprocessing.get_context("fork").Process(target=_work_slowly, args=(db_path, jobs_dir))
+    worker.start()
+    deadline = time.time() + 30
+    while store.get(job["id"])["rows_done"] < 30 and time.time() < deadline:
+        time.sleep(0.02)
+    os.kill(worker.pid, signal.SIGKILL)
+    worker.join()
+
+    checkpoint = store.get(job["id"])
+    assert checkpoint["status"] == "running"
+    assert 30 <= checkpoint["rows_done"] < 120
+    # A chunk written after the last checkpoint is cut off on resume.
+    with open(store.output_path(checkpoint), "ab") as handle:
+        handle.write(b"partial chunk that was never checkpointed\n")
+
+    assert store.requeue_stale() == 1
+    resumed = store.claim("rescuer")
+    assert resumed["rows_done"] == checkpoint["rows_done"]
+    assert run_job(store, resumed, _Predictor(), "rescuer", chunk_rows=10)
+    assert store.get(job["id"])["status"] == "done"
+
+    reference_store = JobStore(str(tmp_path / "ref.sqlite"), str(tmp_path / "ref"))
+    reference = _submit(reference_store, fmt)
+    run_job(reference_store, reference_store.claim("once"), _Predictor(), "once", chunk_rows=10)
+    resumed_out = _read(store.output_path(job), fmt)
+    assert len(resumed_out) == 120
+    pd.testing.assert_frame_equal(resumed_out, _read(reference_store.output_path(reference), fmt))
+
+
+def test_a_job_taken_over_stops_writing(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), str(tmp_path / "jobs"), stale_seconds=0)
+    job = _submit(store, "csv")
+    claimed = store.claim("first")
+    store.requeue_stale()
+    store.claim("second")
+    assert not run_job(store, claimed, _Predictor(), "first", chunk_rows=10)
+    assert store.get(job["id"])["rows_done"] == 0
+
+
+def test_job_workers_start_from_serving_entrypoints_only(monkeypatch):
+    import asgi
+    import webapp
+
+    started = []
+    monkeypatch.setattr(webapp, "start_job_workers", lambda: started.append("webapp"))
+    monkeypatch.setattr(asgi, "start_job_workers", lambda: started.append("asgi"))
+    webapp.create_app()
+    assert started == []
+
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    app = asgi.AsgiApp(webapp.create_app())
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+    assert started == ["asgi"]
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
@@ -0,0 +1,117 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from data.synthetic_data import generate_synthetic_dataset
+from models.inference_bundle import bundle_path_for, load_bundle
+from models.model_train import (
+    _HAS_XGBOOST,
+    XGBRegressor,
+    _feature_stats,
+    _fit_calibration,
+    _linear_stats,
+    _merge_feature_stats,
+    _save_model,
+    update_model,
+)
+from predictor.aqua_predictor import AquaSentinelPredictor
+from utils.feature_engineer import build_feature_frame
+
+
+CUTOFF = "2022-06-30"
+
+FAMILIES = {
+    "linear_regression": lambda: LinearRegression(),
+    "gradient_boosting": lambda: GradientBoostingRegressor(n_estimators=20, random_state=42),
+    "random_forest": lambda: RandomForestRegressor(n_estimators=20, max_depth=6, random_state=42),
+}
+if _HAS_XGBOOST:
+    FAMILIES["xgboost"] = lambda: XGBRegressor(n_estimators=20, max_depth=3, random_state=42)
+
+
+@pytest.fixture(scope="module")
+def history():
+    return generate_synthetic_dataset(n_samples=500, n_locations=20, seed=11, end_date="2022-12-31")
+
+
+def _train(history, family, model_path):
+    engineered, feature_cols = build_feature_frame(history)
+    train = engineered[engineered["date"] <= pd.Timestamp(CUTOFF)]
+    X, y = train[feature_cols], train["risk_score"]
+    model = FAMILIES[family]().fit(X, y)
+    payload = {
+        "model": model,
+        "calibrator": _fit_calibration(y, model.predict(X)),
+        "lower_model": None,
+        "upper_model": None,
+        "feature_cols": feature_cols,
+        "trained_through": CUTOFF,
+        "n_train_rows": len(X),
+        "feature_stats": _feature_stats(X),
+        "linear_stats": _linear_stats(X, y) if family == "linear_regression" else None,
+        "updates": [],
+    }
+    _save_model(payload, model_path)
+    return payload
+
+
+@pytest.mark.parametrize("family", sorted(FAMILIES))
+def test_update_model_continues_each_family(history, family, tmp_path):
+    model_path = str(tmp_path / "model.joblib")
+    before = _train(history, family, model_path)
+    old = AquaSentinelPredictor(model_path)
+    old_scores = old.predict_batch([1.0, -3.2], [33.0, 30.1], "2022-12-01")[0]
+
+    result = update_model(history, model_path)
+
+    assert result["updated"]
+    assert result["new_rows"] == int((pd.to_datetime(history["date"]) > CUTOFF).sum())
+    after = joblib.load(model_path)
+    assert after["trained_through"] > CUTOFF
+    assert after["n_train_rows"] == before["n_train_rows"] + result["fit_rows"]
+    assert after["n_fit_rows"] == before["n_train_rows"] + result["fit_rows"]
+    if after["linear_stats"] is not None:
+        # The intercept column's sum of squares counts the rows fit on.
+        assert after["linear_stats"]["xtx"][-1, -1] == after["n_fit_rows"]
+    assert after["feature_stats"] != before["feature_stats"]
+    assert len(after["updates"]) == 1
+
+    # The bundle matches the updated model and both score alike.
+    assert load_bundle(bundle_path_for(model_path), model_path) is not None
+    bundled = AquaSentinelPredictor(model_path)
+    plain = AquaSentinelPredictor(model_path, use_bundle=False)
+    new_scores = bundled.predict_batch([1.0, -3.2], [33.0, 30.1], "2022-12-01")[0]
+    assert np.allclose(new_scores, plain.predict_batch([1.0, -3.2], [33.0, 30.1], "2022-12-01")[0])
+    assert bundled.version != old.version
+    assert not np.array_equal(new_scores, old_scores)
+
+
+def test_pooled_feature_stats_equal_stats_of_all_rows():
+    rng = np.random.default_rng(0)
+    old = pd.DataFrame({"a": rng.normal(3, 2, 400), "b": rng.normal(0, 1, 400)})
+    new = pd.DataFrame({"a": rng.normal(5, 1, 90), "b": rng.normal(1, 3, 90)})
+    pooled = _merge_feature_stats(_feature_stats(old), new, len(old))
+    expected = _feature_stats(pd.concat([old, new]))
+    for stat in ("mean", "std"):
+        for col in ("a", "b"):
+            assert pooled[stat][col] == pytest.approx(expected[stat][col], rel=1e-12)
+
+
+def test_no_new_rows_leaves_the_model(history, tmp_path):
+    model_path = str(tmp_path / "model.joblib")
+    _train(history, "random_forest", model_path)
+    with open(model_path, "rb") as handle:
+        original = handle.read()
+    result = update_model(history, model_path, since="2030-01-01")
+    assert not result["updated"]
+    with open(model_path, "rb") as handle:
+        assert handle.read() == original
+
+
+def test_payload_counts_the_rows_each_part_was_fit_on(model_path):
+    payload = joblib.load(model_path)
+    calibration_rows = int(np.ceil(0.2 * payload["n_train_rows"]))
+    assert payload["n_fit_rows"] == payload["n_train_rows"] - calibration_rows
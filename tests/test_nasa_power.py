@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+from data import nasa_power
+
+
+class _PowerStub:
+    # A local stand-in for the POWER daily point API. ``script`` holds what
+    # the next requests get: an HTTP status to fail with, "slow" to stall
+    # past the client timeout, or nothing to answer normally.
+    def __init__(self):
+        self.requests = []
+        self.script = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                stub.requests.append(query)
+                action = stub.script.pop(0) if stub.script else None
+                if action == "slow":
+                    time.sleep(0.5)
+                    action = None
+                if isinstance(action, int):
+                    self.send_response(action)
+                    self.end_headers()
+                    return
+                body = json.dumps(_payload(query)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/temporal/daily/point"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def ranges(self):
+        return [(query["start"], query["end"]) for query in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _payload(query):
+    days = pd.date_range(query["start"], query["end"], freq="D")
+    lat = float(query["latitude"])
+    return {
+        "properties": {
+            "parameter": {
+                name: {day.strftime("%Y%m%d"): round(lat + offset + day.dayofyear, 2) for day in days}
+                for offset, name in enumerate(query["parameters"].split(","))
+            }
+        }
+    }
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = _PowerStub()
+    # What POWER_BASE_URL=<stub> in the environment sets at import time.
+    monkeypatch.setattr(nasa_power, "POWER_BASE_URL", server.url)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(nasa_power, "time", types.SimpleNamespace(sleep=delays.append))
+    return delays
+
+
+def test_retries_429_and_5xx_with_exponential_backoff(stub, sleeps):
+    stub.script = [429, 503, 500]
+    frame = nasa_power.fetch_power_data(
+        1.0, 32.0, "2023-01-01", "2023-01-03", allow_network=True, retries=3, backoff=0.1
+    )
+    assert len(stub.requests) == 4
+    assert sleeps == [0.1, 0.2, 0.4]
+    assert list(frame.columns) == ["date", "air_temp", "precip"]
+    assert len(frame) == 3
+
+
+def test_gives_up_after_the_last_retry(stub, sleeps):
+    stub.script = [503, 503, 503]
+    with pytest.raises(HTTPError) as raised:
+        nasa_power.fetch_power_data(
+            1.0, 32.0, "2023-01-01", "2023-01-03", allow_network=True, retries=2, backoff=0.1
+        )
+    assert raised.value.code == 503
+    assert len(stub.requests) == 3
+    assert sleeps == [0.1, 0.2]
+
+
+def test_client_errors_are_not_retried(stub, sleeps):
+    stub.script = [404]
+    with pytest.raises(HTTPError):
+        nasa_power.fetch_power_data(1.0, 32.0, "2023-01-01", "2023-01-03", allow_network=True)
+    assert len(stub.requests) == 1
+    assert sleeps == []
+
+
+def test_retries_timeouts(stub, sleeps):
+    stub.script = ["slow"]
+    frame = nasa_power.fetch_power_data(
+        1.0, 32.0, "2023-01-01", "2023-01-02", allow_network=True, backoff=0.1, timeout=0.1
+    )
+    assert len(stub.requests) == 2
+    assert sleeps == [0.1]
+    assert len(frame) == 2
+
+
+def test_partial_tile_cache_hit_fetches_only_missing_days(stub, tmp_path):
+    cache = nasa_power.PowerTileCache(str(tmp_path / "tiles"))
+    for start, end in (("2023-01-01", "2023-01-05"), ("2023-01-10", "2023-01-12")):
+        nasa_power.fetch_power_point(1.0, 32.0, start, end, cache=cache, allow_network=True)
+    assert stub.ranges() == [("20230101", "20230105"), ("20230110", "20230112")]
+
+    frame = nasa_power.fetch_power_point(
+        1.0, 32.0, "2023-01-01", "2023-01-15", cache=cache, allow_network=True
+    )
+    assert stub.ranges()[2:] == [("20230106", "20230109"), ("20230113", "20230115")]
+    assert len(frame) == 15
+    assert not frame[["air_temp", "precip"]].isna().any().any()
+    # A fully cached range makes no request, and the pieced-together days
+    # equal one direct fetch.
+    cached = nasa_power.fetch_power_point(
+        1.0, 32.0, "2023-01-03", "2023-01-14", cache=cache, allow_network=True
+    )
+    assert len(stub.requests) == 4
+    direct = nasa_power.fetch_power_data(1.0, 32.0, "2023-01-01", "2023-01-15", allow_network=True)
+    assert frame["air_temp"].tolist() == direct["air_temp"].tolist()
+    assert cached["precip"].tolist() == direct["precip"].tolist()[2:14]
+
+
+def test_grid_cache_is_reused_only_for_the_same_key(stub, tmp_path):
+    bbox = {"lat_min": 0.0, "lat_max": 1.0, "lon_min": 30.0, "lon_max": 31.0}
+    cache_path = str(tmp_path / "power_grid.parquet")
+    tiles = str(tmp_path / "tiles")
+
+    def load(end_date="2023-01-05", grid_size=2, parameters=None):
+        return nasa_power.load_or_fetch_power_grid(
+            bbox, "2023-01-01", end_date, grid_size, cache_path,
+            allow_network=True, verbose=False, cache_dir=tiles, max_workers=2,
+            parameters=parameters,
+        )
+
+    first = load()
+    assert len(stub.requests) == 4
+    assert len(first) == 4 * 5
+
+    # Same key: served from the combined file, no requests.
+    again = load()
+    assert len(stub.requests) == 4
+    pd.testing.assert_frame_equal(again, first)
+
+    # Later end date: the key differs, and only the new days are fetched.
+    longer = load(end_date="2023-01-07")
+    assert len(longer) == 4 * 7
+    assert sorted(set(stub.ranges()[4:])) == [("20230106", "20230107")]
+    with open(f"{cache_path}.meta.json", encoding="utf-8") as handle:
+        assert json.load(handle)["end_date"] == "20230107"
+
+    # Other parameters: a new key, rebuilt from the tiles already on disk.
+    rain_only = load(end_date="2023-01-07", parameters=["PRECTOT"])
+    assert "air_temp" not in rain_only
+    assert rain_only["precip"].tolist() == longer["precip"].tolist()
+    assert len(stub.requests) == 8
+    with open(f"{cache_path}.meta.json", encoding="utf-8") as handle:
+        assert json.load(handle)["parameters"] == ["PRECTOT"]
@@ -0,0 +1,46 @@
+import os
+import shutil
+
+import pytest
+
+from config.settings import MODEL_PATH
+from utils.pipeline import _build_points
+from utils.storage import artifact_path, storage_format
+
+
+def test_published_points_match_online_scores(model_path, tmp_path):
+    model_dir = tmp_path / "model"
+    points_dir = tmp_path / "points"
+    model_dir.mkdir()
+    points_dir.mkdir()
+    shutil.copy2(model_path, model_dir / "model.joblib")
+    fmt = storage_format()
+    _build_points({"model": str(model_dir)}, str(points_dir), {
+        "source": "synthetic",
+        "n_samples": 40,
+        "n_locations": 8,
+        "samples_per_location": 5,
+        "seed": 3,
+        "use_gee_mock": False,
+        "intervals": True,
+        "format": fmt,
+        "feature_store": True,
+        "feature_store_backfill": True,
+    })
+
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    shutil.copy2(model_path, MODEL_PATH)
+    shutil.copy2(points_dir / f"points.{fmt}", artifact_path("risk_scored_points"))
+    from webapp import create_app
+
+    client = create_app().test_client()
+    points = client.get("/api/points").get_json()
+    assert len(points) == 40
+    for point in points[:10]:
+        response = client.post("/api/score", json={
+            "lat": point["lat"], "lon": point["lon"], "date": point["date"][:10],
+        })
+        body = response.get_json()
+        assert body["source"] == "model"
+        assert body["score"] == pytest.approx(point["risk_score"], abs=1e-9)
+        assert body["interval_lower"] == pytest.approx(point["interval_lower"], abs=1e-9)
@@ -0,0 +1,85 @@
+from predictor.aqua_predictor import AquaSentinelPredictor
+from utils.feature_store import FeatureStore
+from utils.prediction_cache import PredictionCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _CountingPredictor:
+    def __init__(self, version, feature_store=None):
+        self.version = version
+        self.feature_store = feature_store
+        self.calls = 0
+
+    def predict_with_interval(self, lat, lon, date):
+        self.calls += 1
+        return (lat + lon, None, None)
+
+
+def test_entries_expire_after_ttl():
+    clock = _Clock()
+    cache = PredictionCache(maxsize=8, ttl=10, clock=clock)
+    predictor = _CountingPredictor("a")
+
+    cache.predict_with_interval(predictor, 1.0, 2.0, "2023-01-01")
+    clock.now = 9.0
+    cache.predict_with_interval(predictor, 1.0, 2.0, "2023-01-01")
+    assert predictor.calls == 1
+
+    clock.now = 10.5
+    cache.predict_with_interval(predictor, 1.0, 2.0, "2023-01-01")
+    assert predictor.calls == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_model_change_invalidates_entries():
+    cache = PredictionCache(maxsize=8, ttl=60)
+    old = _CountingPredictor("a")
+    cache.predict_with_interval(old, 1.0, 2.0, "2023-01-01")
+    assert cache.stats()["size"] == 1
+
+    new = _CountingPredictor("b")
+    cache.predict_with_interval(new, 1.0, 2.0, "2023-01-01")
+    assert new.calls == 1
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["size"] == 1
+    assert cache.stats()["model_version"] == "b"
+
+    # A late write computed with the old model is dropped.
+    cache.put(cache.key(old, 3.0, 4.0, "2023-01-01"), (0.0, None, None))
+    assert cache.stats()["size"] == 1
+
+
+def test_feature_store_update_invalidates_entries():
+    store = FeatureStore(backfill=False)
+    predictor = _CountingPredictor("a", feature_store=store)
+    cache = PredictionCache(maxsize=8, ttl=60)
+    cache.predict_with_interval(predictor, 1.0, 2.0, "2023-01-01")
+    store.version += 1
+    cache.predict_with_interval(predictor, 1.0, 2.0, "2023-01-01")
+    assert predictor.calls == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_misses_score_the_coordinate_sent(model_path):
+    predictor = AquaSentinelPredictor(model_path)
+    cache = PredictionCache(maxsize=64, ttl=60)
+    lat, lon, date = -1.2345678, 36.8765432, "2023-03-01"
+    direct = predictor.predict_with_interval(lat, lon, date)
+    assert cache.predict_with_interval(predictor, lat, lon, date) == direct
+    # The model sees the caller's coordinate, not the bucket's.
+    assert direct != predictor.predict_with_interval(round(lat, 4), round(lon, 4), date)
+
+    # A neighbour in the same bucket is served the first answer, which is
+    # within 1e-3 of its own score.
+    neighbour = (-1.2345702, 36.8765449)
+    assert cache.predict_with_interval(predictor, *neighbour, date) == direct
+    assert cache.stats()["hits"] == 1
+    own = predictor.predict_with_interval(*neighbour, date)
+    assert abs(own[0] - direct[0]) < 1e-3
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from predictor.aqua_predictor import AquaSentinelPredictor
+from utils.feature_store import FeatureStore
+
+
+@pytest.mark.parametrize("feature_store", [False, True])
+@pytest.mark.parametrize("use_bundle", [True, False])
+def test_predict_batch_matches_per_row_predictions(model_path, use_bundle, feature_store):
+    rng = np.random.default_rng(5)
+    lats = rng.uniform(-4.0, 4.0, 40)
+    lons = rng.uniform(29.0, 36.0, 40)
+    # Repeated cells and days, out of order.
+    lats[::7], lons[::7] = 0.5, 32.5
+    dates = [f"2023-{month:02d}-{day:02d}" for month, day in zip(
+        rng.integers(1, 13, 40), rng.integers(1, 29, 40)
+    )]
+
+    def predictor():
+        store = FeatureStore(backfill=True) if feature_store else None
+        scorer = AquaSentinelPredictor(model_path, feature_store=store, use_bundle=use_bundle)
+        assert (scorer.bundle is not None) == use_bundle
+        return scorer
+
+    scores, lower, upper = predictor().predict_batch(lats, lons, dates)
+    single = predictor()
+    rows = np.array([single.predict_with_interval(*point) for point in zip(lats, lons, dates)])
+    np.testing.assert_allclose(scores, rows[:, 0], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(lower, rows[:, 1], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(upper, rows[:, 2], rtol=0, atol=1e-9)
@@ -0,0 +1,34 @@
+from config.settings import GRID_CUBE_DIR
+from utils.risk_cube import build_cube
+
+BBOX = {"lat_min": 0.0, "lat_max": 0.2, "lon_min": 35.0, "lon_max": 35.2}
+QUERY = {"lat": 0.1, "lon": 35.1, "date": "2030-01-02"}
+
+
+def _build(predictor):
+    build_cube(predictor, GRID_CUBE_DIR, BBOX, resolution=0.1, start_date="2030-01-01", days=2)
+
+
+def test_ingested_drivers_retire_the_grid(served_model):
+    from api.endpoints import get_predictor
+    from webapp import create_app
+
+    client = create_app().test_client()
+    predictor = get_predictor()
+    _build(predictor)
+    assert client.post("/api/score", json=QUERY).get_json()["source"] == "grid"
+
+    response = client.post("/api/drivers", json=[{
+        "lat": QUERY["lat"], "lon": QUERY["lon"], "date": "2030-01-01", "precip": 400.0,
+    }])
+    assert response.get_json()["stored"] == 1
+    body = client.post("/api/score", json=QUERY).get_json()
+    assert body["source"] == "model"
+    expected = predictor.predict_with_interval(QUERY["lat"], QUERY["lon"], QUERY["date"])
+    assert body["score"] == expected[0]
+
+    # A grid rebuilt with the new drivers is served again.
+    _build(predictor)
+    body = client.post("/api/score", json=QUERY).get_json()
+    assert body["source"] == "grid"
+    assert abs(body["score"] - expected[0]) < 1e-4
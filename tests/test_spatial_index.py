@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from utils.spatial_index import GridIndex, haversine_km
+
+
+@pytest.fixture(scope="module")
+def cloud():
+    rng = np.random.default_rng(9)
+    lats = np.concatenate([rng.uniform(-10, 10, 3000), rng.uniform(-89, 89, 500), [0.0, 0.0]])
+    lons = np.concatenate([rng.uniform(170, 180, 1500), rng.uniform(-180, -170, 1500),
+                           rng.uniform(-180, 180, 500), [179.999, -179.999]])
+    return lats, lons, GridIndex(lats, lons, cell_deg=0.5)
+
+
+@pytest.mark.parametrize("box", [
+    (-2.0, 3.5, 172.25, 178.0),
+    (-10.0, 10.0, -180.0, 180.0),
+    (5.0, 5.0, 175.0, 175.0),
+    (40.0, 60.0, -30.0, 30.0),
+])
+def test_bbox_matches_brute_force(cloud, box):
+    lats, lons, index = cloud
+    lat_min, lat_max, lon_min, lon_max = box
+    expected = np.flatnonzero(
+        (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+    )
+    assert np.array_equal(index.within_bbox(*box), expected)
+
+
+def test_bbox_honours_row_range(cloud):
+    lats, lons, index = cloud
+    found = index.within_bbox(-5.0, 5.0, 170.0, 180.0, lo=100, hi=900)
+    expected = np.flatnonzero((lats >= -5) & (lats <= 5) & (lons >= 170) & (lons <= 180))
+    assert np.array_equal(found, expected[(expected >= 100) & (expected < 900)])
+
+
+@pytest.mark.parametrize("centre, radius", [
+    ((0.0, 179.9), 150.0),  # across the antimeridian
+    ((3.0, -175.0), 40.0),
+    ((88.0, 10.0), 500.0),  # near the pole
+    ((0.0, 0.0), 20000.0),  # the whole globe
+])
+def test_radius_matches_brute_force(cloud, centre, radius):
+    lats, lons, index = cloud
+    distances = haversine_km(centre[0], centre[1], lats, lons)
+    expected = np.flatnonzero(distances <= radius)
+    found, found_distances = index.within_radius(centre[0], centre[1], radius)
+    assert np.array_equal(found, expected)
+    np.testing.assert_allclose(found_distances, distances[expected])
+
+
+@pytest.mark.parametrize("centre, k", [
+    ((0.0, 180.0), 1),
+    ((0.0, 180.0), 25),
+    ((-60.0, 45.0), 10),
+    ((1.0, 175.0), 5000),  # more than there are points
+])
+def test_nearest_matches_brute_force(cloud, centre, k):
+    lats, lons, index = cloud
+    distances = haversine_km(centre[0], centre[1], lats, lons)
+    expected = np.lexsort((np.arange(len(lats)), distances))[:k]
+    found, found_distances = index.nearest(centre[0], centre[1], k)
+    assert np.array_equal(found, expected)
+    np.testing.assert_allclose(found_distances, distances[expected])
+
+
+def test_nearest_within_row_range(cloud):
+    lats, lons, index = cloud
+    lo, hi = 3000, 3500
+    distances = haversine_km(20.0, 20.0, lats[lo:hi], lons[lo:hi])
+    expected = lo + np.lexsort((np.arange(hi - lo), distances))[:7]
+    found, _ = index.nearest(20.0, 20.0, 7, lo=lo, hi=hi)
+    assert np.array_equal(found, expected)
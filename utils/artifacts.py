@@ -1,58 +1,71 @@
-import json
+import argparse
 import os
+import subprocess
+import sys
+import threading
 
-import pandas as pd
+from config.settings import ARTIFACTS_AUTO_BUILD, BASE_DIR, MODEL_PATH
+from utils.pipeline import run_pipeline
+from utils.storage import artifact_path
 
-from config.settings import GEE_MOCK_ENABLED, MODEL_PATH, RESULTS_DIR
-from data.synthetic_data import generate_synthetic_dataset
-from models.model_train import train_model
-from predictor.aqua_predictor import AquaSentinelPredictor
 
+class ArtifactsNotReady(RuntimeError):
+    pass
 
-def ensure_artifacts():
-    os.makedirs(RESULTS_DIR, exist_ok=True)
 
+def missing_artifacts():
+    # What the serving path needs and does not have yet. Only stats files:
+    # cheap enough for every request. The points table is published after
+    # the model and its bundle, so when it exists they are complete.
+    missing = []
     if not os.path.exists(MODEL_PATH):
-        data = generate_synthetic_dataset(n_samples=1400, use_gee_mock=GEE_MOCK_ENABLED)
-        report_path = os.path.join(RESULTS_DIR, "model_report.json")
-        train_model(data, MODEL_PATH, report_path=report_path)
-
-    points_path = os.path.join(RESULTS_DIR, "risk_scored_points.csv")
-    if not os.path.exists(points_path):
-        data = generate_synthetic_dataset(
-            n_samples=2400,
-            n_locations=80,
-            samples_per_location=20,
-            use_gee_mock=GEE_MOCK_ENABLED,
-        )
-        predictor = AquaSentinelPredictor(MODEL_PATH)
-        data["risk_score"], data["interval_lower"], data["interval_upper"] = zip(
-            *data.apply(
-                lambda row: predictor.predict_with_interval(
-                    row["lat"], row["lon"], row["date"]
-                ),
-                axis=1,
-            )
-        )
-        data.to_csv(points_path, index=False)
-
-    report_path = os.path.join(RESULTS_DIR, "model_report.json")
-    if not os.path.exists(report_path):
-        with open(report_path, "w", encoding="utf-8") as handle:
-            json.dump({}, handle)
-
-    return points_path
-
-
-def load_points(limit=None, start_date=None, end_date=None):
-    points_path = ensure_artifacts()
-    df = pd.read_csv(points_path)
-
-    if start_date:
-        df = df[df["date"] >= start_date]
-    if end_date:
-        df = df[df["date"] <= end_date]
-    if limit:
-        df = df.head(limit)
-
-    return df
+        missing.append("model")
+    if not os.path.exists(artifact_path("risk_scored_points")):
+        missing.append("risk_scored_points")
+    return missing
+
+
+def require_artifacts():
+    # The points path, or ArtifactsNotReady (a 503 in the API) while they
+    # are missing; never builds anything on the calling thread.
+    missing = missing_artifacts()
+    if missing:
+        start_artifact_build()
+        raise ArtifactsNotReady(f"Artifacts are being built: {', '.join(missing)}")
+    return artifact_path("risk_scored_points")
+
+
+def ensure_artifacts(options=None, verbose=False):
+    # Rebuilds only the stages whose inputs, settings or code changed since
+    # the last build (see utils/pipeline.py), with the options of the last
+    # run.py run unless given.
+    run_pipeline(options, verbose=verbose)
+    return artifact_path("risk_scored_points")
+
+
+_BUILD = None
+_BUILD_LOCK = threading.Lock()
+
+
+def start_artifact_build():
+    # Runs ``python -m utils.artifacts`` in the background, at most one per
+    # process at a time; off with ARTIFACTS_AUTO_BUILD=false.
+    global _BUILD
+    if not ARTIFACTS_AUTO_BUILD:
+        return None
+    with _BUILD_LOCK:
+        if _BUILD is None or _BUILD.poll() is not None:
+            _BUILD = subprocess.Popen([sys.executable, "-m", "utils.artifacts"], cwd=BASE_DIR)
+        return _BUILD
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build the model, inference bundle and scored points the web app serves"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    _parse_args()
+    print(f"Artifacts ready: {ensure_artifacts(verbose=True)}")
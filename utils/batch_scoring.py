@@ -0,0 +1,129 @@
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from config.settings import BATCH_CHUNK_ROWS
+
+
+SCORE_COLUMNS = ["score", "interval_lower", "interval_upper", "error"]
+ROW_ERROR = "lat and lon must be numbers and date YYYY-MM-DD"
+BATCH_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def iter_csv_chunks(stream, chunk_rows=BATCH_CHUNK_ROWS):
+    yield from pd.read_csv(stream, chunksize=chunk_rows)
+
+
+def iter_ndjson_chunks(stream, chunk_rows=BATCH_CHUNK_ROWS):
+    rows = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        rows.append(json.loads(line))
+        if len(rows) >= chunk_rows:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+
+def iter_frame_chunks(df, chunk_rows=BATCH_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def score_chunk(predictor, df, today=None):
+    # Rows with a missing or non-numeric lat/lon or a bad date are not
+    # scored: their scores are empty and ``error`` says why, so one bad row
+    # does not fail the whole batch.
+    df = df.copy()
+    today = today or datetime.utcnow().strftime("%Y-%m-%d")
+    if "date" not in df.columns:
+        df["date"] = today
+    else:
+        df["date"] = df["date"].fillna(today)
+    lats = pd.to_numeric(df["lat"], errors="coerce").to_numpy(dtype=float)
+    lons = pd.to_numeric(df["lon"], errors="coerce").to_numpy(dtype=float)
+    dates = pd.to_datetime(df["date"].astype(str), format="%Y-%m-%d", errors="coerce")
+    valid = np.isfinite(lats) & np.isfinite(lons) & dates.notna().to_numpy()
+
+    outputs = predictor.predict_batch(lats[valid], lons[valid], df["date"][valid])
+    for col, values in zip(SCORE_COLUMNS, outputs):
+        if values is None:
+            df[col] = None
+        else:
+            column = np.full(len(df), np.nan)
+            column[valid] = values
+            df[col] = column
+    df["error"] = np.where(valid, None, ROW_ERROR)
+    return df
+
+
+def encode_chunk(df, fmt, header):
+    if fmt == "ndjson":
+        return df.to_json(orient="records", lines=True, date_format="iso").rstrip("\n") + "\n"
+    output = io.StringIO()
+    df.to_csv(output, index=False, header=header)
+    return output.getvalue()
+
+
+def stream_scores(predictor, chunks, fmt="csv"):
+    # Scores and encodes chunk by chunk. The first chunk is scored before
+    # returning, so missing lat/lon columns surface as errors while a proper
+    # status can still be sent; later chunks keep its columns, and their bad
+    # rows get per-row errors. Input that cannot be read at all after the
+    # first chunk (a malformed CSV or NDJSON line) ends the stream: NDJSON
+    # output then ends with an {"error": ...} record, CSV output is cut short.
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None or first.empty or not {"lat", "lon"}.issubset(first.columns):
+        raise ValueError("Provide lat/lon columns or JSON list.")
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    first = score_chunk(predictor, first, today)
+    columns = list(first.columns)
+    input_columns = [col for col in columns if col not in SCORE_COLUMNS]
+
+    def generate():
+        yield encode_chunk(first, fmt, header=True)
+        rows = len(first)
+        try:
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                chunk = score_chunk(predictor, chunk.reindex(columns=input_columns), today)
+                yield encode_chunk(chunk[columns], fmt, header=False)
+                rows += len(chunk)
+        except Exception as exc:
+            if fmt != "ndjson":
+                # Aborts the chunked response, so the client sees an
+                # incomplete transfer rather than a short, valid-looking CSV.
+                raise
+            yield json.dumps({"error": f"Batch stopped after {rows} rows: {exc}"}) + "\n"
+
+    return generate()
+
+
+def request_chunks(content_type, files, stream, json_payload, chunk_rows=BATCH_CHUNK_ROWS):
+    # Multipart CSV upload, raw CSV or NDJSON body, or a JSON list.
+    if "file" in files:
+        # Uploaded files are closed with the request, before a streamed
+        # response finishes, so the generator reads from its own copy.
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        shutil.copyfileobj(files["file"].stream, spool)
+        spool.seek(0)
+        return iter_csv_chunks(spool, chunk_rows)
+    if content_type.startswith("text/csv"):
+        return iter_csv_chunks(stream, chunk_rows)
+    if content_type.startswith(("application/x-ndjson", "application/ndjson")):
+        lines = io.TextIOWrapper(stream, encoding="utf-8")
+        return iter_ndjson_chunks(lines, chunk_rows)
+    payload = json_payload() or []
+    return iter_frame_chunks(pd.DataFrame(payload), chunk_rows) if payload else chain()
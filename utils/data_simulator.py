@@ -1,7 +1,12 @@
 import hashlib
+import math
 from datetime import datetime
+from functools import lru_cache
 
 import numpy as np
+import pandas as pd
+
+from utils.instrumentation import timed
 
 
 def _stable_seed(lat, lon, date_str):
@@ -10,6 +15,7 @@ def _stable_seed(lat, lon, date_str):
     return int(digest[:8], 16)
 
 
+@timed("simulate_features")
 def simulate_features(lat, lon, date):
     if isinstance(date, str):
         date_obj = datetime.strptime(date, "%Y-%m-%d")
@@ -45,3 +51,152 @@ def simulate_features(lat, lon, date):
         "mobility_index": mobility_index,
         "clinic_reports": clinic_reports,
     }
+
+
+_MT_M = 397
+_MT_WORDS = 80
+_NORMAL_DRAWS = 10
+_BATCH_CHUNK = 65536
+
+
+def _to_day_array(dates, size):
+    if isinstance(dates, str) or not hasattr(dates, "__len__"):
+        dates = [dates] * size
+    values = pd.to_datetime(pd.Series(list(dates)), format="%Y-%m-%d")
+    if len(values) != size:
+        raise ValueError("dates must match the number of coordinates")
+    return values.to_numpy().astype("datetime64[D]")
+
+
+def _mt19937_words(seeds, count):
+    # First `count` outputs of np.random.RandomState(seed) per seed: Knuth
+    # seeding, the first twist and tempering, evaluated across all seeds.
+    head = np.empty((count + 1, len(seeds)), dtype=np.uint32)
+    tail = np.empty((count, len(seeds)), dtype=np.uint32)
+    state = seeds.astype(np.uint32)
+    for pos in range(_MT_M + count):
+        if pos <= count:
+            head[pos] = state
+        if pos >= _MT_M:
+            tail[pos - _MT_M] = state
+        state = np.uint32(1812433253) * (state ^ (state >> 30)) + np.uint32(pos + 1)
+
+    y = (head[:-1] & 0x80000000) | (head[1:] & 0x7FFFFFFF)
+    words = tail ^ (y >> 1) ^ np.where(y & 1, np.uint32(0x9908B0DF), np.uint32(0))
+    words ^= words >> 11
+    words ^= (words << 7) & 0x9D2C5680
+    words ^= (words << 15) & 0xEFC60000
+    words ^= words >> 18
+    return words.T
+
+
+def _legacy_gauss(seeds, count):
+    # Mirrors RandomState's polar Box-Muller: each accepted pair yields f * x2
+    # then the cached f * x1. Rows that exhaust the precomputed words are
+    # redrawn with RandomState itself.
+    words = _mt19937_words(seeds, _MT_WORDS)
+    doubles = ((words[:, 0::2] >> 5) * 67108864.0 + (words[:, 1::2] >> 6)) / 9007199254740992.0
+    x1 = 2.0 * doubles[:, 0::2] - 1.0
+    x2 = 2.0 * doubles[:, 1::2] - 1.0
+    r2 = x1 * x1 + x2 * x2
+    accepted = (r2 < 1.0) & (r2 != 0.0)
+    rank = np.cumsum(accepted, axis=1)
+
+    pairs = count // 2
+    exhausted = rank[:, -1] < pairs
+    rows = np.arange(len(seeds))[:, None]
+    attempts = np.stack(
+        [np.argmax(accepted & (rank == k + 1), axis=1) for k in range(pairs)], axis=1
+    )
+    x1 = x1[rows, attempts]
+    x2 = x2[rows, attempts]
+    r2 = r2[rows, attempts]
+    r2[exhausted] = 0.5
+    log_r2 = np.fromiter(map(math.log, r2.ravel().tolist()), dtype=float, count=r2.size)
+    f = np.sqrt(-2.0 * log_r2.reshape(r2.shape) / r2)
+
+    gauss = np.empty((len(seeds), count), dtype=float)
+    gauss[:, 0::2] = f * x2
+    gauss[:, 1::2] = f * x1
+    for idx in np.flatnonzero(exhausted):
+        gauss[idx] = np.random.RandomState(int(seeds[idx])).standard_normal(count)
+    return gauss
+
+
+def _normal(gauss, scale):
+    return 0.0 + scale * gauss
+
+
+@lru_cache(maxsize=1)
+def _vectorized_rng_matches():
+    seeds = np.arange(1, 257, dtype=np.uint32) * np.uint32(2654435761)
+    expected = np.array(
+        [np.random.RandomState(int(seed)).standard_normal(_NORMAL_DRAWS) for seed in seeds]
+    )
+    return np.array_equal(_legacy_gauss(seeds, _NORMAL_DRAWS), expected)
+
+
+def _standard_normals(seeds):
+    if not _vectorized_rng_matches():
+        return np.array(
+            [np.random.RandomState(int(seed)).standard_normal(_NORMAL_DRAWS) for seed in seeds]
+        ).reshape(len(seeds), _NORMAL_DRAWS)
+    return _legacy_gauss(seeds, _NORMAL_DRAWS)
+
+
+@timed("simulate_features_batch")
+def simulate_features_batch(lats, lons, dates, chunk_size=_BATCH_CHUNK):
+    lats = np.asarray(lats, dtype=float).ravel()
+    lons = np.asarray(lons, dtype=float).ravel()
+    if lats.shape != lons.shape:
+        raise ValueError("lats and lons must have the same length")
+    days = _to_day_array(dates, len(lats))
+
+    date_strs = days.astype(str).tolist()
+    seeds = np.fromiter(
+        (
+            _stable_seed(lat, lon, date_str)
+            for lat, lon, date_str in zip(lats.tolist(), lons.tolist(), date_strs)
+        ),
+        dtype=np.uint32,
+        count=len(lats),
+    )
+    gauss = np.empty((len(lats), _NORMAL_DRAWS), dtype=float)
+    for start in range(0, len(lats), chunk_size):
+        gauss[start:start + chunk_size] = _standard_normals(seeds[start:start + chunk_size])
+
+    yday = (days - days.astype("datetime64[Y]")).astype(int) + 1
+    season_table = np.array(
+        [np.sin((day / 365.0) * 2 * np.pi) for day in range(367)], dtype=float
+    )
+    seasonal = season_table[yday]
+
+    sst = 24 + (lats / 10.0) + 2.5 * seasonal + _normal(gauss[:, 0], 0.7)
+    chlor_a = np.clip(0.6 + 0.2 * seasonal + _normal(gauss[:, 1], 0.1), 0.05, 2.0)
+    precip = np.clip(80 + 60 * seasonal + _normal(gauss[:, 2], 25), 0, 250)
+    flood_inundation = np.clip((precip - 120) / 130 + _normal(gauss[:, 3], 0.1), 0, 1)
+    drought_index = np.clip(-1.0 * seasonal + _normal(gauss[:, 4], 0.4), -2.5, 2.5)
+
+    pop_density = np.clip(300 + (np.abs(lats) * 40) + _normal(gauss[:, 5], 50), 50, 1200)
+    water_access_pct = np.clip(70 - (np.abs(lats) * 1.5) + _normal(gauss[:, 6], 4), 40, 98)
+    sanitation_score = np.clip(65 - (np.abs(lats) * 1.2) + _normal(gauss[:, 7], 6), 30, 95)
+
+    mobility_index = np.clip(
+        1 + flood_inundation * 1.5 + _normal(gauss[:, 8], 0.2), 0.5, 3.0
+    )
+    clinic_reports = np.clip(
+        0.5 + flood_inundation * 2.2 + _normal(gauss[:, 9], 0.4), 0, 6
+    )
+
+    return {
+        "sst": sst,
+        "chlor_a": chlor_a,
+        "precip": precip,
+        "flood_inundation": flood_inundation,
+        "drought_index": drought_index,
+        "population_density": pop_density,
+        "water_access_pct": water_access_pct,
+        "sanitation_score": sanitation_score,
+        "mobility_index": mobility_index,
+        "clinic_reports": clinic_reports,
+    }
@@ -1,7 +1,10 @@
 import math
 
+import numpy as np
 import pandas as pd
 
+from utils.instrumentation import timed
+
 
 BASE_FEATURES = [
     "lat",
@@ -18,55 +21,161 @@ BASE_FEATURES = [
     "clinic_reports",
 ]
 
+WINDOW_FEATURES = {
+    "precip_7d_mean": ("precip", 7, "mean"),
+    "precip_14d_sum": ("precip", 14, "sum"),
+    "sst_7d_mean": ("sst", 7, "mean"),
+    "chlor_a_7d_mean": ("chlor_a", 7, "mean"),
+    "flood_3d_max": ("flood_inundation", 3, "max"),
+    "drought_30d_mean": ("drought_index", 30, "mean"),
+}
+MAX_WINDOW = max(window for _, window, _ in WINDOW_FEATURES.values())
+
+_GROUP_KEYS = ["lat_bin", "lon_bin"]
+_SORT_KEYS = _GROUP_KEYS + ["date"]
+_SEASON_SIN = np.array([math.sin(2 * math.pi * (day / 365.0)) for day in range(367)])
+_SEASON_COS = np.array([math.cos(2 * math.pi * (day / 365.0)) for day in range(367)])
+
 
-def build_feature_frame(df):
+def _row_features(df):
     work = df.copy()
     work["date"] = pd.to_datetime(work["date"])
     work["lat_bin"] = work["lat"].round(1)
     work["lon_bin"] = work["lon"].round(1)
     work["month"] = work["date"].dt.month
-    work["season_sin"] = work["date"].dt.dayofyear.apply(
-        lambda x: math.sin(2 * math.pi * (x / 365.0))
-    )
-    work["season_cos"] = work["date"].dt.dayofyear.apply(
-        lambda x: math.cos(2 * math.pi * (x / 365.0))
-    )
+    dayofyear = work["date"].dt.dayofyear.to_numpy()
+    work["season_sin"] = _SEASON_SIN[dayofyear]
+    work["season_cos"] = _SEASON_COS[dayofyear]
     work["heatwave"] = (work["sst"] > 28).astype(int)
     work["post_flood"] = (work["precip"] > 140).astype(int)
     work["heatwave_flood"] = work["heatwave"] * work["flood_inundation"]
+    return work
 
-    work = work.sort_values(["lat_bin", "lon_bin", "date"])
-    grouped = work.groupby(["lat_bin", "lon_bin"], sort=False)
-    work["precip_7d_mean"] = grouped["precip"].transform(
-        lambda s: s.rolling(7, min_periods=1).mean()
-    )
-    work["precip_14d_sum"] = grouped["precip"].transform(
-        lambda s: s.rolling(14, min_periods=1).sum()
-    )
-    work["sst_7d_mean"] = grouped["sst"].transform(
-        lambda s: s.rolling(7, min_periods=1).mean()
-    )
-    work["chlor_a_7d_mean"] = grouped["chlor_a"].transform(
-        lambda s: s.rolling(7, min_periods=1).mean()
-    )
-    work["flood_3d_max"] = grouped["flood_inundation"].transform(
-        lambda s: s.rolling(3, min_periods=1).max()
-    )
-    work["drought_30d_mean"] = grouped["drought_index"].transform(
-        lambda s: s.rolling(30, min_periods=1).mean()
-    )
 
-    for col in [
-        "precip_7d_mean",
-        "precip_14d_sum",
-        "sst_7d_mean",
-        "chlor_a_7d_mean",
-        "flood_3d_max",
-        "drought_30d_mean",
-    ]:
+def _group_positions(work):
+    # Offset of each row from the start of its (lat_bin, lon_bin) run in a
+    # frame already sorted by the group keys.
+    lat_bin = work["lat_bin"].to_numpy()
+    lon_bin = work["lon_bin"].to_numpy()
+    index = np.arange(len(work))
+    starts = np.ones(len(work), dtype=bool)
+    starts[1:] = (lat_bin[1:] != lat_bin[:-1]) | (lon_bin[1:] != lon_bin[:-1])
+    return index - np.maximum.accumulate(np.where(starts, index, 0))
+
+
+def rolling_window_features(work, positions=None):
+    # All WINDOW_FEATURES in one pass per source column over a frame sorted by
+    # (lat_bin, lon_bin, date). Windows count rows and accept partial windows,
+    # matching a per-group rolling(w, min_periods=1).
+    if positions is None:
+        positions = _group_positions(work)
+
+    by_source = {}
+    for name, (source, window, agg) in WINDOW_FEATURES.items():
+        by_source.setdefault(source, []).append((window, agg, name))
+
+    results = {}
+    for source, specs in by_source.items():
+        values = work[source].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        needs_max = any(agg == "max" for _, agg, _ in specs)
+        total = filled.copy()
+        count = valid.astype(float)
+        peak = np.where(valid, values, -np.inf) if needs_max else None
+        pending = sorted(specs)
+
+        for lag in range(max(window for window, _, _ in specs)):
+            if lag:
+                in_group = positions >= lag
+                shifted_valid = np.zeros(len(values), dtype=bool)
+                shifted_valid[lag:] = valid[:-lag]
+                shifted_valid &= in_group
+                shifted = np.zeros(len(values))
+                shifted[lag:] = filled[:-lag]
+                total += np.where(in_group, shifted, 0.0)
+                count += shifted_valid
+                if needs_max:
+                    shifted[lag:] = values[:-lag]
+                    peak = np.where(shifted_valid, np.fmax(peak, shifted), peak)
+
+            while pending and pending[0][0] == lag + 1:
+                _, agg, name = pending.pop(0)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    if agg == "mean":
+                        out = total / count
+                    elif agg == "sum":
+                        out = total.copy()
+                    else:
+                        out = peak.copy()
+                out[count == 0] = np.nan
+                results[name] = out
+
+    return results
+
+
+def _fill_missing_windows(work):
+    for col in WINDOW_FEATURES:
         work[col] = work[col].fillna(work[col].mean())
 
-    feature_cols = BASE_FEATURES + [
+
+@timed("build_feature_frame")
+def build_feature_frame(df, windowed=True):
+    work = _row_features(df)
+
+    # Unwindowed rows are scored as one-day histories, in input order.
+    if not windowed:
+        for col, (source, _, _) in WINDOW_FEATURES.items():
+            work[col] = work[source].astype(float)
+        return work, _feature_cols()
+
+    work = work.sort_values(_SORT_KEYS)
+    for col, values in rolling_window_features(work).items():
+        work[col] = values
+
+    _fill_missing_windows(work)
+    return work, _feature_cols()
+
+
+def update_feature_frame(engineered, new_df):
+    # Extend a build_feature_frame result with new rows. Only cells that got
+    # data are recomputed, from their earliest new date onwards, with
+    # MAX_WINDOW - 1 earlier rows as context; appended days touch only
+    # themselves.
+    new_work = _row_features(new_df)
+    if new_work.empty:
+        return engineered, _feature_cols()
+    if engineered.empty:
+        return build_feature_frame(new_df)
+
+    start = int(engineered.index.max()) + 1
+    new_work.index = pd.RangeIndex(start, start + len(new_work))
+
+    earliest = new_work.groupby(_GROUP_KEYS)["date"].min().rename("_earliest")
+    history = engineered.join(earliest, on=_GROUP_KEYS, how="inner")
+    affected = history["date"] >= history["_earliest"]
+    context = (
+        history[~affected]
+        .groupby(_GROUP_KEYS, sort=False)
+        .tail(MAX_WINDOW - 1)
+        .drop(columns="_earliest")
+    )
+    stale_index = history.index[affected]
+
+    segment = pd.concat([context, engineered.loc[stale_index], new_work])
+    segment = segment.sort_values(_SORT_KEYS)
+    for col, values in rolling_window_features(segment).items():
+        segment[col] = values
+    refreshed = segment.drop(index=context.index)
+
+    work = pd.concat([engineered.drop(index=stale_index), refreshed])
+    work = work.sort_values(_SORT_KEYS)
+    _fill_missing_windows(work)
+    return work, _feature_cols()
+
+
+def _feature_cols():
+    return BASE_FEATURES + [
         "month",
         "season_sin",
         "season_cos",
@@ -80,4 +189,3 @@ def build_feature_frame(df):
         "flood_3d_max",
         "drought_30d_mean",
     ]
-    return work, feature_cols
@@ -0,0 +1,370 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from config.settings import FEATURE_STORE_MAX_CELLS, FEATURE_STORE_SYNC_SECONDS
+from utils.data_simulator import simulate_features_batch
+from utils.feature_engineer import MAX_WINDOW, WINDOW_FEATURES
+
+
+SOURCES = sorted({source for source, _, _ in WINDOW_FEATURES.values()})
+_EMPTY_DAY = np.iinfo(np.int64).min
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _cell_keys(lats, lons):
+    return np.round(np.asarray(lats, dtype=float), 1), np.round(np.asarray(lons, dtype=float), 1)
+
+
+def _day_numbers(dates):
+    return pd.to_datetime(pd.Series(list(dates))).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def drivers_frame(records):
+    # A frame for FeatureStore.ingest from JSON records with lat, lon, date
+    # (YYYY-MM-DD) and any of SOURCES; absent drivers are NaN (unobserved).
+    if not isinstance(records, list) or not records or not all(
+        isinstance(record, dict) for record in records
+    ):
+        raise ValueError("expected a non-empty list of records")
+    frame = pd.DataFrame.from_records(records)
+    missing = [col for col in ("lat", "lon", "date") if col not in frame]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    if not any(source in frame for source in SOURCES):
+        raise ValueError(f"records need at least one of: {', '.join(SOURCES)}")
+    out = pd.DataFrame({
+        "lat": pd.to_numeric(frame["lat"], errors="coerce"),
+        "lon": pd.to_numeric(frame["lon"], errors="coerce"),
+        "date": pd.to_datetime(frame["date"], format="%Y-%m-%d", errors="coerce"),
+    })
+    if out.isna().any().any():
+        raise ValueError("lat and lon must be numbers and date YYYY-MM-DD")
+    for source in SOURCES:
+        values = frame[source] if source in frame else pd.Series(np.nan, index=frame.index)
+        out[source] = pd.to_numeric(values, errors="coerce")
+        if (out[source].isna() & values.notna()).any():
+            raise ValueError(f"{source} must be a number")
+    return out
+
+
+def _read_archive(path):
+    # (cells, days, values, observed) of a saved store, or None when missing
+    # or saved with other sources or window. Stores saved before observed
+    # flags existed count as all backfilled.
+    if not path or not os.path.exists(path):
+        return None
+    with np.load(path) as archive:
+        if list(archive["sources"]) != SOURCES or archive["days"].shape[1] != MAX_WINDOW:
+            return None
+        days = archive["days"]
+        observed = archive["observed"] if "observed" in archive.files else np.zeros(days.shape, dtype=bool)
+        return archive["cells"], days, archive["values"], observed
+
+
+class FeatureStore:
+    # Last MAX_WINDOW days of raw window drivers per (lat_bin, lon_bin) cell,
+    # held in day-indexed ring buffers: day d lives in slot d % MAX_WINDOW.
+    # Each day is either observed (ingest) or backfilled; an observation
+    # always wins over a backfilled value for the same day. At most
+    # ``max_cells`` cells (0 for no limit) are held; the least recently used
+    # one is evicted.
+    def __init__(
+        self,
+        path=None,
+        backfill=True,
+        flush_every=10000,
+        max_cells=FEATURE_STORE_MAX_CELLS,
+        sync_seconds=FEATURE_STORE_SYNC_SECONDS,
+    ):
+        self.path = path
+        self.backfill = backfill
+        self.flush_every = flush_every
+        self.max_cells = max_cells
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._index = {}
+        self._cells = np.empty((0, 2), dtype=float)
+        self._days = np.full((0, MAX_WINDOW), _EMPTY_DAY, dtype=np.int64)
+        self._values = np.empty((0, MAX_WINDOW, len(SOURCES)), dtype=float)
+        self._observed = np.zeros((0, MAX_WINDOW), dtype=bool)
+        self._used = np.zeros(0, dtype=np.int64)
+        self._tick = 0
+        self._unsaved = 0
+        self._synced = time.monotonic()
+        self.evicted = 0
+        # Bumped whenever observed drivers change what window_features returns.
+        self.version = 0
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self._index)
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        store = cls(path=path, **kwargs)
+        archive = _read_archive(path)
+        if archive is not None:
+            store._merge(*archive)
+            store._unsaved = 0
+        return store
+
+    def save(self, path=None):
+        # Merges with what other processes saved (under a file lock), so
+        # concurrent workers add to the file instead of overwriting it, and
+        # takes in their observations.
+        path = path or self.path
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.lock", "w") as lock_handle:
+            if fcntl is not None:
+                fcntl.flock(lock_handle, fcntl.LOCK_EX)
+            archive = _read_archive(path)
+            with self._lock:
+                if archive is not None:
+                    self._merge(*archive)
+                count = len(self._index)
+                arrays = {
+                    "cells": self._cells[:count].copy(),
+                    "days": self._days[:count].copy(),
+                    "values": self._values[:count].copy(),
+                    "observed": self._observed[:count].copy(),
+                }
+                self._unsaved = 0
+                self._synced = time.monotonic()
+            tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "wb") as handle:
+                np.savez(handle, sources=np.array(SOURCES), **arrays)
+            os.replace(tmp_path, path)
+        return path
+
+    def _merge(self, cells, days, values, observed):
+        # Takes in another copy of the store: per cell and slot the later
+        # day wins, and on the same day an observation wins. Cells that do
+        # not fit under max_cells are skipped rather than evicting any.
+        indices = self._cell_indices(cells[:, 0], cells[:, 1], evict=False)
+        keep = indices >= 0
+        indices, days, values, observed = indices[keep], days[keep], values[keep], observed[keep]
+        current = self._days[indices]
+        wins = (days > current) | ((days == current) & observed & ~self._observed[indices])
+        rows, slots = np.nonzero(wins)
+        targets = indices[rows]
+        self._days[targets, slots] = days[rows, slots]
+        self._values[targets, slots] = values[rows, slots]
+        self._observed[targets, slots] = observed[rows, slots]
+        if observed[rows, slots].any():
+            self.version += 1
+
+    def _cell_indices(self, lat_bins, lon_bins, evict=True):
+        # Slots for the given cells, allocating new ones. Past max_cells the
+        # least recently used cells not touched by this call are reused (or,
+        # with evict=False, new cells get -1).
+        self._tick += 1
+        indices = np.empty(len(lat_bins), dtype=np.int64)
+        new = {}
+        for pos, key in enumerate(zip(lat_bins.tolist(), lon_bins.tolist())):
+            idx = self._index.get(key)
+            if idx is None:
+                new.setdefault(key, []).append(pos)
+            else:
+                indices[pos] = idx
+        known = np.ones(len(indices), dtype=bool)
+        for positions in new.values():
+            known[positions] = False
+        if evict:
+            self._used[indices[known]] = self._tick
+        if not new:
+            return indices
+
+        count = len(self._index)
+        top = max(count, self.max_cells) if self.max_cells else count + len(new)
+        free = list(range(count, top))
+        if evict and len(new) > len(free):
+            candidates = np.flatnonzero(self._used[:count] < self._tick)
+            n_evict = min(len(new) - len(free), len(candidates))
+            if n_evict:
+                order = np.argpartition(self._used[candidates], n_evict - 1)[:n_evict]
+                victims = candidates[order]
+                for idx in victims.tolist():
+                    del self._index[tuple(self._cells[idx].tolist())]
+                if self._observed[victims].any():
+                    self.version += 1
+                self._days[victims] = _EMPTY_DAY
+                self._observed[victims] = False
+                self.evicted += n_evict
+                free = victims.tolist() + free
+            # Every other cell was touched by this call: grow past the cap
+            # rather than drop cells still in use.
+            free += range(top, top + max(len(new) - len(free), 0))
+        free = iter(free)
+        for key, positions in new.items():
+            idx = next(free, -1)
+            indices[positions] = idx
+            if idx < 0:
+                continue
+            if idx >= len(self._days):
+                self._grow(idx + 1)
+            self._index[key] = idx
+            self._cells[idx] = key
+            self._used[idx] = self._tick if evict else 0
+        return indices
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self._days), 64)
+        if self.max_cells:
+            capacity = max(needed, min(capacity, self.max_cells))
+        extra = capacity - len(self._days)
+        self._cells = np.concatenate([self._cells, np.zeros((extra, 2))])
+        self._days = np.concatenate(
+            [self._days, np.full((extra, MAX_WINDOW), _EMPTY_DAY, dtype=np.int64)]
+        )
+        self._values = np.concatenate(
+            [self._values, np.zeros((extra, MAX_WINDOW, len(SOURCES)))]
+        )
+        self._observed = np.concatenate(
+            [self._observed, np.zeros((extra, MAX_WINDOW), dtype=bool)]
+        )
+        self._used = np.concatenate([self._used, np.zeros(extra, dtype=np.int64)])
+
+    def _write(self, cells, days, values, observed=False):
+        order = np.argsort(days, kind="stable")
+        cells, days, values = cells[order], days[order], values[order]
+        slots = days % MAX_WINDOW
+        current = self._days[cells, slots]
+        if observed:
+            fresh = current <= days
+        else:
+            fresh = (current < days) | ((current == days) & ~self._observed[cells, slots])
+            # A newer backfilled day rotating an observation out of its slot.
+            if self._observed[cells[fresh], slots[fresh]].any():
+                self.version += 1
+        self._days[cells[fresh], slots[fresh]] = days[fresh]
+        self._values[cells[fresh], slots[fresh]] = values[fresh]
+        self._observed[cells[fresh], slots[fresh]] = observed
+        written = int(fresh.sum())
+        self._unsaved += written
+        return written
+
+    def ingest(self, frame):
+        # Observed drivers (POST /api/drivers): one row per cell and day with
+        # lat, lon, date and every column in SOURCES. Returns how many were
+        # stored; days older than a cell's 30-day window are dropped.
+        if frame.empty:
+            return 0
+        lat_bins, lon_bins = _cell_keys(frame["lat"], frame["lon"])
+        days = _day_numbers(frame["date"])
+        values = frame[SOURCES].to_numpy(dtype=float)
+        with self._lock:
+            written = self._write(
+                self._cell_indices(lat_bins, lon_bins), days, values, observed=True
+            )
+            if written:
+                self.version += 1
+        self._maybe_flush()
+        return written
+
+    def fingerprint(self):
+        # Digest of the observed drivers. Unlike ``version``, a per-process
+        # counter, it compares across processes (a risk grid built by the CLI
+        # against a server's store); backfilled values are simulated and the
+        # same everywhere, so they are left out.
+        with self._lock:
+            if self._fingerprint is None or self._fingerprint[0] != self.version:
+                count = len(self._index)
+                rows, slots = np.nonzero(self._observed[:count])
+                keys = np.column_stack([self._cells[rows], self._days[rows, slots]])
+                order = np.lexsort(keys.T[::-1])
+                digest = hashlib.sha256(keys[order].tobytes())
+                digest.update(self._values[rows, slots][order].tobytes())
+                self._fingerprint = (self.version, digest.hexdigest()[:16])
+            return self._fingerprint[1]
+
+    def _backfill(self, cells, days):
+        # Simulate missing history at the cell centre so the result does not
+        # depend on which coordinate first touched the cell.
+        pairs, inverse = np.unique(
+            np.stack([cells, days], axis=1), axis=0, return_inverse=True
+        )
+        features = simulate_features_batch(
+            self._cells[pairs[:, 0], 0],
+            self._cells[pairs[:, 0], 1],
+            pairs[:, 1].astype("datetime64[D]"),
+        )
+        values = np.stack([features[source] for source in SOURCES], axis=1)
+        self._write(pairs[:, 0], pairs[:, 1], values)
+        return values[inverse.ravel()]
+
+    def window_features(self, frame):
+        # Window aggregates for each row of ``frame``: the row's own drivers on
+        # its date plus the stored drivers of the preceding days in its cell.
+        lat_bins, lon_bins = _cell_keys(frame["lat"], frame["lon"])
+        days = _day_numbers(frame["date"])
+        current = frame[SOURCES].to_numpy(dtype=float)
+        history_days = days[:, None] - np.arange(1, MAX_WINDOW)[None, :]
+        slots = history_days % MAX_WINDOW
+
+        with self._lock:
+            cells = self._cell_indices(lat_bins, lon_bins)
+            present = self._days[cells[:, None], slots] == history_days
+            history = self._values[cells[:, None], slots]
+            if self.backfill and not present.all():
+                rows, cols = np.nonzero(~present)
+                history[rows, cols] = self._backfill(cells[rows], history_days[rows, cols])
+                present[rows, cols] = True
+        self._maybe_flush()
+
+        stacked = np.concatenate([current[:, None, :], history], axis=1)
+        valid = np.concatenate(
+            [~np.isnan(current)[:, None, :], present[:, :, None] & ~np.isnan(history)], axis=1
+        )
+        results = {}
+        for name, (source, window, agg) in WINDOW_FEATURES.items():
+            column = SOURCES.index(source)
+            values = stacked[:, :window, column]
+            mask = valid[:, :window, column]
+            count = mask.sum(axis=1)
+            if agg == "max":
+                out = np.where(mask, values, -np.inf).max(axis=1)
+            else:
+                out = np.where(mask, values, 0.0).sum(axis=1)
+                if agg == "mean":
+                    out = out / np.maximum(count, 1)
+            out[count == 0] = np.nan
+            results[name] = out
+        return results
+
+    def _maybe_flush(self):
+        # Saves every ``flush_every`` new entries, and every ``sync_seconds``
+        # to pick up what other workers ingested.
+        if not self.path:
+            return
+        with self._lock:
+            due = (self.flush_every and self._unsaved >= self.flush_every) or (
+                self.sync_seconds and time.monotonic() - self._synced >= self.sync_seconds
+            )
+            if due:
+                self._unsaved = 0
+                self._synced = time.monotonic()
+        if due:
+            self.save()
+
+
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_feature_store(path, **kwargs):
+    with _SHARED_LOCK:
+        if path not in _SHARED:
+            _SHARED[path] = FeatureStore.open(path, **kwargs)
+        return _SHARED[path]
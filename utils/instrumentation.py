@@ -0,0 +1,148 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from config.settings import METRICS_ENABLED
+
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    # Prometheus-style latency histogram per label set.
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        position = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[labels] = series
+            series[0][position] += 1
+            series[1] += seconds
+
+    def snapshot(self):
+        # {labels: (cumulative bucket counts incl. +Inf, sum)}
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        out = {}
+        for labels, (counts, total) in series.items():
+            running = 0
+            cumulative = []
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            out[labels] = (cumulative, total)
+        return out
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (cumulative, total) in sorted(self.snapshot().items()):
+            base = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            for bound, count in zip(self.buckets + (float("inf"),), cumulative):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative[-1]}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+STAGE_SECONDS = Histogram(
+    "aqua_stage_seconds", "Wall time per pipeline or serving stage.", ["stage"]
+)
+HTTP_SECONDS = Histogram(
+    "aqua_http_request_seconds",
+    "Time to response headers per route.",
+    ["method", "route", "status"],
+)
+
+
+@contextmanager
+def span(stage):
+    # Times the block into aqua_stage_seconds{stage=...}, errors included.
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe((stage,), time.perf_counter() - start)
+
+
+def timed(stage):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def observe_request(method, route, status, seconds):
+    if METRICS_ENABLED:
+        HTTP_SECONDS.observe((method, route, str(status)), seconds)
+
+
+def instrument_app(app):
+    # Per-route request latency for a Flask app. Labels use the URL rule
+    # (e.g. /api/tiles/<int:z>/<int:x>/<int:y>) to keep the series bounded;
+    # streamed bodies are timed to the first byte.
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            observe_request(
+                request.method, route, response.status_code, time.perf_counter() - started
+            )
+        return response
+
+    return app
+
+
+def render_metrics():
+    return "\n".join([STAGE_SECONDS.render(), HTTP_SECONDS.render()]) + "\n"
+
+
+def stage_summary():
+    # {stage: {"count", "total_seconds", "mean_seconds"}}, slowest first.
+    rows = {}
+    for (stage,), (cumulative, total) in STAGE_SECONDS.snapshot().items():
+        count = cumulative[-1]
+        rows[stage] = {
+            "count": count,
+            "total_seconds": round(total, 6),
+            "mean_seconds": round(total / count, 6) if count else 0.0,
+        }
+    return dict(sorted(rows.items(), key=lambda item: -item[1]["total_seconds"]))
@@ -0,0 +1,366 @@
+import argparse
+import atexit
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+import pandas as pd
+
+from config.settings import (
+    BASE_DIR,
+    BATCH_CHUNK_ROWS,
+    JOB_NICE,
+    JOB_POLL_SECONDS,
+    JOB_STALE_SECONDS,
+    JOB_WORKERS,
+    JOBS_DB_PATH,
+    JOBS_DIR,
+)
+from utils.batch_scoring import BATCH_FORMATS, SCORE_COLUMNS, encode_chunk, score_chunk
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_format TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    default_date TEXT NOT NULL,
+    rows_total INTEGER NOT NULL,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    output_bytes INTEGER NOT NULL DEFAULT 0,
+    columns TEXT,
+    owner TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+_COPY_BLOCK = 1 << 20
+
+
+def _copy_counting_lines(source, path):
+    # Copies a byte stream to ``path`` and returns the number of lines.
+    lines = 0
+    last = b"\n"
+    with open(path, "wb") as handle:
+        for block in iter(lambda: source.read(_COPY_BLOCK), b""):
+            handle.write(block)
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines + (last != b"\n")
+
+
+def _save_input(content_type, files, stream, json_payload, job_dir):
+    # Same inputs as /score/batch. CSV is kept as uploaded and everything else
+    # as NDJSON; returns (input format, path, row count).
+    if "file" in files or content_type.startswith("text/csv"):
+        path = os.path.join(job_dir, "input.csv")
+        source = files["file"].stream if "file" in files else stream
+        return "csv", path, max(_copy_counting_lines(source, path) - 1, 0)
+    path = os.path.join(job_dir, "input.ndjson")
+    if content_type.startswith(("application/x-ndjson", "application/ndjson")):
+        return "ndjson", path, _copy_counting_lines(stream, path)
+    payload = json_payload() or []
+    if not isinstance(payload, list):
+        raise ValueError("Provide lat/lon columns or JSON list.")
+    with open(path, "w", encoding="utf-8") as handle:
+        for row in payload:
+            handle.write(json.dumps(row) + "\n")
+    return "ndjson", path, len(payload)
+
+
+def _input_columns(input_format, path):
+    if input_format == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                return list(json.loads(line))
+    return []
+
+
+def _input_chunks(input_format, path, skip_rows, chunk_rows):
+    if input_format == "csv":
+        skip = range(1, skip_rows + 1) if skip_rows else None
+        yield from pd.read_csv(path, chunksize=chunk_rows, skiprows=skip)
+        return
+    with open(path, "r", encoding="utf-8") as handle:
+        lines = islice((line for line in handle if line.strip()), skip_rows, None)
+        while True:
+            rows = [json.loads(line) for line in islice(lines, chunk_rows)]
+            if not rows:
+                return
+            yield pd.DataFrame(rows)
+
+
+class JobStore:
+    # Batch scoring jobs in a SQLite table, with inputs and outputs under
+    # ``jobs_dir/<id>``. Workers in any process claim queued jobs through the
+    # table, checkpoint after every chunk, and a job whose worker stops
+    # heartbeating is requeued and resumes from its last checkpoint.
+    def __init__(self, db_path=JOBS_DB_PATH, jobs_dir=JOBS_DIR, stale_seconds=JOB_STALE_SECONDS):
+        self.db_path = db_path
+        self.jobs_dir = jobs_dir
+        self.stale_seconds = stale_seconds
+        os.makedirs(jobs_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def output_path(self, job):
+        return os.path.join(self.job_dir(job["id"]), f"scores.{job['output_format']}")
+
+    def input_path(self, job):
+        return os.path.join(self.job_dir(job["id"]), f"input.{job['input_format']}")
+
+    def submit(self, content_type, files, stream, json_payload, output_format="csv"):
+        if output_format not in BATCH_FORMATS:
+            raise ValueError(f"format must be one of {sorted(BATCH_FORMATS)}")
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+        try:
+            input_format, path, rows_total = _save_input(
+                content_type, files, stream, json_payload, job_dir
+            )
+            if rows_total == 0 or not {"lat", "lon"}.issubset(_input_columns(input_format, path)):
+                raise ValueError("Provide lat/lon columns or JSON list.")
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input_format, output_format, default_date,"
+                " rows_total, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    input_format,
+                    output_format,
+                    datetime.utcnow().strftime("%Y-%m-%d"),
+                    rows_total,
+                    time.time(),
+                ),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def claim(self, owner):
+        # Oldest queued job, marked running under ``owner`` in one write
+        # transaction so two workers never take the same job.
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?,"
+                    " started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (owner, now, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        return self.get(row["id"]) if row is not None else None
+
+    def requeue_stale(self):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL"
+                " WHERE status = 'running' AND heartbeat_at < ?",
+                (time.time() - self.stale_seconds,),
+            )
+        return cursor.rowcount
+
+    def checkpoint(self, job_id, owner, rows_done, output_bytes, columns):
+        # False when the job was requeued and taken over by another worker.
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET rows_done = ?, output_bytes = ?, columns = ?, heartbeat_at = ?"
+                " WHERE id = ? AND owner = ? AND status = 'running'",
+                (rows_done, output_bytes, json.dumps(columns), time.time(), job_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, owner, rows_done):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', rows_total = ?, finished_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (rows_done, time.time(), job_id, owner),
+            )
+
+    def fail(self, job_id, owner, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (error, time.time(), job_id, owner),
+            )
+
+
+def job_status(job):
+    progress = job["rows_done"] / job["rows_total"] if job["rows_total"] else 0.0
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "format": job["output_format"],
+        "rows_total": job["rows_total"],
+        "rows_done": job["rows_done"],
+        "progress": round(min(progress, 1.0), 4),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+    }
+
+
+def run_job(store, job, predictor, owner, chunk_rows=BATCH_CHUNK_ROWS):
+    # Appends scored chunks to the output file after its last checkpoint.
+    # Output past the checkpoint (a chunk written before a crash) is cut off
+    # and scored again, so a resumed job writes every row exactly once.
+    columns = json.loads(job["columns"]) if job["columns"] else None
+    rows_done = job["rows_done"]
+    output_bytes = job["output_bytes"]
+    fmt = job["output_format"]
+    chunks = _input_chunks(job["input_format"], store.input_path(job), rows_done, chunk_rows)
+
+    with open(store.output_path(job), "a+b") as handle:
+        handle.truncate(output_bytes)
+        handle.seek(output_bytes)
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            if columns is None:
+                if not {"lat", "lon"}.issubset(chunk.columns):
+                    raise ValueError("Provide lat/lon columns or JSON list.")
+                scored = score_chunk(predictor, chunk, job["default_date"])
+                columns = list(scored.columns)
+            else:
+                inputs = [col for col in columns if col not in SCORE_COLUMNS]
+                scored = score_chunk(predictor, chunk.reindex(columns=inputs), job["default_date"])
+                scored = scored[columns]
+            data = encode_chunk(scored, fmt, header=output_bytes == 0).encode("utf-8")
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+            output_bytes += len(data)
+            rows_done += len(chunk)
+            if not store.checkpoint(job["id"], owner, rows_done, output_bytes, columns):
+                return False
+    store.finish(job["id"], owner, rows_done)
+    return True
+
+
+def work(predictor_factory, store=None, poll=JOB_POLL_SECONDS, parent_pid=None, once=False):
+    # Worker loop: claim, score, repeat. ``predictor_factory`` is called per
+    # job so a replaced model file is picked up between jobs.
+    store = store or JobStore()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while parent_pid is None or os.getppid() == parent_pid:
+        store.requeue_stale()
+        job = store.claim(owner)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        try:
+            run_job(store, job, predictor_factory(), owner)
+        except Exception as exc:
+            store.fail(job["id"], owner, f"{type(exc).__name__}: {exc}")
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+_WORKERS = []
+
+
+def get_job_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = JobStore()
+        return _STORE
+
+
+def start_job_workers(count=JOB_WORKERS):
+    # Worker processes at lower CPU priority (JOB_NICE), so large jobs yield
+    # to interactive /score requests. They are separate interpreters rather
+    # than forks: they exit with the process that started them, not with a
+    # pre-forked web worker that happens to inherit the handles.
+    with _STORE_LOCK:
+        if _WORKERS or count <= 0:
+            return list(_WORKERS)
+        parent_pid = os.getpid()
+        for _ in range(count):
+            _WORKERS.append(subprocess.Popen(
+                [sys.executable, "-m", "utils.jobs", "--parent-pid", str(parent_pid)],
+                cwd=BASE_DIR,
+            ))
+
+        def stop():
+            if os.getpid() == parent_pid:
+                for process in _WORKERS:
+                    process.terminate()
+
+        atexit.register(stop)
+        return list(_WORKERS)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Batch scoring job worker")
+    parser.add_argument(
+        "--parent-pid",
+        type=int,
+        help="Exit when this process is no longer the parent.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from api.endpoints import get_predictor
+    from utils.artifacts import missing_artifacts
+
+    args = _parse_args()
+    try:
+        os.nice(JOB_NICE)
+    except OSError:
+        pass
+    # On a fresh install the web app is still building the model; leave
+    # jobs queued until it exists rather than failing them.
+    while missing_artifacts():
+        if args.parent_pid is not None and os.getppid() != args.parent_pid:
+            sys.exit(0)
+        time.sleep(JOB_POLL_SECONDS)
+    work(get_predictor, parent_pid=args.parent_pid)
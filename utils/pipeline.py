@@ -0,0 +1,524 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+
+from config.settings import (
+    BASE_DIR,
+    DEFAULT_BBOX,
+    FEATURE_STORE_BACKFILL,
+    FEATURE_STORE_ENABLED,
+    GEE_MOCK_ENABLED,
+    MODEL_PATH,
+    MODEL_SELECTION,
+    PIPELINE_DIR,
+    PIPELINE_KEEP,
+    POWER_BBOX,
+    POWER_CACHE_DIR,
+    POWER_END_DATE,
+    POWER_GRID_SIZE,
+    POWER_MAX_WORKERS,
+    POWER_RETRIES,
+    POWER_START_DATE,
+    POWER_USE_DATASET_BBOX,
+    RANDOM_SEED,
+    RESULTS_DIR,
+    TRAIN_WORKERS,
+    USE_NASA_POWER,
+)
+from models.inference_bundle import bundle_path_for, ensure_bundle
+from utils.instrumentation import span
+from utils.storage import artifact_path, storage_format
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# What `python -m utils.artifacts` builds before run.py has recorded a run:
+# the model plus a scored synthetic sample for the web app.
+DEFAULT_OPTIONS = {
+    "n_samples": 1400,
+    "points": "synthetic",
+    "reports": False,
+}
+PUBLISHED_PATH = os.path.join(PIPELINE_DIR, "published.json")
+
+
+class Stage:
+    # One node of the artifact graph. ``build(inputs, out_dir)`` writes the
+    # stage's files into ``out_dir``; ``inputs`` maps each dependency to its
+    # output directory (None for a failed optional stage). ``publish`` maps
+    # output names to the paths the rest of the app reads them from.
+    def __init__(self, name, build, params=None, deps=(), code=(), publish=None, optional=False):
+        self.name = name
+        self.build = build
+        self.params = params or {}
+        self.deps = tuple(deps)
+        self.code = tuple(code)
+        self.publish = publish or {}
+        self.optional = optional
+
+    def key(self, dep_keys):
+        # Hash of everything that can change the output: parameters, the
+        # source of the modules that compute it and the upstream keys.
+        spec = {
+            "stage": self.name,
+            "params": self.params,
+            "deps": {name: dep_keys[name] for name in self.deps},
+            "code": {path: _file_digest(path) for path in self.code},
+        }
+        encoded = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+_DIGESTS = {}
+
+
+def _file_digest(path):
+    full_path = os.path.join(BASE_DIR, path)
+    stat = os.stat(full_path)
+    cached = _DIGESTS.get(path)
+    if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+        with open(full_path, "rb") as handle:
+            cached = ((stat.st_mtime_ns, stat.st_size), hashlib.sha256(handle.read()).hexdigest())
+        _DIGESTS[path] = cached
+    return cached[1]
+
+
+# Source files behind each stage.
+_DATASET_CODE = ("data/synthetic_data.py", "data/gee_mock.py", "utils/data_simulator.py")
+_FEATURE_CODE = ("utils/feature_engineer.py",)
+_MODEL_CODE = ("models/model_train.py", "models/inference_bundle.py")
+_PREDICT_CODE = (
+    "predictor/aqua_predictor.py",
+    "models/inference_bundle.py",
+    "utils/data_simulator.py",
+    "utils/feature_engineer.py",
+)
+
+
+def _build_power(inputs, out_dir, params):
+    import pandas as pd
+
+    from data.nasa_power import load_or_fetch_power_grid
+    from utils.storage import write_table
+
+    power_df = load_or_fetch_power_grid(
+        bbox=params["bbox"],
+        start_date=params["start_date"],
+        end_date=params["end_date"],
+        grid_size=params["grid_size"],
+        cache_path=artifact_path("nasa_power_cache"),
+        allow_network=True,
+        verbose=True,
+        cache_dir=POWER_CACHE_DIR,
+        max_workers=POWER_MAX_WORKERS,
+        retries=POWER_RETRIES,
+    )
+    pd.to_pickle(power_df, os.path.join(out_dir, "power.pkl"))
+    write_table(power_df, os.path.join(out_dir, f"power.{params['format']}"))
+
+
+def _build_dataset(inputs, out_dir, params):
+    import pandas as pd
+
+    from data.synthetic_data import generate_synthetic_dataset
+
+    power_df = None
+    if inputs.get("power"):
+        power_df = pd.read_pickle(os.path.join(inputs["power"], "power.pkl"))
+    data = generate_synthetic_dataset(
+        n_samples=params["n_samples"],
+        bbox=params["bbox"],
+        seed=params["seed"],
+        power_df=power_df,
+        use_gee_mock=params["use_gee_mock"],
+        gee_bbox=params["bbox"],
+        columnar=params["columnar"],
+    )
+    pd.to_pickle(data, os.path.join(out_dir, "dataset.pkl"))
+
+
+def _build_features(inputs, out_dir, params):
+    import pandas as pd
+
+    from utils.feature_engineer import build_feature_frame
+
+    data = pd.read_pickle(os.path.join(inputs["dataset"], "dataset.pkl"))
+    pd.to_pickle(build_feature_frame(data), os.path.join(out_dir, "features.pkl"))
+
+
+def _build_model(inputs, out_dir, params, workers=TRAIN_WORKERS):
+    import numpy as np
+    import pandas as pd
+
+    from models.model_train import train_model
+
+    features = pd.read_pickle(os.path.join(inputs["features"], "features.pkl"))
+    _, diagnostics = train_model(
+        None,
+        os.path.join(out_dir, "model.joblib"),
+        report_path=os.path.join(out_dir, "report.json"),
+        workers=workers,
+        selection=params["selection"],
+        features=features,
+    )
+    np.savez(
+        os.path.join(out_dir, "diagnostics.npz"),
+        **{name: np.asarray(values, dtype=float) for name, values in diagnostics.items()},
+    )
+
+
+def _build_points(inputs, out_dir, params):
+    import pandas as pd
+
+    from data.synthetic_data import generate_synthetic_dataset
+    from predictor.aqua_predictor import AquaSentinelPredictor
+    from utils.feature_store import FeatureStore
+    from utils.storage import write_table
+
+    if params["source"] == "sample":
+        # A sample of the training rows (run.py).
+        data = pd.read_pickle(os.path.join(inputs["dataset"], "dataset.pkl"))
+        data = data.sample(params["n"], random_state=params["seed"]).copy()
+    else:
+        data = generate_synthetic_dataset(
+            n_samples=params["n_samples"],
+            n_locations=params["n_locations"],
+            samples_per_location=params["samples_per_location"],
+            seed=params["seed"],
+            use_gee_mock=params["use_gee_mock"],
+        )
+    # Scored with the same windowed features as /api/score: a fresh store
+    # holds only backfilled history, which is what the served store has for
+    # any cell without observed drivers.
+    feature_store = None
+    if params["feature_store"]:
+        feature_store = FeatureStore(backfill=params["feature_store_backfill"], max_cells=0)
+    predictor = AquaSentinelPredictor(
+        os.path.join(inputs["model"], "model.joblib"), feature_store=feature_store
+    )
+    data = _score_points(predictor, data, params["intervals"])
+    write_table(data, os.path.join(out_dir, f"points.{params['format']}"))
+
+
+def _score_points(predictor, data, intervals):
+    scores, lower, upper = predictor.predict_batch(data["lat"], data["lon"], data["date"])
+    data["risk_score"] = scores
+    if intervals:
+        data["interval_lower"], data["interval_upper"] = lower, upper
+    return data
+
+
+def rescore_points(model_path=MODEL_PATH):
+    # Rescores the published points in place with ``model_path``, as the
+    # points stage would; for a model updated outside the pipeline
+    # (update_model), which leaves the stage keys unchanged.
+    from predictor.aqua_predictor import AquaSentinelPredictor
+    from utils.feature_store import FeatureStore
+    from utils.storage import read_table, write_table
+
+    path = artifact_path("risk_scored_points")
+    if not os.path.exists(path):
+        return None
+    feature_store = None
+    if FEATURE_STORE_ENABLED:
+        feature_store = FeatureStore(backfill=FEATURE_STORE_BACKFILL, max_cells=0)
+    predictor = AquaSentinelPredictor(model_path, feature_store=feature_store)
+    with build_lock():
+        data = read_table(path)
+        data = _score_points(predictor, data, "interval_lower" in data.columns)
+        write_table(data, path)
+    return path
+
+
+def _build_map(inputs, out_dir, params):
+    from utils.storage import read_table
+    from visualization.risk_mapper import generate_risk_map
+
+    points = read_table(os.path.join(inputs["points"], f"points.{params['format']}"))
+    generate_risk_map(points, os.path.join(out_dir, "risk_map.html"))
+
+
+def _build_diagnostics(inputs, out_dir, params):
+    import numpy as np
+
+    from visualization.model_diagnostics import save_diagnostic_plots
+
+    diagnostics = np.load(os.path.join(inputs["model"], "diagnostics.npz"))
+    save_diagnostic_plots(
+        diagnostics["y_test"], diagnostics["preds"], os.path.join(out_dir, "model_diagnostics")
+    )
+
+
+def build_stages(options=None, workers=None):
+    # The stage list, in dependency order, for a set of run options (as
+    # recorded from run.py); unset options come from config.settings.
+    options = {**DEFAULT_OPTIONS, **(options or {})}
+    fmt = storage_format()
+    bbox = options.get("bbox") or DEFAULT_BBOX
+    use_gee_mock = bool(options.get("use_gee_mock")) or GEE_MOCK_ENABLED
+
+    stages = []
+    dataset_deps = ()
+    if options.get("use_nasa_power") or USE_NASA_POWER:
+        power_bbox = options.get("power_bbox") or (bbox if POWER_USE_DATASET_BBOX else POWER_BBOX)
+        stages.append(Stage(
+            "power",
+            _build_power,
+            params={
+                "bbox": power_bbox,
+                "start_date": POWER_START_DATE,
+                "end_date": POWER_END_DATE,
+                "grid_size": options.get("power_grid_size") or POWER_GRID_SIZE,
+                "format": fmt,
+            },
+            code=("data/nasa_power.py",),
+            publish={f"power.{fmt}": artifact_path("nasa_power_sample")},
+            optional=True,
+        ))
+        dataset_deps = ("power",)
+    stages.append(Stage(
+        "dataset",
+        _build_dataset,
+        params={
+            "n_samples": options["n_samples"],
+            "bbox": bbox,
+            "seed": RANDOM_SEED,
+            "use_gee_mock": use_gee_mock,
+            "columnar": bool(options.get("columnar")),
+        },
+        deps=dataset_deps,
+        code=_DATASET_CODE,
+    ))
+    stages.append(Stage("features", _build_features, deps=("dataset",), code=_FEATURE_CODE))
+    # Training is seeded, so the worker count does not change the model and
+    # is not part of the key.
+    stages.append(Stage(
+        "model",
+        partial(_build_model, workers=workers or TRAIN_WORKERS),
+        params={"selection": options.get("selection") or MODEL_SELECTION},
+        deps=("features",),
+        code=_MODEL_CODE,
+        # The bundle goes first: a predictor reloads when the model file
+        # changes, and must find the matching bundle already in place.
+        publish={
+            "model_bundle": bundle_path_for(MODEL_PATH),
+            "report.json": os.path.join(RESULTS_DIR, "model_report.json"),
+            "model.joblib": MODEL_PATH,
+        },
+    ))
+    if options["points"] == "sample":
+        points_params = {"source": "sample", "n": 150, "seed": 24, "intervals": False}
+        points_deps = ("model", "dataset")
+        points_code = _PREDICT_CODE
+    else:
+        points_params = {
+            "source": "synthetic",
+            "n_samples": 2400,
+            "n_locations": 80,
+            "samples_per_location": 20,
+            "seed": RANDOM_SEED,
+            "use_gee_mock": use_gee_mock,
+            "intervals": True,
+        }
+        points_deps = ("model",)
+        points_code = _PREDICT_CODE + _DATASET_CODE
+    stages.append(Stage(
+        "points",
+        _build_points,
+        params={
+            **points_params,
+            "format": fmt,
+            "feature_store": FEATURE_STORE_ENABLED,
+            "feature_store_backfill": FEATURE_STORE_BACKFILL,
+        },
+        deps=points_deps,
+        code=points_code + ("utils/feature_store.py", "utils/storage.py"),
+        publish={f"points.{fmt}": artifact_path("risk_scored_points")},
+    ))
+    if options.get("reports"):
+        stages.append(Stage(
+            "map",
+            _build_map,
+            params={"format": fmt},
+            deps=("points",),
+            code=("visualization/risk_mapper.py", "visualization/tiles.py"),
+            publish={"risk_map.html": os.path.join(RESULTS_DIR, "risk_map.html")},
+        ))
+        stages.append(Stage(
+            "diagnostics",
+            _build_diagnostics,
+            deps=("model",),
+            code=("visualization/model_diagnostics.py",),
+            publish={
+                name: os.path.join(RESULTS_DIR, name)
+                for name in ("model_diagnostics_fit.png", "model_diagnostics_residuals.png")
+            },
+        ))
+    return stages
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def recorded_options():
+    # The options of the last published run, or the defaults.
+    published = _read_json(PUBLISHED_PATH) or {}
+    return published.get("options") or dict(DEFAULT_OPTIONS)
+
+
+def stage_keys(stages):
+    keys = {}
+    for stage in stages:
+        keys[stage.name] = stage.key(keys)
+    return keys
+
+
+def stale_stages(options=None):
+    # Stages whose published output no longer matches their inputs, settings
+    # or code. Hashes a handful of source files; imports nothing heavy.
+    published = _read_json(PUBLISHED_PATH) or {}
+    stages = build_stages(options if options is not None else recorded_options())
+    keys = stage_keys(stages)
+    done = published.get("stages", {})
+    return [stage.name for stage in stages if stage.publish and done.get(stage.name) != keys[stage.name]]
+
+
+@contextmanager
+def build_lock():
+    # Serializes builds across processes (run.py, `python -m utils.artifacts`,
+    # and the web app's background build).
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    with open(os.path.join(PIPELINE_DIR, ".lock"), "w") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def _copy(source, dest):
+    # Copies keep the source mtime, which the predictor and points reload
+    # checks compare against; the bundle is keyed on the model's content.
+    tmp_path = f"{dest}.tmp.{os.getpid()}"
+    if os.path.isdir(source):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.copytree(source, tmp_path)
+        shutil.rmtree(dest, ignore_errors=True)
+    else:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def _publish(stage, out_dir):
+    for name, dest in stage.publish.items():
+        source = os.path.join(out_dir, name)
+        if os.path.exists(source):
+            _copy(source, dest)
+        elif os.path.isdir(dest):
+            # e.g. no compiled bundle for this model type.
+            shutil.rmtree(dest, ignore_errors=True)
+
+
+def _prune(stage_name, current_key, keep=PIPELINE_KEEP):
+    # Keeps the ``keep`` most recently used builds of a stage.
+    stage_dir = os.path.join(PIPELINE_DIR, stage_name)
+    entries = []
+    for name in os.listdir(stage_dir):
+        path = os.path.join(stage_dir, name)
+        if name != current_key and os.path.exists(os.path.join(path, "stage.json")):
+            entries.append((os.stat(path).st_mtime, path))
+    for _, path in sorted(entries, reverse=True)[max(keep - 1, 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def run_pipeline(options=None, workers=None, verbose=False):
+    # Builds what is missing or invalidated and reuses the rest; then copies
+    # changed outputs to their usual paths. Returns {stage: {"key",
+    # "status", "seconds", "path"}} with status "built", "reused" or "failed".
+    if options is None:
+        options = recorded_options()
+    stages = build_stages(options, workers=workers)
+    report = {}
+    with build_lock():
+        published = _read_json(PUBLISHED_PATH) or {}
+        done = published.get("stages", {})
+        keys = {}
+        dirs = {}
+        for stage in stages:
+            key = stage.key(keys)
+            out_dir = os.path.join(PIPELINE_DIR, stage.name, key)
+            meta_path = os.path.join(out_dir, "stage.json")
+            started = time.perf_counter()
+            if os.path.exists(meta_path):
+                status = "reused"
+                os.utime(out_dir)
+            else:
+                status = "built"
+                tmp_path = f"{out_dir}.tmp.{os.getpid()}"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                os.makedirs(tmp_path)
+                try:
+                    with span(f"pipeline.{stage.name}"):
+                        stage.build({name: dirs[name] for name in stage.deps}, tmp_path, stage.params)
+                except Exception as exc:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    if not stage.optional:
+                        raise
+                    # Dependents are keyed as if the stage did not exist.
+                    print(f"Stage {stage.name} failed, continuing without it: {exc}")
+                    keys[stage.name] = dirs[stage.name] = None
+                    report[stage.name] = {"key": None, "status": "failed", "seconds": 0.0, "path": None}
+                    continue
+                _write_json(os.path.join(tmp_path, "stage.json"), {
+                    "stage": stage.name,
+                    "key": key,
+                    "params": stage.params,
+                    "deps": {name: keys[name] for name in stage.deps},
+                    "built": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+                    "seconds": round(time.perf_counter() - started, 3),
+                })
+                shutil.rmtree(out_dir, ignore_errors=True)
+                os.replace(tmp_path, out_dir)
+            keys[stage.name] = key
+            dirs[stage.name] = out_dir
+            if done.get(stage.name) != key or any(
+                not os.path.exists(dest) for dest in stage.publish.values()
+            ):
+                _publish(stage, out_dir)
+            _prune(stage.name, key)
+            report[stage.name] = {
+                "key": key,
+                "status": status,
+                "seconds": round(time.perf_counter() - started, 3),
+                "path": out_dir,
+            }
+            if verbose:
+                print(f"{stage.name:<12} {status:<7} {key}  {report[stage.name]['seconds']:.2f}s")
+
+        # The served model may have been replaced since (update_model, a
+        # restore); recompile its bundle if it no longer matches.
+        ensure_bundle(MODEL_PATH)
+        _write_json(PUBLISHED_PATH, {
+            "options": options,
+            "stages": {name: key for name, key in keys.items() if key is not None},
+        })
+    return report
@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.spatial_index import GridIndex
+from utils.storage import artifact_path, read_table
+from visualization.tiles import ClusterPyramid
+
+
+STREAM_CHUNK_ROWS = 2000
+RESPONSE_CACHE_SIZE = 32
+RESPONSE_CACHE_MAX_ROWS = 50000
+PYRAMID_CACHE_SIZE = 8
+PYRAMID_CACHE_MAX_POINTS = 4_000_000
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    return np.datetime64(value, "D").astype(np.int64)
+
+
+class _Snapshot:
+    # Immutable, date-sorted view of one version of the points file.
+    def __init__(self, frame, mtime):
+        self.mtime = mtime
+        frame = frame.sort_values("date", kind="stable").reset_index(drop=True)
+        days = frame["date"].to_numpy().astype("datetime64[D]")
+        self.days = days.astype(np.int64)
+        self.columns = sorted(frame.columns)
+        self.values = {
+            column: (
+                np.datetime_as_string(days, unit="D")
+                if column == "date"
+                else frame[column].to_numpy()
+            )
+            for column in self.columns
+        }
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self._spatial = None
+        self._pyramids = OrderedDict()
+
+    def __len__(self):
+        return len(self.days)
+
+    def bounds(self, start_date=None, end_date=None, limit=None):
+        start_day = _parse_day(start_date)
+        end_day = _parse_day(end_date)
+        lo = 0 if start_day is None else int(np.searchsorted(self.days, start_day, "left"))
+        hi = len(self.days) if end_day is None else int(np.searchsorted(self.days, end_day, "right"))
+        hi = max(lo, hi)
+        if limit:
+            hi = min(hi, lo + limit)
+        return lo, hi
+
+    def spatial_index(self):
+        # Built on first spatial query; date-only queries never pay for it.
+        if self._spatial is None:
+            with self.lock:
+                if self._spatial is None:
+                    self._spatial = GridIndex(self.values["lat"], self.values["lon"])
+        return self._spatial
+
+    def pyramid(self, start_date=None, end_date=None):
+        # One cluster pyramid per row range (any start/end strings selecting
+        # the same rows share it). At most PYRAMID_CACHE_SIZE pyramids and
+        # PYRAMID_CACHE_MAX_POINTS points in total are kept, least recently
+        # used dropped first; the newest is always kept.
+        key = self.bounds(start_date, end_date)
+        with self.lock:
+            pyramid = self._pyramids.get(key)
+            if pyramid is not None:
+                self._pyramids.move_to_end(key)
+                return pyramid
+        lo, hi = key
+        pyramid = ClusterPyramid(
+            self.values["lat"][lo:hi], self.values["lon"][lo:hi], self.values["risk_score"][lo:hi]
+        )
+        with self.lock:
+            pyramid = self._pyramids.setdefault(key, pyramid)
+            self._pyramids.move_to_end(key)
+            while len(self._pyramids) > 1 and (
+                len(self._pyramids) > PYRAMID_CACHE_SIZE
+                or sum(len(cached) for cached in self._pyramids.values()) > PYRAMID_CACHE_MAX_POINTS
+            ):
+                self._pyramids.popitem(last=False)
+        return pyramid
+
+    def select(
+        self,
+        start_date=None,
+        end_date=None,
+        limit=None,
+        bbox=None,
+        center=None,
+        radius_km=None,
+        k=None,
+    ):
+        # Returns (cache key, row slice or index array, distances or None).
+        # Spatial results keep date order except k-nearest, ordered by distance.
+        if bbox is None and center is None:
+            lo, hi = self.bounds(start_date, end_date, limit)
+            return (lo, hi), slice(lo, hi), None
+
+        lo, hi = self.bounds(start_date, end_date)
+        index = self.spatial_index()
+        distances = None
+        if center is not None and k:
+            indices, distances = index.nearest(center[0], center[1], k, lo, hi)
+            if radius_km is not None:
+                indices, distances = indices[distances <= radius_km], distances[distances <= radius_km]
+        elif center is not None:
+            indices, distances = index.within_radius(center[0], center[1], radius_km, lo, hi)
+        else:
+            indices = index.within_bbox(*bbox, lo, hi)
+        if limit:
+            indices = indices[:limit]
+            if distances is not None:
+                distances = distances[:limit]
+        key = (lo, hi, limit, bbox, center, radius_km, k)
+        return key, indices, distances
+
+    def records(self, rows, distances=None):
+        columns = [self.values[column][rows].tolist() for column in self.columns]
+        names = self.columns
+        if distances is not None:
+            columns.append(np.round(distances, 3).tolist())
+            names = self.columns + ["distance_km"]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    def _encode(self, rows, distances):
+        if isinstance(rows, slice):
+            for chunk_lo in range(rows.start, rows.stop, STREAM_CHUNK_ROWS):
+                chunk_hi = min(rows.stop, chunk_lo + STREAM_CHUNK_ROWS)
+                yield json.dumps(self.records(slice(chunk_lo, chunk_hi)))[1:-1]
+            return
+        for chunk_lo in range(0, len(rows), STREAM_CHUNK_ROWS):
+            chunk = slice(chunk_lo, chunk_lo + STREAM_CHUNK_ROWS)
+            chunk_distances = None if distances is None else distances[chunk]
+            yield json.dumps(self.records(rows[chunk], chunk_distances))[1:-1]
+
+    def iter_json(self, key, rows, distances=None):
+        with self.lock:
+            cached = self.responses.get(key)
+            if cached is not None:
+                self.responses.move_to_end(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        yield "["
+        for body in self._encode(rows, distances):
+            if not body:
+                continue
+            piece = body if not parts else "," + body
+            parts.append(piece)
+            yield piece
+        yield "]"
+
+        size = rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+        if size <= RESPONSE_CACHE_MAX_ROWS:
+            with self.lock:
+                self.responses[key] = "[" + "".join(parts) + "]"
+                while len(self.responses) > RESPONSE_CACHE_SIZE:
+                    self.responses.popitem(last=False)
+
+
+class PointsStore:
+    # Process-wide scored points, loaded once and reloaded only when the
+    # file's mtime changes.
+    def __init__(self, path=None):
+        self.path = path or artifact_path("risk_scored_points")
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            from utils.artifacts import require_artifacts
+
+            require_artifacts()
+            mtime = os.stat(self.path).st_mtime_ns
+
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.mtime != mtime:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.mtime != mtime:
+                    snapshot = _Snapshot(read_table(self.path), mtime)
+                    self._snapshot = snapshot
+        return snapshot
+
+    def query(self, start_date=None, end_date=None, limit=None, **spatial):
+        snapshot = self.snapshot()
+        _, rows, distances = snapshot.select(start_date, end_date, limit, **spatial)
+        return snapshot.records(rows, distances)
+
+    def iter_json(self, start_date=None, end_date=None, limit=None, **spatial):
+        snapshot = self.snapshot()
+        key, rows, distances = snapshot.select(start_date, end_date, limit, **spatial)
+        return snapshot.iter_json(key, rows, distances)
+
+    def tile_json(self, z, x, y, start_date=None, end_date=None):
+        return self.snapshot().pyramid(start_date, end_date).tile_json(z, x, y)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_points_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = PointsStore()
+        return _STORE
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from config.settings import (
+    PREDICTION_CACHE_DECIMALS,
+    PREDICTION_CACHE_SIZE,
+    PREDICTION_CACHE_TTL,
+)
+
+
+def _date_key(date):
+    if isinstance(date, str):
+        return datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+    return date.strftime("%Y-%m-%d")
+
+
+class PredictionCache:
+    # LRU with per-entry TTL for single-point predictions, keyed on
+    # ((model version, feature store version), rounded lat, rounded lon,
+    # date). A miss is scored at the coordinate the caller sent, so only later
+    # requests in the same bucket get an answer from a nearby point (4
+    # decimals, about 11 m: scores differ by well under 1e-3).
+    def __init__(
+        self,
+        maxsize=PREDICTION_CACHE_SIZE,
+        ttl=PREDICTION_CACHE_TTL,
+        decimals=PREDICTION_CACHE_DECIMALS,
+        clock=time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires >= self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            if key[0] != self._version:
+                return
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def _check_version(self, version):
+        # A new model file or new driver observations in the feature store
+        # make every entry stale; drop them at once.
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    if self._version is not None:
+                        self.invalidations += 1
+                    self._entries.clear()
+                    self._version = version
+
+    def key(self, predictor, lat, lon, date):
+        version = (predictor.version, getattr(predictor.feature_store, "version", None))
+        self._check_version(version)
+        lat = float(np.round(float(lat), self.decimals))
+        lon = float(np.round(float(lon), self.decimals))
+        return (version, lat, lon, _date_key(date))
+
+    def predict_with_interval(self, predictor, lat, lon, date):
+        key = self.key(predictor, lat, lon, date)
+        value = self.get(key)
+        if value is None:
+            value = predictor.predict_with_interval(lat, lon, date)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "model_version": self._version[0] if self._version else None,
+                "feature_store_version": self._version[1] if self._version else None,
+            }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_prediction_cache():
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = PredictionCache()
+        return _CACHE
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from config.settings import (
+    DEFAULT_BBOX,
+    GRID_CUBE_DIR,
+    GRID_DAYS,
+    GRID_RESOLUTION_DEG,
+    GRID_START_DATE,
+)
+
+
+CUBE_FORMAT = 1
+BANDS = ["score", "interval_lower", "interval_upper"]
+
+
+def _day(value):
+    return np.datetime64(value, "D")
+
+
+def grid_axes(bbox, resolution):
+    # Cell centres from the bbox minimum in steps of ``resolution``; the
+    # maximum is included when it falls on the grid.
+    n_lat = int(np.floor((bbox["lat_max"] - bbox["lat_min"]) / resolution + 1e-9)) + 1
+    n_lon = int(np.floor((bbox["lon_max"] - bbox["lon_min"]) / resolution + 1e-9)) + 1
+    lats = np.round(bbox["lat_min"] + resolution * np.arange(n_lat), 6)
+    lons = np.round(bbox["lon_min"] + resolution * np.arange(n_lon), 6)
+    return lats, lons
+
+
+def feature_store_version(feature_store):
+    # What a cube records about the drivers it was scored with; None without
+    # a feature store.
+    return feature_store.fingerprint() if feature_store is not None else None
+
+
+def build_cube(
+    predictor,
+    path=GRID_CUBE_DIR,
+    bbox=DEFAULT_BBOX,
+    resolution=GRID_RESOLUTION_DEG,
+    start_date=GRID_START_DATE,
+    days=GRID_DAYS,
+    verbose=False,
+):
+    # Scores every cell for every day into a (day, lat, lon, band) float32
+    # array. Days are scored in order, one day per predict_batch call, so a
+    # feature store only has to fill in one new day of history per cell.
+    lats, lons = grid_axes(bbox, resolution)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    grid_lat, grid_lon = grid_lat.ravel(), grid_lon.ravel()
+    start = _day(start_date)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    cube = np.lib.format.open_memmap(
+        os.path.join(tmp_path, "cube.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(days, len(lats), len(lons), len(BANDS)),
+    )
+    for offset in range(days):
+        date = str(start + offset)
+        scores, lower, upper = predictor.predict_batch(grid_lat, grid_lon, date)
+        if lower is None:
+            lower = upper = np.full(len(scores), np.nan)
+        cube[offset] = np.stack([scores, lower, upper], axis=1).reshape(len(lats), len(lons), len(BANDS))
+        if verbose:
+            print(f"Scored {date} ({offset + 1}/{days})")
+    cube.flush()
+    del cube
+
+    meta = {
+        "format": CUBE_FORMAT,
+        "bbox": dict(bbox),
+        "resolution": resolution,
+        "lat0": float(lats[0]),
+        "lon0": float(lons[0]),
+        "n_lat": len(lats),
+        "n_lon": len(lons),
+        "start_date": str(start),
+        "days": days,
+        "bands": BANDS,
+        "model_version": predictor.version,
+        "feature_store_version": feature_store_version(predictor.feature_store),
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as handle:
+        json.dump(meta, handle, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+class RiskCube:
+    # Read-only, memory-mapped view of a built cube. Each day is one
+    # contiguous (lat, lon, band) block, so a date lookup touches one chunk.
+    def __init__(self, path=GRID_CUBE_DIR, mmap_mode="r"):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as handle:
+            self.meta = json.load(handle)
+        self.values = np.load(os.path.join(path, "cube.npy"), mmap_mode=mmap_mode)
+        self.resolution = self.meta["resolution"]
+        self.lat0 = self.meta["lat0"]
+        self.lon0 = self.meta["lon0"]
+        self.n_lat = self.meta["n_lat"]
+        self.n_lon = self.meta["n_lon"]
+        self.start = _day(self.meta["start_date"])
+        self.days = self.meta["days"]
+        self.model_version = self.meta["model_version"]
+        self.feature_store_version = self.meta.get("feature_store_version")
+        self.lats = self.lat0 + self.resolution * np.arange(self.n_lat)
+        self.lons = self.lon0 + self.resolution * np.arange(self.n_lon)
+
+    def day_index(self, date):
+        offset = int((_day(date) - self.start).astype(np.int64))
+        return offset if 0 <= offset < self.days else None
+
+    def _position(self, lat, lon):
+        row = (float(lat) - self.lat0) / self.resolution
+        col = (float(lon) - self.lon0) / self.resolution
+        if -1e-9 <= row <= self.n_lat - 1 + 1e-9 and -1e-9 <= col <= self.n_lon - 1 + 1e-9:
+            return row, col
+        return None
+
+    def lookup(self, lat, lon, date, method="nearest"):
+        # (score, lower, upper) from the cell(s) around the point, or None
+        # when the point or date is outside the cube.
+        day = self.day_index(date)
+        position = self._position(lat, lon)
+        if day is None or position is None:
+            return None
+        row, col = position
+        block = self.values[day]
+        if method == "bilinear":
+            r0 = min(int(np.floor(row)), self.n_lat - 2) if self.n_lat > 1 else 0
+            c0 = min(int(np.floor(col)), self.n_lon - 2) if self.n_lon > 1 else 0
+            fr = min(max(row - r0, 0.0), 1.0) if self.n_lat > 1 else 0.0
+            fc = min(max(col - c0, 0.0), 1.0) if self.n_lon > 1 else 0.0
+            r1 = min(r0 + 1, self.n_lat - 1)
+            c1 = min(c0 + 1, self.n_lon - 1)
+            values = (
+                (1 - fr) * (1 - fc) * block[r0, c0].astype(float)
+                + (1 - fr) * fc * block[r0, c1]
+                + fr * (1 - fc) * block[r1, c0]
+                + fr * fc * block[r1, c1]
+            )
+        else:
+            values = block[int(round(row)), int(round(col))].astype(float)
+        score, lower, upper = (float(value) for value in values)
+        return (
+            score,
+            None if np.isnan(lower) else lower,
+            None if np.isnan(upper) else upper,
+        )
+
+    def select(self, start_date=None, end_date=None, bbox=None, stride=1):
+        # Index ranges for a date range and (lat_min, lat_max, lon_min,
+        # lon_max) box, every ``stride``-th cell.
+        first = self.day_index(start_date) if start_date else 0
+        last = self.day_index(end_date) if end_date else self.days - 1
+        if first is None or last is None or first > last:
+            raise ValueError("date range")
+        rows = np.arange(self.n_lat)[::stride]
+        cols = np.arange(self.n_lon)[::stride]
+        if bbox is not None:
+            lat_min, lat_max, lon_min, lon_max = bbox
+            rows = rows[(self.lats[rows] >= lat_min - 1e-9) & (self.lats[rows] <= lat_max + 1e-9)]
+            cols = cols[(self.lons[cols] >= lon_min - 1e-9) & (self.lons[cols] <= lon_max + 1e-9)]
+        return np.arange(first, last + 1), rows, cols
+
+    def slice_json(self, days, rows, cols, bands=BANDS):
+        # Nested [day][lat][lon] lists per band, rounded to 2 decimals.
+        band_index = [BANDS.index(band) for band in bands]
+        block = self.values[days[0]:days[-1] + 1][:, rows][:, :, cols][..., band_index]
+        block = np.round(block.astype(float), 2)
+        return json.dumps({
+            "dates": [str(self.start + int(day)) for day in days],
+            "lats": np.round(self.lats[rows], 6).tolist(),
+            "lons": np.round(self.lons[cols], 6).tolist(),
+            "resolution": self.resolution,
+            "model_version": self.model_version,
+            "bands": {
+                band: np.where(np.isnan(block[..., pos]), None, block[..., pos]).tolist()
+                for pos, band in enumerate(bands)
+            },
+        }, separators=(",", ":"))
+
+
+_CUBE = None
+_CUBE_LOCK = threading.Lock()
+
+
+def get_risk_cube(path=GRID_CUBE_DIR):
+    # The built cube, reopened when it is rebuilt; None until one exists.
+    global _CUBE
+    meta_path = os.path.join(path, "meta.json")
+    try:
+        mtime = os.stat(meta_path).st_mtime_ns
+    except OSError:
+        return None
+    with _CUBE_LOCK:
+        if _CUBE is None or _CUBE[0] != (path, mtime):
+            _CUBE = ((path, mtime), RiskCube(path))
+        return _CUBE[1]
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Precompute the daily risk grid")
+    parser.add_argument("--start", default=GRID_START_DATE, help="First date, YYYY-MM-DD.")
+    parser.add_argument("--days", type=int, default=GRID_DAYS, help="Number of days.")
+    parser.add_argument(
+        "--resolution",
+        type=float,
+        default=GRID_RESOLUTION_DEG,
+        help="Cell size in degrees.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from api.endpoints import get_feature_store, get_predictor
+    from utils.artifacts import ensure_artifacts
+
+    args = _parse_args()
+    ensure_artifacts()
+    cube_path = build_cube(
+        get_predictor(),
+        start_date=args.start,
+        days=args.days,
+        resolution=args.resolution,
+        verbose=True,
+    )
+    feature_store = get_feature_store()
+    if feature_store is not None:
+        feature_store.save()
+    print(f"Saved risk grid: {cube_path}")
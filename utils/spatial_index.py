@@ -0,0 +1,114 @@
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+DEFAULT_CELL_DEG = 0.25
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GridIndex:
+    # Buckets point indices into cell_deg x cell_deg cells (CSR layout). Within
+    # a cell indices stay ascending, so callers keep their row order.
+    def __init__(self, lats, lons, cell_deg=DEFAULT_CELL_DEG):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.floor(180.0 / cell_deg)) + 1
+        self.n_cols = int(np.floor(360.0 / cell_deg)) + 1
+
+        rows, cols = self._cell(self.lats, self.lons)
+        cell_ids = rows * self.n_cols + cols
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.cells, starts, counts = np.unique(
+            cell_ids[self.order], return_index=True, return_counts=True
+        )
+        self.starts = starts
+        self.ends = starts + counts
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _cell(self, lats, lons):
+        rows = np.clip(((np.asarray(lats) + 90.0) // self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+        cols = np.clip(((np.asarray(lons) + 180.0) // self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+        return rows, cols
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max):
+        (row_lo, row_hi), (col_lo, col_hi) = self._cell(
+            [lat_min, lat_max], [lon_min, lon_max]
+        )
+        rows = np.arange(row_lo, row_hi + 1)
+        cols = np.arange(col_lo, col_hi + 1)
+        wanted = (rows[:, None] * self.n_cols + cols[None, :]).ravel()
+        positions = np.searchsorted(self.cells, wanted)
+        found = positions < len(self.cells)
+        positions, wanted = positions[found], wanted[found]
+        positions = positions[self.cells[positions] == wanted]
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(
+            [self.order[self.starts[pos]:self.ends[pos]] for pos in positions]
+        )
+
+    @staticmethod
+    def _in_range(indices, lo, hi):
+        if lo is None:
+            return indices
+        return indices[(indices >= lo) & (indices < hi)]
+
+    def within_bbox(self, lat_min, lat_max, lon_min, lon_max, lo=None, hi=None):
+        indices = self._in_range(self._candidates(lat_min, lat_max, lon_min, lon_max), lo, hi)
+        lats, lons = self.lats[indices], self.lons[indices]
+        mask = (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+        return np.sort(indices[mask])
+
+    def within_radius(self, lat, lon, radius_km, lo=None, hi=None):
+        lat_delta = radius_km / KM_PER_DEGREE
+        cos_lat = np.cos(np.radians(min(abs(lat) + lat_delta, 89.9)))
+        lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+        if lon_delta >= 180.0:
+            lon_ranges = [(-180.0, 180.0)]
+        else:
+            # Split ranges that cross the antimeridian.
+            west, east = lon - lon_delta, lon + lon_delta
+            lon_ranges = [(max(west, -180.0), min(east, 180.0))]
+            if west < -180.0:
+                lon_ranges.append((west + 360.0, 180.0))
+            if east > 180.0:
+                lon_ranges.append((-180.0, east - 360.0))
+        indices = np.concatenate([
+            self._candidates(lat - lat_delta, lat + lat_delta, west_lon, east_lon)
+            for west_lon, east_lon in lon_ranges
+        ])
+        indices = self._in_range(indices, lo, hi)
+        distances = haversine_km(lat, lon, self.lats[indices], self.lons[indices])
+        mask = distances <= radius_km
+        indices, distances = indices[mask], distances[mask]
+        order = np.argsort(indices, kind="stable")
+        return indices[order], distances[order]
+
+    def nearest(self, lat, lon, k, lo=None, hi=None):
+        # Grow the search radius until it holds k points; the k nearest then
+        # all lie inside it.
+        available = len(self) if lo is None else max(0, hi - lo)
+        k = min(k, available)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        radius_km = self.cell_deg * KM_PER_DEGREE
+        while True:
+            indices, distances = self.within_radius(lat, lon, radius_km, lo, hi)
+            if len(indices) >= k or radius_km >= np.pi * EARTH_RADIUS_KM:
+                break
+            radius_km *= 2.0
+        order = np.lexsort((indices, distances))[:k]
+        return indices[order], distances[order]
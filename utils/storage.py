@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+
+from config.settings import ARTIFACT_FORMAT, RESULTS_DIR
+from utils.instrumentation import timed
+
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _HAS_PYARROW = True
+except Exception:
+    pa = None
+    pq = None
+    _HAS_PYARROW = False
+
+
+ROW_GROUP_SIZE = 65536
+
+
+def storage_format():
+    if ARTIFACT_FORMAT == "parquet" and _HAS_PYARROW:
+        return "parquet"
+    return "csv"
+
+
+def artifact_path(name, directory=RESULTS_DIR):
+    return os.path.join(directory, f"{name}.{storage_format()}")
+
+
+@timed("storage.write_table")
+def write_table(df, path, row_group_size=ROW_GROUP_SIZE):
+    # Parquet tables are written sorted by a date32 "date" column so row-group
+    # statistics can skip everything outside a requested date range.
+    frame = df
+    if "date" in frame:
+        frame = frame.assign(date=pd.to_datetime(frame["date"]).dt.normalize())
+        frame = frame.sort_values("date", kind="stable")
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    if path.endswith(".parquet"):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if "date" in table.column_names:
+            position = table.column_names.index("date")
+            table = table.set_column(position, "date", table["date"].cast(pa.date32()))
+        pq.write_table(table, tmp_path, row_group_size=row_group_size)
+    else:
+        if "date" in frame:
+            frame = frame.assign(date=frame["date"].dt.strftime("%Y-%m-%d"))
+        frame.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+@timed("storage.read_table")
+def read_table(path, columns=None, start_date=None, end_date=None):
+    start = pd.Timestamp(start_date) if start_date else None
+    end = pd.Timestamp(end_date) if end_date else None
+
+    if path.endswith(".parquet"):
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", start.date()))
+        if end is not None:
+            filters.append(("date", "<=", end.date()))
+        table = pq.read_table(
+            path, columns=columns, filters=filters or None, memory_map=True
+        )
+        frame = table.to_pandas(date_as_object=False)
+    else:
+        frame = pd.read_csv(path, usecols=columns)
+        if "date" in frame:
+            frame["date"] = pd.to_datetime(frame["date"])
+            if start is not None:
+                frame = frame[frame["date"] >= start]
+            if end is not None:
+                frame = frame[frame["date"] <= end]
+
+    if "date" in frame:
+        frame["date"] = pd.to_datetime(frame["date"])
+    return frame.reset_index(drop=True)
+
+
+@timed("storage.export_csv")
+def export_csv(path, output):
+    if path.endswith(".csv"):
+        with open(path, "rb") as handle:
+            output.write(handle.read())
+        return output
+    frame = read_table(path)
+    if "date" in frame:
+        frame["date"] = frame["date"].dt.strftime("%Y-%m-%d")
+    output.write(frame.to_csv(index=False).encode("utf-8"))
+    return output
@@ -1,34 +1,129 @@
+import json
+
 import folium
-import geopandas as gpd
 
+from utils.instrumentation import timed
+from visualization.tiles import CLUSTER_COLUMNS, MAX_TILE_ZOOM, ClusterPyramid
+
+
+MAX_EMBED_ZOOM = 12
+MAX_EMBED_CLUSTERS = 20000
+
+
+_SHELL_SCRIPT = """
+(function () {
+  var map = %(map)s;
+  var config = %(config)s;
+  var renderer = L.canvas();
+  var layer = L.layerGroup().addTo(map);
+  var tiles = {};
+  var generation = 0;
+
+  function riskColor(score) {
+    return score >= 70 ? 'red' : score >= 40 ? 'orange' : 'green';
+  }
+
+  function marker(row) {
+    var count = row[2], mean = row[3], peak = row[4];
+    var popup = count === 1
+      ? 'Risk: ' + mean.toFixed(1)
+      : count + ' points<br/>Mean risk: ' + mean.toFixed(1) + '<br/>Max risk: ' + peak.toFixed(1);
+    return L.circleMarker([row[0], row[1]], {
+      renderer: renderer,
+      radius: count === 1 ? 6 : Math.min(6 + 3 * Math.log2(count), 24),
+      color: riskColor(mean),
+      fill: true,
+      fillOpacity: 0.7
+    }).bindPopup(popup);
+  }
+
+  function draw(rows) {
+    layer.clearLayers();
+    rows.forEach(function (row) { layer.addLayer(marker(row)); });
+  }
 
-def _risk_color(score):
-    if score >= 70:
-        return "red"
-    if score >= 40:
-        return "orange"
-    return "green"
+  function fetchTile(z, x, y) {
+    var key = z + '/' + x + '/' + y;
+    if (!tiles[key]) {
+      var url = config.tilesUrl.replace('{z}', z).replace('{x}', x).replace('{y}', y);
+      tiles[key] = fetch(url).then(function (resp) { return resp.json(); })
+        .then(function (tile) { return tile.rows; })
+        .catch(function () { delete tiles[key]; return []; });
+    }
+    return tiles[key];
+  }
 
+  function refresh() {
+    var z = Math.max(0, Math.min(Math.round(map.getZoom()), config.maxZoom));
+    var bounds = map.getBounds();
+    if (!config.tilesUrl) {
+      var padded = bounds.pad(0.2);
+      draw(config.levels[z].filter(function (row) { return padded.contains([row[0], row[1]]); }));
+      return;
+    }
+    var n = Math.pow(2, z);
+    var nw = map.project(bounds.getNorthWest(), z).divideBy(256).floor();
+    var se = map.project(bounds.getSouthEast(), z).divideBy(256).floor();
+    var requests = [];
+    for (var x = Math.max(nw.x, 0); x <= Math.min(se.x, n - 1); x++) {
+      for (var y = Math.max(nw.y, 0); y <= Math.min(se.y, n - 1); y++) {
+        requests.push(fetchTile(z, x, y));
+      }
+    }
+    var current = ++generation;
+    Promise.all(requests).then(function (results) {
+      if (current === generation) {
+        draw([].concat.apply([], results));
+      }
+    });
+  }
 
-def generate_risk_map(df, output_html):
-    gdf = gpd.GeoDataFrame(
-        df.copy(),
-        geometry=gpd.points_from_xy(df["lon"], df["lat"]),
-        crs="EPSG:4326",
-    )
-    center_lat = gdf["lat"].mean()
-    center_lon = gdf["lon"].mean()
+  map.on('moveend', refresh);
+  refresh();
+})();
+"""
+
+
+def _embedded_levels(pyramid, max_zoom):
+    # Stop once every cluster is a single point (deeper levels are identical)
+    # or the next level would outgrow the embedded budget.
+    levels = [pyramid.level_rows(0)]
+    for z in range(1, max_zoom + 1):
+        _, clusters = pyramid.level(z)
+        if len(clusters) > MAX_EMBED_CLUSTERS:
+            break
+        levels.append(pyramid.level_rows(z))
+        if len(clusters) == len(pyramid):
+            break
+    return {"columns": CLUSTER_COLUMNS, "levels": levels}
+
+
+@timed("render_risk_map")
+def render_risk_map(df, tiles_url=None, max_zoom=MAX_EMBED_ZOOM):
+    # A small Leaflet shell that draws zoom-level clusters. With ``tiles_url``
+    # (e.g. "/api/tiles/{z}/{x}/{y}") clusters are fetched per visible tile;
+    # otherwise the cluster levels are embedded in the page.
+    center_lat = df["lat"].mean()
+    center_lon = df["lon"].mean()
 
     fmap = folium.Map(location=[center_lat, center_lon], zoom_start=5, tiles="CartoDB positron")
 
-    for _, row in gdf.iterrows():
-        folium.CircleMarker(
-            location=[row["lat"], row["lon"]],
-            radius=6,
-            color=_risk_color(row["risk_score"]),
-            fill=True,
-            fill_opacity=0.7,
-            popup=f"Risk: {row['risk_score']:.1f}",
-        ).add_to(fmap)
-
-    fmap.save(output_html)
+    if tiles_url:
+        config = {"tilesUrl": tiles_url, "maxZoom": MAX_TILE_ZOOM}
+    else:
+        pyramid = ClusterPyramid(df["lat"], df["lon"], df["risk_score"])
+        config = _embedded_levels(pyramid, max_zoom)
+        config["maxZoom"] = len(config["levels"]) - 1
+
+    script = _SHELL_SCRIPT % {
+        "map": fmap.get_name(),
+        "config": json.dumps(config, separators=(",", ":")),
+    }
+    fmap.get_root().script.add_child(folium.Element(script))
+    return fmap.get_root().render()
+
+
+def generate_risk_map(df, output_html, tiles_url=None, max_zoom=MAX_EMBED_ZOOM):
+    html = render_risk_map(df, tiles_url=tiles_url, max_zoom=max_zoom)
+    with open(output_html, "w", encoding="utf-8") as handle:
+        handle.write(html)
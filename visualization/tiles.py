@@ -0,0 +1,132 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.instrumentation import timed
+
+
+TILE_SIZE = 256
+CLUSTER_PX = 32
+CELLS_PER_TILE = TILE_SIZE // CLUSTER_PX
+MAX_TILE_ZOOM = 18
+TILE_CACHE_SIZE = 512
+LEVEL_CACHE_SIZE = 8
+CLUSTER_COLUMNS = ["lat", "lon", "count", "mean_risk", "max_risk"]
+_MAX_MERCATOR_LAT = 85.05112878
+_CELL_BITS = 2 * int(np.log2(CELLS_PER_TILE))
+
+
+def mercator_xy(lats, lons):
+    # Web Mercator position in [0, 1) x [0, 1), origin at the top-left.
+    lats = np.clip(np.asarray(lats, dtype=float), -_MAX_MERCATOR_LAT, _MAX_MERCATOR_LAT)
+    lons = np.asarray(lons, dtype=float)
+    x = (lons + 180.0) / 360.0
+    phi = np.radians(lats)
+    y = 0.5 - np.log(np.tan(np.pi / 4.0 + phi / 2.0)) / (2.0 * np.pi)
+    limit = np.nextafter(1.0, 0.0)
+    return np.clip(x, 0.0, limit), np.clip(y, 0.0, limit)
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+class ClusterPyramid:
+    # Points aggregated into CLUSTER_PX screen-pixel cells per zoom level.
+    # Each level is sorted by (tile, cell) so a tile is one searchsorted range;
+    # levels are built on first use, the LEVEL_CACHE_SIZE most recent kept.
+    def __init__(self, lats, lons, scores):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.scores = np.asarray(scores, dtype=float)
+        self.x, self.y = mercator_xy(self.lats, self.lons)
+        self._levels = OrderedDict()
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lats)
+
+    @timed("tiles.build_level")
+    def _build_level(self, z):
+        cells = 2 ** z * CELLS_PER_TILE
+        gx = (self.x * cells).astype(np.int64)
+        gy = (self.y * cells).astype(np.int64)
+        tile_keys = (gy // CELLS_PER_TILE) * (2 ** z) + gx // CELLS_PER_TILE
+        cell_keys = (gy % CELLS_PER_TILE) * CELLS_PER_TILE + gx % CELLS_PER_TILE
+        keys = (tile_keys << _CELL_BITS) | cell_keys
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        if len(keys) == 0:
+            return keys, np.empty((0, len(CLUSTER_COLUMNS)))
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        clusters = np.column_stack([
+            np.add.reduceat(self.lats[order], starts) / counts,
+            np.add.reduceat(self.lons[order], starts) / counts,
+            counts,
+            np.add.reduceat(self.scores[order], starts) / counts,
+            np.maximum.reduceat(self.scores[order], starts),
+        ])
+        return keys[starts], clusters
+
+    def level(self, z):
+        with self._lock:
+            level = self._levels.get(z)
+            if level is None:
+                level = self._build_level(z)
+                self._levels[z] = level
+                while len(self._levels) > LEVEL_CACHE_SIZE:
+                    self._levels.popitem(last=False)
+            else:
+                self._levels.move_to_end(z)
+        return level
+
+    def tile(self, z, x, y):
+        keys, clusters = self.level(z)
+        tile_key = y * (2 ** z) + x
+        lo = np.searchsorted(keys, tile_key << _CELL_BITS, "left")
+        hi = np.searchsorted(keys, (tile_key + 1) << _CELL_BITS, "left")
+        return clusters[lo:hi]
+
+    def tile_json(self, z, x, y):
+        key = (z, x, y)
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+                return cached
+
+        rows = self.tile(z, x, y)
+        body = json.dumps({
+            "z": z,
+            "x": x,
+            "y": y,
+            "columns": CLUSTER_COLUMNS,
+            "rows": _round_rows(rows),
+        }, separators=(",", ":"))
+
+        with self._lock:
+            self._tiles[key] = body
+            while len(self._tiles) > TILE_CACHE_SIZE:
+                self._tiles.popitem(last=False)
+        return body
+
+    def level_rows(self, z):
+        return _round_rows(self.level(z)[1])
+
+
+def _round_rows(rows):
+    if len(rows) == 0:
+        return []
+    rounded = np.column_stack([
+        np.round(rows[:, 0], 5),
+        np.round(rows[:, 1], 5),
+        rows[:, 2],
+        np.round(rows[:, 3], 2),
+        np.round(rows[:, 4], 2),
+    ])
+    return [[lat, lon, int(count), mean, peak] for lat, lon, count, mean, peak in rounded.tolist()]
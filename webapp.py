@@ -1,12 +1,21 @@
+import atexit
 import os
 from datetime import datetime
 
 from flask import Flask, render_template, request
 
-from api.endpoints import api as api_blueprint
-from config.settings import MODEL_PATH
-from predictor.aqua_predictor import AquaSentinelPredictor
-from utils.artifacts import ensure_artifacts
+from api.endpoints import (
+    api as api_blueprint,
+    get_feature_store,
+    get_predictor,
+    get_scoring_predictor,
+)
+from utils.artifacts import ArtifactsNotReady, missing_artifacts, start_artifact_build
+from utils.instrumentation import instrument_app
+from utils.jobs import start_job_workers
+from utils.pipeline import stale_stages
+from utils.prediction_cache import get_prediction_cache
+from utils.points_store import get_points_store
 
 
 APP_TITLE = "Outbreaks"
@@ -20,9 +29,28 @@ def create_app():
         static_folder=os.path.join(os.path.dirname(__file__), "web", "static"),
     )
 
-    ensure_artifacts()
-    predictor = AquaSentinelPredictor(MODEL_PATH)
+    # Load the shared predictor now so a preloading server (gunicorn
+    # --preload) holds it in the master and workers inherit it on fork. On a
+    # fresh install the artifacts are built in a background process instead;
+    # requests get a 503 until they land and the predictor loads on first use.
+    if missing_artifacts():
+        start_artifact_build()
+    else:
+        stale = stale_stages()
+        if stale:
+            print(f"Artifacts are out of date ({', '.join(stale)}); rebuild with python -m utils.artifacts")
+        get_predictor()
+    # Saves the master's (or dev server's) store; gunicorn workers save
+    # theirs in worker_exit (gunicorn.conf.py).
+    feature_store = get_feature_store()
+    if feature_store is not None:
+        atexit.register(feature_store.save)
     app.register_blueprint(api_blueprint, url_prefix="/api")
+    instrument_app(app)
+
+    @app.errorhandler(ArtifactsNotReady)
+    def artifacts_not_ready(exc):
+        return str(exc), 503, {"Retry-After": "10"}
 
     @app.route("/", methods=["GET", "POST"])
     def index():
@@ -34,8 +62,8 @@ def create_app():
         threshold = request.form.get("threshold", "70")
         if request.method == "POST":
             try:
-                score, lower, upper = predictor.predict_with_interval(
-                    float(lat), float(lon), date
+                score, lower, upper = get_prediction_cache().predict_with_interval(
+                    get_scoring_predictor(), float(lat), float(lon), date
                 )
                 if lower is not None and upper is not None:
                     interval = (lower, upper)
@@ -54,10 +82,25 @@ def create_app():
             threshold=threshold,
         )
 
+    @app.route("/map", methods=["GET"])
+    def risk_map():
+        # folium (and pandas) are only needed for this page.
+        import pandas as pd
+
+        from visualization.risk_mapper import render_risk_map
+
+        values = get_points_store().snapshot().values
+        frame = pd.DataFrame({"lat": values["lat"], "lon": values["lon"]})
+        return render_risk_map(frame, tiles_url="/api/tiles/{z}/{x}/{y}")
+
     return app
 
 
 if __name__ == "__main__":
     application = create_app()
+    # Job workers are started by the serving entrypoints, not create_app. The
+    # debug reloader runs this twice; only the serving child starts them.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_job_workers()
     port = int(os.getenv("PORT", "8001"))
     application.run(host="0.0.0.0", port=port, debug=True)